@@ -0,0 +1,446 @@
+"""
+Annotates PGN files offline with a pool of engine processes
+Every position of every game is searched to a fixed depth or node count. The output
+gets an [%eval] comment after every move, the engine's line after inaccuracies, mistakes
+and blunders, and the accuracy of both players in the WhiteAccuracy and BlackAccuracy headers
+
+The input is only skimmed for where each game starts, the workers parse and analyse the
+games themselves, so memory stays bounded for databases of any size and the analysis scales
+with the worker count. Progress is saved to <output>.checkpoint, an interrupted run
+started again with the same arguments carries on after the last written game
+
+Usage: python src/annotator.py <stockfish> <output.pgn> <input.pgn>... [--depth 14 | --nodes 1000000]
+       [--workers N] [--hash 64] [--restart]
+"""
+import argparse
+import io
+import json
+import math
+import os
+import signal
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.engine
+import chess.pgn
+
+from engine.auto_tune import get_core_count
+from engine.uci_engine import UciEngine
+
+
+CHECKPOINT_VERSION = 1
+
+# Every worker runs its engine on one thread, the pool scales with processes instead
+ENGINE_THREADS = 1
+
+# Games handed out per worker ahead of the writer. Finished games wait here until
+# the games before them are written, so this bounds the memory of the run
+GAMES_PER_WORKER = 4
+
+# Seconds between checkpoints and between progress lines
+CHECKPOINT_INTERVAL = 10
+PROGRESS_INTERVAL = 30
+
+# Plies of the engine's line added after a bad move
+VARIATION_PLIES = 8
+
+# Win percentage points a move loses for each judgement, the thresholds of lichess
+JUDGEMENTS = (
+    (15, chess.pgn.NAG_BLUNDER, "Blunder"),
+    (10, chess.pgn.NAG_MISTAKE, "Mistake"),
+    (5, chess.pgn.NAG_DUBIOUS_MOVE, "Inaccuracy")
+)
+
+# Scores above this many centipawns count as won for the accuracy
+WIN_PERCENT_CAP = 1000
+
+# The engine and the open input files of a worker process
+engine = None
+input_files = {}
+
+
+def open_pgn(path):
+    # Binary, so tell() and seek() work with byte offsets. A text mode tell() is an opaque
+    # cookie that can't be compared, subtracted or used to slice the file
+    return open(path, "rb")
+
+
+def decode_pgn(data):
+    # PGN files from the wild come with a BOM, Windows line ends or a stray non UTF-8 byte,
+    # none of them should stop the run
+    return data.decode("utf-8-sig", errors="replace").replace("\r\n", "\n")
+
+
+class PgnLineReader:
+    """
+    Hands the lines of a binary PGN file to python-chess as text
+    and keeps the byte offset of the next line
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.offset = handle.tell()
+
+    def readline(self):
+        line = self.handle.readline()
+        self.offset += len(line)
+        return decode_pgn(line)
+
+
+def win_percent(score, color):
+    """
+    Returns the winning chance of color in percent, as used by the lichess accuracy
+    """
+    cp = score.pov(color).score(mate_score=100000)
+    cp = max(-WIN_PERCENT_CAP, min(WIN_PERCENT_CAP, cp))
+    return 50 + 50 * (2 / (1 + math.exp(-0.00368208 * cp)) - 1)
+
+
+def move_accuracy(win_before, win_after):
+    """
+    Returns the accuracy of a move from the winning chances of its player before and after it
+    """
+    loss = max(0.0, win_before - win_after)
+    return max(0.0, min(100.0, 103.1668 * math.exp(-0.04354 * loss) - 3.1669))
+
+
+def game_accuracy(accuracies):
+    """
+    Returns the accuracy of a player over a game, the average of the mean and the harmonic mean
+    of their moves, so a single blunder weighs more than in a plain mean
+    """
+    if not accuracies:
+        return None
+    return (statistics.mean(accuracies) + statistics.harmonic_mean(accuracies)) / 2
+
+
+def init_worker(path, hash_size):
+    global engine
+    # Ctrl+C is handled by the main process, which saves the checkpoint
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The engine quits on its own when the worker exits and closes its input pipe
+    engine = UciEngine(path, {"Threads": ENGINE_THREADS, "Hash": hash_size})
+
+
+def evaluate(board, moves, fen, limits):
+    """
+    Returns the score of a position from the side to move and the engine's line
+    """
+    if board.is_checkmate():
+        return {"score": chess.engine.PovScore(chess.engine.Mate(0), board.turn), "depth": None, "pv": []}
+    if board.is_game_over():
+        return {"score": chess.engine.PovScore(chess.engine.Cp(0), board.turn), "depth": None, "pv": []}
+    engine.set_position(moves, fen)
+    result = engine.go(**limits)
+    info = result["info"]
+    if "mate" in info:
+        score = chess.engine.PovScore(chess.engine.Mate(info["mate"]), board.turn)
+    elif "cp" in info:
+        score = chess.engine.PovScore(chess.engine.Cp(info["cp"]), board.turn)
+    else:
+        score = None
+    pv = result["lines"][0]["pv"] if result["lines"] else [result["move"]] if result["move"] else []
+    return {"score": score, "depth": info.get("depth"), "pv": pv}
+
+
+def set_eval(node, score, depth):
+    """
+    Adds the [%eval] comment of score to node
+    """
+    if score.relative == chess.engine.Mate(0):
+        # python-chess writes nothing for mate 0, the score of a checkmated side
+        node.comment = f"{node.comment} [%eval #0]".strip()
+    else:
+        node.set_eval(score, depth)
+
+
+def add_variation(node, board, pv):
+    """
+    Adds the engine's line as a variation of node, board is the position of node
+    """
+    board = board.copy(stack=False)
+    for uci in pv[:VARIATION_PLIES]:
+        move = chess.Move.from_uci(uci)
+        if not board.is_legal(move) or node.has_variation(move):
+            break
+        node = node.add_variation(move)
+        board.push(move)
+
+
+def annotate(game, limits):
+    """
+    Searches every position of the main line and annotates the game in place
+    Returns the number of positions searched and the accuracy of both players
+    """
+    engine.new_game()
+    board = game.board()
+    fen = None if board.fen() == chess.STARTING_FEN else board.fen()
+    moves = []
+    accuracies = {chess.WHITE: [], chess.BLACK: []}
+
+    evaluation = evaluate(board, moves, fen, limits)
+    positions = 1
+    for node in game.mainline():
+        before = evaluation
+        board_before = board.copy(stack=False)
+        mover = board.turn
+        board.push(node.move)
+        moves.append(node.move.uci())
+        evaluation = evaluate(board, moves, fen, limits)
+        positions += 1
+
+        if evaluation["score"] is not None:
+            set_eval(node, evaluation["score"], evaluation["depth"])
+        if before["score"] is None or evaluation["score"] is None:
+            continue
+        win_before = win_percent(before["score"], mover)
+        win_after = win_percent(evaluation["score"], mover)
+        accuracies[mover].append(move_accuracy(win_before, win_after))
+
+        best = before["pv"][0] if before["pv"] else None
+        if best is None or best == node.move.uci():
+            continue
+        for threshold, nag, name in JUDGEMENTS:
+            if win_before - win_after >= threshold:
+                node.nags.add(nag)
+                best_san = board_before.san(chess.Move.from_uci(best))
+                node.comment = f"{node.comment} {name}. {best_san} was best.".strip()
+                add_variation(node.parent, board_before, before["pv"])
+                break
+
+    white, black = game_accuracy(accuracies[chess.WHITE]), game_accuracy(accuracies[chess.BLACK])
+    if white is not None:
+        game.headers["WhiteAccuracy"] = f"{white:.1f}"
+    if black is not None:
+        game.headers["BlackAccuracy"] = f"{black:.1f}"
+    limit = f"depth {limits['depth']}" if "depth" in limits else f"{limits['nodes']} nodes"
+    game.headers["Annotator"] = f"{engine.name or 'engine'}, {limit}"
+    return {"positions": positions, "white": white, "black": black}
+
+
+def open_input(path):
+    handle = input_files.get(path)
+    if handle is None:
+        handle = input_files[path] = open_pgn(path)
+    return handle
+
+
+def read_text(path, offset, end_offset):
+    """
+    Returns the text of a game as it is in the input
+    """
+    handle = open_input(path)
+    handle.seek(offset)
+    return decode_pgn(handle.read(end_offset - offset)).strip()
+
+
+def annotate_game(path, offset, end_offset, limits, engine_path, hash_size):
+    """
+    Reads the game between offset and end_offset of path and annotates it, runs in a worker process
+    Returns the annotated PGN and the stats of the game. Games that can't be analysed,
+    with illegal moves or of a variant, are returned as they are in the input
+    """
+    global engine
+    text = read_text(path, offset, end_offset)
+    game = chess.pgn.read_game(io.StringIO(text))
+    stats = {"positions": 0, "white": None, "black": None, "skipped": True}
+    if game.errors or game.headers.get("Variant", "Standard").lower() not in ("standard", "chess", "from position"):
+        return text, stats
+    try:
+        stats.update(annotate(game, limits))
+    except EOFError:
+        # The engine crashed, start a new one for the next game and keep this one as it was
+        engine = UciEngine(engine_path, {"Threads": ENGINE_THREADS, "Hash": hash_size})
+        return text, stats
+    stats["skipped"] = False
+    exporter = chess.pgn.StringExporter(headers=True, variations=True, comments=True)
+    return game.accept(exporter), stats
+
+
+def skim_games(paths, start_file, start_offset):
+    """
+    Yields (file index, byte offset of the game, byte offset after the game) for every game,
+    from start_offset of file start_file on. Only finds where the games are, without parsing them
+    """
+    for index in range(start_file, len(paths)):
+        with open_pgn(paths[index]) as handle:
+            if index == start_file and start_offset:
+                handle.seek(start_offset)
+            reader = PgnLineReader(handle)
+            while True:
+                offset = reader.offset
+                if not chess.pgn.skip_game(reader):
+                    break
+                yield index, offset, reader.offset
+
+
+class BatchAnnotator:
+    """
+    Feeds the games of the input files to the worker pool and writes the
+    annotated games in their input order, with a checkpoint after the written ones
+    """
+
+    def __init__(self, engine_path, inputs, output, limits, workers, hash_size):
+        self.engine_path = engine_path
+        self.inputs = [os.path.abspath(path) for path in inputs]
+        self.output = output
+        self.limits = limits
+        self.workers = workers
+        self.hash_size = hash_size
+        self.checkpoint_path = output + ".checkpoint"
+
+        # Where the last written game ends in the input and the output, and the totals so far
+        self.state = {
+            "version": CHECKPOINT_VERSION,
+            "inputs": self.inputs,
+            "limits": limits,
+            "file": 0,
+            "offset": 0,
+            "output_size": 0,
+            "games": 0,
+            "skipped": 0,
+            "positions": 0,
+            "accuracy_total": 0.0,
+            "accuracy_count": 0
+        }
+        # Sequence number -> (future, file index, offset after the game), in input order
+        self.pending = {}
+        self.next_sequence = 0
+        self.written_sequence = 0
+        self.output_file = None
+        self.started_at = time.monotonic()
+        self.positions_at_start = 0
+        self.last_checkpoint = time.monotonic()
+        self.last_progress = time.monotonic()
+
+    def load_checkpoint(self):
+        """
+        Returns True if a checkpoint of the same run was found and loaded
+        Raises ValueError if the checkpoint belongs to other inputs or limits
+        """
+        try:
+            with open(self.checkpoint_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (state.get("version") != CHECKPOINT_VERSION or state.get("inputs") != self.inputs
+                or state.get("limits") != self.limits):
+            raise ValueError(f"{self.checkpoint_path} is from a run with other inputs or limits, "
+                             f"start over with --restart")
+        self.state = state
+        return True
+
+    def save_checkpoint(self):
+        self.output_file.flush()
+        self.state["output_size"] = self.output_file.tell()
+        # Written to a temporary file first, so an interruption never leaves half a checkpoint
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(temporary_path, self.checkpoint_path)
+        self.last_checkpoint = time.monotonic()
+
+    def write_finished(self, block):
+        """
+        Writes the finished games that are next in input order
+        With block, waits for the next game if it's not done yet
+        """
+        while self.written_sequence in self.pending:
+            future, file_index, end_offset = self.pending[self.written_sequence]
+            if not block and not future.done():
+                break
+            text, stats = future.result()
+            del self.pending[self.written_sequence]
+            self.written_sequence += 1
+            block = False
+
+            self.output_file.write(text + "\n\n")
+            self.state["file"] = file_index
+            self.state["offset"] = end_offset
+            self.state["games"] += 1
+            self.state["skipped"] += stats["skipped"]
+            self.state["positions"] += stats["positions"]
+            for accuracy in (stats["white"], stats["black"]):
+                if accuracy is not None:
+                    self.state["accuracy_total"] += accuracy
+                    self.state["accuracy_count"] += 1
+
+        now = time.monotonic()
+        if now - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.save_checkpoint()
+        if now - self.last_progress >= PROGRESS_INTERVAL:
+            self.print_progress()
+            self.last_progress = now
+
+    def print_progress(self):
+        state = self.state
+        elapsed = time.monotonic() - self.started_at
+        rate = (state["positions"] - self.positions_at_start) / elapsed if elapsed else 0
+        accuracy = state["accuracy_total"] / state["accuracy_count"] if state["accuracy_count"] else 0
+        print(f"{state['games']} games ({state['skipped']} skipped), {state['positions']} positions, "
+              f"{rate:.1f} positions/s, mean accuracy {accuracy:.1f}")
+
+    def run(self):
+        if self.load_checkpoint():
+            print(f"Resuming after game {self.state['games']} from {self.checkpoint_path}")
+            os.truncate(self.output, self.state["output_size"])
+        else:
+            open(self.output, "w").close()
+        self.positions_at_start = self.state["positions"]
+        window = self.workers * GAMES_PER_WORKER
+
+        self.output_file = open(self.output, "a", encoding="utf-8")
+        pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.engine_path, self.hash_size))
+        try:
+            for file_index, offset, end_offset in skim_games(self.inputs, self.state["file"], self.state["offset"]):
+                future = pool.submit(annotate_game, self.inputs[file_index], offset, end_offset, self.limits,
+                                     self.engine_path, self.hash_size)
+                self.pending[self.next_sequence] = (future, file_index, end_offset)
+                self.next_sequence += 1
+                self.write_finished(block=len(self.pending) >= window)
+            while self.pending:
+                self.write_finished(block=True)
+        except KeyboardInterrupt:
+            print("Interrupted, run the same command again to resume")
+            raise
+        finally:
+            # Only the written games are in the checkpoint, the ones in flight are analysed again
+            self.save_checkpoint()
+            self.output_file.close()
+            pool.shutdown(wait=not self.pending, cancel_futures=True)
+
+        os.remove(self.checkpoint_path)
+        self.print_progress()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotates PGN files with a pool of engine processes")
+    parser.add_argument("stockfish", help="path of the engine")
+    parser.add_argument("output", help="annotated PGN file to write")
+    parser.add_argument("inputs", nargs="+", help="PGN files to annotate")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--depth", type=int, help="search depth per position (default 14)")
+    limit.add_argument("--nodes", type=int, help="nodes per position, the same result on any machine")
+    parser.add_argument("--workers", type=int, default=get_core_count(), help="engine processes (default: cores)")
+    parser.add_argument("--hash", type=int, default=64, help="hash of every engine in MB")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    limits = {"nodes": args.nodes} if args.nodes else {"depth": args.depth or 14}
+    annotator = BatchAnnotator(args.stockfish, args.inputs, args.output, limits, max(1, args.workers), args.hash)
+    if args.restart and os.path.exists(annotator.checkpoint_path):
+        os.remove(annotator.checkpoint_path)
+    try:
+        annotator.run()
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Compares the WebDriver round trips and time spent converting moves to
+screen positions with the cached board geometry against the old per-square
+JavaScript calculation
+
+Usage: python src/benchmarks/geometry_benchmark.py [lichess|chesscom] [moves]
+Opens Chrome on the analysis board of the chosen website
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from stockfish_bot import StockfishBot
+
+URLS = {
+    "lichess": "https://lichess.org/analysis",
+    "chesscom": "https://www.chess.com/analysis"
+}
+
+# A few moves, each one is converted like validate_move and make_move do (two squares, twice)
+MOVES = ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6", "b5a4", "g8f6", "e1g1", "f8e7"]
+
+
+class RoundTripCounter:
+    """
+    Counts the execute_script calls made through a WebDriver
+    """
+
+    def __init__(self, chrome):
+        self.count = 0
+        self.execute_script = chrome.execute_script
+        chrome.execute_script = self.counting_execute_script
+
+    def counting_execute_script(self, *args):
+        self.count += 1
+        return self.execute_script(*args)
+
+
+def convert_moves(convert, move_count):
+    for i in range(move_count):
+        move = MOVES[i % len(MOVES)]
+        for _ in range(2):
+            convert(move[0:2])
+            convert(move[2:4])
+
+
+def main():
+    website = sys.argv[1] if len(sys.argv) > 1 else "lichess"
+    move_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    chrome = webdriver.Chrome(service=Service(ChromeDriverManager().install()))
+    try:
+        chrome.get(URLS[website])
+        time.sleep(3)
+
+        bot = StockfishBot(chrome.service.service_url, chrome.session_id, website, None, None, "",
+                           False, False, False, False, False, 100, 20, 15, 512, 1)
+        bot.update_grabber()
+        counter = RoundTripCounter(bot.grabber.chrome)
+
+        results = []
+        for name, convert in (("per-square JS", bot.move_to_screen_pos_js), ("lookup table", bot.move_to_screen_pos)):
+            bot.grabber.invalidate_board_geometry()
+            counter.count = 0
+            start = time.perf_counter()
+            convert_moves(convert, move_count)
+            elapsed = time.perf_counter() - start
+            results.append((name, counter.count, elapsed))
+
+        print(f"{move_count} moves on {website}")
+        for name, round_trips, elapsed in results:
+            print(f"{name:>14}: {round_trips / move_count:6.2f} round trips/move, "
+                  f"{1000 * elapsed / move_count:8.3f} ms/move")
+        print(f"Saved {(results[0][1] - results[1][1]) / move_count:.2f} round trips per move")
+    finally:
+        chrome.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Local stand-in for the Lichess Bot API that replays a recorded NDJSON game stream,
+so the Bot API backend can be tested and benchmarked without lichess.org
+
+The opponent's states are replayed as recorded. When it is the bot's turn the
+stream waits for the bot to post a move, then continues with the next recorded state.
+On exit it prints the time between sending a position and receiving the bot's move
+
+Record a game with "Record grabber trace" in the GUI, which writes traces/<time>.ndjson
+for Bot API games, or with LichessApiGrabber(token, game_id, record_path="game.ndjson")
+
+Usage: python src/benchmarks/lichess_api_server.py [recording] [port] [white|black] [opponent delay in seconds]
+Then start the bot with api_url="http://localhost:<port>"
+"""
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "scholars_mate.ndjson")
+
+# Seconds to wait for the bot's move before the replay gives up
+MOVE_TIMEOUT = 30
+
+
+class Replay:
+    """
+    The recorded game and the moves posted by the bot
+    """
+
+    def __init__(self, path, color, opponent_delay):
+        with open(path) as f:
+            self.events = [json.loads(line) for line in f if line.strip()]
+        game_full = self.events[0]
+        self.game_id = game_full["id"]
+        self.account_id = game_full[color]["id"]
+        self.bot_is_white = color == "white"
+        self.opponent_delay = opponent_delay
+
+        self.posted = threading.Condition()
+        self.posted_moves = []
+        self.latencies = []
+
+    def is_bot_turn(self, event):
+        state = event["state"] if event["type"] == "gameFull" else event
+        ply_count = len(state["moves"].split()) if state["moves"] else 0
+        return state.get("status", "started") == "started" and (ply_count % 2 == 0) == self.bot_is_white
+
+    def wait_for_move(self, move_count):
+        with self.posted:
+            return self.posted.wait_for(lambda: len(self.posted_moves) > move_count, timeout=MOVE_TIMEOUT)
+
+    def post_move(self, move):
+        with self.posted:
+            self.posted_moves.append(move)
+            self.posted.notify_all()
+
+    def print_stats(self):
+        if not self.latencies:
+            print("No moves were posted")
+            return
+        latencies = sorted(self.latencies)
+        print(f"Moves: {len(latencies)}")
+        print(f"Position to move latency: mean {statistics.mean(latencies):.1f} ms, "
+              f"p50 {statistics.median(latencies):.1f} ms, max {latencies[-1]:.1f} ms")
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections, like lichess.org
+    protocol_version = "HTTP/1.1"
+    replay = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def send_event(self, event):
+        data = json.dumps(event).encode() + b"\n"
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        replay = self.replay
+        if self.path == "/api/account":
+            self.send_json({"id": replay.account_id, "username": replay.account_id})
+        elif self.path == "/api/stream/event":
+            self.start_stream()
+            self.send_event({"type": "gameStart", "game": {"gameId": replay.game_id, "id": replay.game_id}})
+            self.end_stream()
+        elif self.path == f"/api/bot/game/stream/{replay.game_id}":
+            self.start_stream()
+            self.replay_game()
+            self.end_stream()
+        else:
+            self.send_json({"error": "Not found"}, 404)
+
+    def replay_game(self):
+        replay = self.replay
+        bot_moves = 0
+        for i, event in enumerate(replay.events):
+            self.send_event(event)
+            if i == len(replay.events) - 1:
+                return
+            if replay.is_bot_turn(event):
+                sent = time.perf_counter()
+                if not replay.wait_for_move(bot_moves):
+                    print("The bot didn't move in time, ending the replay")
+                    return
+                replay.latencies.append((time.perf_counter() - sent) * 1000)
+                bot_moves += 1
+            elif replay.opponent_delay:
+                time.sleep(replay.opponent_delay)
+
+    def do_POST(self):
+        replay = self.replay
+        prefix = f"/api/bot/game/{replay.game_id}/move/"
+        # Requests may have a body, read it so the connection can be reused
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.startswith(prefix):
+            move = self.path[len(prefix):]
+            replay.post_move(move)
+            self.send_json({"ok": True})
+        else:
+            self.send_json({"error": "Not found"}, 404)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_RECORDING
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    color = sys.argv[3] if len(sys.argv) > 3 else "white"
+    opponent_delay = float(sys.argv[4]) if len(sys.argv) > 4 else 0
+
+    ReplayHandler.replay = Replay(path, color, opponent_delay)
+    server = ThreadingHTTPServer(("localhost", port), ReplayHandler)
+    server.daemon_threads = True
+    print(f"Replaying {path} on http://localhost:{port} as {color}, game {ReplayHandler.replay.game_id}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        ReplayHandler.replay.print_stats()
+
+
+if __name__ == "__main__":
+    main()
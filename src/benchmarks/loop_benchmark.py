@@ -0,0 +1,239 @@
+"""
+Plays the bot loop against an in-memory website (FakeGrabber) for thousands of plies
+and reports moves per second, the per-move latency percentiles and the CPU time and
+peak memory of the bot and the engine process, for every scenario of the suite.
+Run it before and after a change to the loop to see what the change did
+
+The latency of a move is the time from the opponent's move landing to our move landing,
+so it includes the page reads, the engine search and the move itself
+
+Usage: python src/benchmarks/loop_benchmark.py <stockfish> [--plies 2000] [--depth 6] [--scenario name]
+       [--opponent random|engine] [--black] [--seed 1]
+"""
+import argparse
+import ctypes
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import multiprocess
+
+from grabbers.fake_grabber import EngineOpponent, FakeGrabber, RandomOpponent
+from log_config import MODULES
+from stockfish_bot import StockfishBot
+
+# Scenario name -> FakeGrabber latency and bot settings
+SCENARIOS = {
+    "no-latency": {"latency": 0, "jitter": 0, "async_loop": False},
+    "dom-latency": {"latency": 0.005, "jitter": 0.01, "async_loop": False},
+    "async-loop": {"latency": 0.005, "jitter": 0.01, "async_loop": True}
+}
+
+# Plies after which a game is stopped and a new one starts
+MAX_GAME_PLIES = 160
+
+# Seconds between two process samples
+SAMPLE_INTERVAL = 0.2
+
+
+def get_process_stats(pid):
+    """
+    Returns (CPU seconds, resident memory in MB) of a process, None for what can't be read
+    """
+    if sys.platform == "win32":
+        class FileTime(ctypes.Structure):
+            _fields_ = [("low", ctypes.c_ulong), ("high", ctypes.c_ulong)]
+
+        class MemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", ctypes.c_ulong),
+                ("PageFaultCount", ctypes.c_ulong),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t)
+            ]
+
+        # PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000 | 0x0010, False, pid)
+        if not handle:
+            return None, None
+        try:
+            creation, exit_time, kernel, user = FileTime(), FileTime(), FileTime(), FileTime()
+            cpu = None
+            if ctypes.windll.kernel32.GetProcessTimes(handle, ctypes.byref(creation), ctypes.byref(exit_time),
+                                                      ctypes.byref(kernel), ctypes.byref(user)):
+                # FILETIME counts 100 ns intervals
+                cpu = sum((t.high << 32 | t.low) for t in (kernel, user)) / 10 ** 7
+            counters = MemoryCounters()
+            counters.cb = ctypes.sizeof(MemoryCounters)
+            rss = None
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                rss = counters.WorkingSetSize / (1024 * 1024)
+            return cpu, rss
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
+
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The process name may contain spaces, the fields after it don't
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as f:
+            rss = next((int(line.split()[1]) / 1024 for line in f if line.startswith("VmRSS:")), None)
+        return cpu, rss
+    except (OSError, ValueError, IndexError):
+        pass
+    if pid == os.getpid():
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # ru_maxrss is the peak, in bytes on macOS and kB elsewhere
+        divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return usage.ru_utime + usage.ru_stime, usage.ru_maxrss / divisor
+    return None, None
+
+
+class ProcessSampler(threading.Thread):
+    """
+    Samples the CPU time and memory of the bot and its engine while the benchmark runs,
+    the engine is gone by the time the bot returns
+    """
+
+    def __init__(self, bot):
+        threading.Thread.__init__(self, daemon=True)
+        self.bot = bot
+        self.stop_event = threading.Event()
+        # Process name -> {"cpu": first and last CPU seconds, "rss": peak MB}
+        self.stats = {}
+
+    def sample(self, name, pid):
+        cpu, rss = get_process_stats(pid)
+        stats = self.stats.setdefault(name, {"cpu": [cpu, cpu], "rss": rss})
+        if cpu is not None:
+            stats["cpu"][1] = cpu
+        if rss is not None and (stats["rss"] is None or rss > stats["rss"]):
+            stats["rss"] = rss
+
+    def run(self):
+        while not self.stop_event.wait(SAMPLE_INTERVAL):
+            self.sample("bot", os.getpid())
+            stockfish = self.bot.stockfish
+            if stockfish is not None and stockfish.process.poll() is None:
+                self.sample("engine", stockfish.process.pid)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.sample("bot", os.getpid())
+
+    def get(self, name):
+        """
+        Returns (CPU seconds used while sampling, peak MB) of a process
+        """
+        stats = self.stats.get(name)
+        if stats is None:
+            return None, None
+        first, last = stats["cpu"]
+        return (last - first if first is not None and last is not None else None), stats["rss"]
+
+
+def drain(pipe, stop_event):
+    # The bot blocks once the pipe is full, so its messages are read while it runs
+    while not stop_event.is_set():
+        if pipe.poll(0.1):
+            pipe.recv()
+
+
+def run_scenario(settings, args):
+    if args.opponent == "engine":
+        opponent = EngineOpponent(args.stockfish, movetime=10)
+    else:
+        opponent = RandomOpponent(args.seed)
+    grabber = FakeGrabber(is_white=not args.black, opponent=opponent, latency=settings["latency"],
+                          jitter=settings["jitter"], games=10 ** 6, max_plies=MAX_GAME_PLIES,
+                          total_plies=args.plies, seed=args.seed)
+
+    gui_pipe, bot_pipe = multiprocess.Pipe()
+    bot = StockfishBot(None, None, "lichess", bot_pipe, None, args.stockfish,
+                       False, True, False, False, False, 100, 20, args.depth, 64, 1,
+                       async_loop=settings["async_loop"], metrics_path="",
+                       log_levels={module: "WARNING" for module in MODULES})
+    # Skips create_grabber, the bot plays on the fake website
+    bot.grabber = grabber
+
+    stop_event = threading.Event()
+    reader = threading.Thread(target=drain, args=(gui_pipe, stop_event), daemon=True)
+    reader.start()
+    sampler = ProcessSampler(bot)
+    sampler.start()
+
+    start = time.perf_counter()
+    bot.run()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    stop_event.set()
+    reader.join()
+
+    latencies = [latency * 1000 for latency in grabber.move_latencies]
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+    return {
+        "moves": len(latencies),
+        "games": grabber.games_played + 1,
+        "moves_per_second": len(latencies) / elapsed,
+        "p50": percentiles[49],
+        "p95": percentiles[94],
+        "p99": percentiles[98],
+        "bot": sampler.get("bot"),
+        "engine": sampler.get("engine"),
+        "stages": bot.metrics.total
+    }
+
+
+def format_value(value, digits=1):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless load benchmark of the bot loop")
+    parser.add_argument("stockfish", help="path of the engine")
+    parser.add_argument("--plies", type=int, default=2000, help="plies per scenario, both sides")
+    parser.add_argument("--depth", type=int, default=6, help="search depth of the bot")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), help="run only this scenario")
+    parser.add_argument("--opponent", choices=("random", "engine"), default="random")
+    parser.add_argument("--black", action="store_true", help="the bot plays black")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the opponent and the latency jitter")
+    args = parser.parse_args()
+
+    names = [args.scenario] if args.scenario else list(SCENARIOS)
+    print(f"{args.plies} plies per scenario, depth {args.depth}, {args.opponent} opponent")
+    print(f"{'scenario':>12} {'moves':>6} {'games':>6} {'moves/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'bot CPU s':>10} {'bot MB':>7} {'engine CPU s':>13} {'engine MB':>10}")
+    results = {}
+    for name in names:
+        result = run_scenario(SCENARIOS[name], args)
+        results[name] = result
+        bot_cpu, bot_rss = result["bot"]
+        engine_cpu, engine_rss = result["engine"]
+        print(f"{name:>12} {result['moves']:>6} {result['games']:>6} {result['moves_per_second']:>8.1f} "
+              f"{result['p50']:>8.1f} {result['p95']:>8.1f} {result['p99']:>8.1f} "
+              f"{format_value(bot_cpu, 2):>10} {format_value(bot_rss):>7} "
+              f"{format_value(engine_cpu, 2):>13} {format_value(engine_rss):>10}")
+
+    # Where the time of a move goes, from the bot's own stage histograms
+    for name, result in results.items():
+        print(f"\n{name} stages (p50 / p95 ms):")
+        for stage, histogram in result["stages"].items():
+            if histogram.count and not stage.startswith("search_"):
+                print(f"{stage:>18}: {histogram.quantile(0.5):8.1f} / {histogram.quantile(0.95):8.1f}")
+
+
+if __name__ == "__main__":
+    main()
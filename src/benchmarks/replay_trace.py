@@ -0,0 +1,83 @@
+"""
+Runs the bot loop against a recorded grabber trace instead of a browser, to profile
+and regression test the loop, the engine sync and the move selection offline
+
+Record a trace with the "Record grabber trace" checkbox (traces/<time>.jsonl.gz).
+The replay waits as long as every recorded call took, divided by the speed,
+speed 0 replays without waiting. Mouseless mode is on, so mouse moves are only
+made if the recorded game made them too
+
+Usage: python src/benchmarks/replay_trace.py <trace> <stockfish> [speed] [depth]
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import multiprocess
+
+from grabbers.trace_grabber import open_trace
+from stockfish_bot import StockfishBot
+
+# Website of the bot for each recorded grabber
+WEBSITES = {
+    "ChesscomGrabber": "chesscom",
+    "LichessGrabber": "lichess",
+    "LichessApiGrabber": "lichess_api"
+}
+
+
+def read_messages(pipe, messages, stop_event):
+    # The bot blocks once the pipe is full, so its messages are read while it runs
+    while not stop_event.is_set():
+        if pipe.poll(0.1):
+            messages.append(pipe.recv())
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    trace_path = sys.argv[1]
+    stockfish_path = sys.argv[2]
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    depth = int(sys.argv[4]) if len(sys.argv) > 4 else 15
+
+    with open_trace(trace_path, "r") as f:
+        header = json.loads(f.readline())
+    website = WEBSITES.get(header.get("grabber"), "lichess")
+
+    gui_pipe, bot_pipe = multiprocess.Pipe()
+    bot = StockfishBot(None, None, website, bot_pipe, None, stockfish_path,
+                       False, True, False, False, False, 100, 20, depth, 512, 1,
+                       metrics_path="", replay_path=trace_path, replay_speed=speed)
+    messages = []
+    stop_event = threading.Event()
+    reader = threading.Thread(target=read_messages, args=(gui_pipe, messages, stop_event), daemon=True)
+    reader.start()
+
+    # Run the loop in this process, so a profiler sees it
+    start = time.perf_counter()
+    bot.run()
+    elapsed = time.perf_counter() - start
+    stop_event.set()
+    reader.join()
+
+    player = bot.grabber.player
+    moves = sum(message.startswith("S_MOVE") for message in messages)
+    print(f"Replayed {player.position} of {len(player.events)} events from {header.get('grabber')} "
+          f"at speed {speed:g} in {elapsed:.2f} s")
+    print(f"Divergences from the recording: {player.divergences}")
+    print(f"Moves seen: {moves}, engine searches: {bot.engine_moves}")
+    for message in messages:
+        if message.startswith("METRICS"):
+            for stage, stats in json.loads(message[7:]).items():
+                print(f"{stage:>18}: n {stats['count']:4}, mean {stats['mean']:9.1f}, "
+                      f"p50 {stats['p50']:9.1f}, p95 {stats['p95']:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBotLoop:
+    """
+    Plays a game with three asyncio tasks that talk through queues
+    The page watcher pushes every new page snapshot, the engine task searches
+    the positions where it is our turn and the move executor plays the results.
+    Browser calls share one worker thread because a Selenium session can only run
+    one command at a time, searches run on a second one, so the page I/O and the
+    engine search overlap. A page change stops the search running on the old position
+    """
+
+    # Seconds between page reads on our turn. The watcher doesn't long-poll then, so the
+    # browser thread is free the moment the move is ready, and a takeback is still seen
+    OUR_TURN_POLL = 0.2
+    # Long-poll timeout of the page watcher on the opponent's turn in seconds
+    THEIR_TURN_POLL = 2
+    # Seconds to wait for a played move to show up before searching the position again
+    MOVE_CONFIRM_TIMEOUT = 2
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.browser = ThreadPoolExecutor(max_workers=1)
+        self.engine = ThreadPoolExecutor(max_workers=1)
+
+        # Created in main(), they belong to the running event loop
+        self.snapshots = None
+        self.best_moves = None
+        self.position_changed = None
+        self.move_played = None
+        self.game_over = None
+
+        # The latest move list seen on the page and the one being searched
+        self.current_moves = None
+        self.latest_snapshot = None
+        self.searching_moves = None
+
+        # Moves that didn't land, counted like the synchronous loop does
+        self.consecutive_failed_moves = 0
+        self.last_attempted_move = None
+        self.repeated_move_count = 0
+
+    def run(self):
+        """
+        Blocks until the game is over
+        """
+        try:
+            asyncio.run(self.main())
+        finally:
+            self.browser.shutdown(wait=False)
+            self.engine.shutdown(wait=False)
+
+    async def main(self):
+        self.snapshots = asyncio.Queue()
+        self.best_moves = asyncio.Queue()
+        self.position_changed = asyncio.Event()
+        self.move_played = asyncio.Event()
+        self.game_over = asyncio.Event()
+
+        tasks = [
+            asyncio.create_task(self.watch_page()),
+            asyncio.create_task(self.search_positions()),
+            asyncio.create_task(self.execute_moves())
+        ]
+        # Stop as soon as the game is over or one of the tasks failed
+        game_over_task = asyncio.create_task(self.game_over.wait())
+        done, _ = await asyncio.wait(tasks + [game_over_task], return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks + [game_over_task]:
+            task.cancel()
+        await asyncio.gather(*tasks, game_over_task, return_exceptions=True)
+
+        # A running search would keep the engine thread busy
+        if self.searching_moves is not None:
+            self.bot.stockfish.stop()
+        for task in done:
+            if task is not game_over_task and task.exception() is not None:
+                raise task.exception()
+
+    async def in_browser(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.browser, func, *args)
+
+    async def in_engine(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.engine, func, *args)
+
+    def is_our_turn(self, snapshot):
+        return snapshot["white_to_move"] == bool(self.bot.is_white)
+
+    async def watch_page(self):
+        """
+        Reads the page and pushes a snapshot whenever the move list changed
+        """
+        while True:
+            # Cleared before the read, so a move played during it still ends the wait below
+            self.move_played.clear()
+            with self.bot.metrics.time("page_read"):
+                snapshot = await self.in_browser(self.bot.grabber.snapshot)
+            if snapshot is None:
+                await asyncio.sleep(0.5)
+                continue
+
+            if snapshot["game_over"] or snapshot["aborted"]:
+                logger.info("Game is over!" if snapshot["game_over"] else "Game aborted detected via DOM check")
+                self.game_over.set()
+                return
+
+            if snapshot["connection_issue"] and await self.in_browser(self.bot.detect_connection_issues):
+                logger.info("Connection issues detected and handled, continuing...")
+                continue
+            if snapshot["geometry_dirty"]:
+                self.bot.grabber.invalidate_board_geometry()
+            if snapshot["is_white"] is not None:
+                self.bot.is_white = snapshot["is_white"]
+            if snapshot["is_puzzles"]:
+                await self.in_browser(self.bot.grabber.click_puzzle_next)
+
+            moves = snapshot["moves"]
+            if moves != self.current_moves:
+                self.current_moves = list(moves)
+                self.latest_snapshot = snapshot
+                self.position_changed.set()
+                # The position changed under the running search, a takeback or a resync
+                if self.searching_moves is not None and self.searching_moves != self.current_moves:
+                    logger.info("Position changed during the search, stopping it")
+                    self.bot.stockfish.stop()
+                await self.snapshots.put(snapshot)
+
+            if self.is_our_turn(snapshot):
+                # A long-poll can't be cancelled, it would hold the browser thread the move needs
+                try:
+                    await asyncio.wait_for(self.move_played.wait(), self.OUR_TURN_POLL)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self.in_browser(self.bot.grabber.wait_for_change, self.THEIR_TURN_POLL)
+
+    async def search_positions(self):
+        """
+        Searches the newest position whenever it is our turn
+        """
+        while True:
+            snapshot = await self.snapshots.get()
+            # Only the newest position matters, older ones are already stale
+            while not self.snapshots.empty():
+                snapshot = self.snapshots.get_nowait()
+
+            moves = snapshot["moves"]
+            if self.bot.is_new_game(moves):
+                logger.info("New game detected, clearing the engine hash")
+                self.bot.send_metrics()
+                await self.in_engine(self.bot.stockfish.new_game)
+            if not self.is_our_turn(snapshot):
+                continue
+
+            turn_started = time.perf_counter()
+            self.searching_moves = list(moves)
+            try:
+                best_move = await self.in_engine(self.bot.get_stockfish_move, None, moves, snapshot["clocks"], False,
+                                                 self.get_search_watcher(moves))
+            finally:
+                self.searching_moves = None
+
+            if moves != self.current_moves:
+                logger.info("Dropping %s, the position changed during the search", best_move)
+                continue
+            if not best_move:
+                logger.info("No valid move found, waiting...")
+                continue
+            await self.best_moves.put((moves, best_move, turn_started))
+            # The arrows need the board geometry, which may be a browser call
+            await self.in_browser(self.bot.show_lines)
+
+    def get_search_watcher(self, moves):
+        """
+        Returns the on_info callback of the search of moves
+        The page watcher's "stop" is lost if the position changed before "go" reached the
+        engine, so the engine thread checks the position again once the first info line arrived
+        """
+        checked = False
+
+        def on_info(info):
+            nonlocal checked
+            if checked:
+                return
+            checked = True
+            if self.current_moves != moves:
+                logger.info("Position changed before the search started, stopping it")
+                self.bot.stockfish.stop()
+        return on_info
+
+    def avoid_repetition(self, best_move):
+        """
+        Returns the move to play, the next best line once best_move was tried too often in a row
+        """
+        if best_move != self.last_attempted_move:
+            self.repeated_move_count = 0
+            self.last_attempted_move = best_move
+            return best_move
+        self.repeated_move_count += 1
+        logger.info("Repeated move attempt %s times: %s", self.repeated_move_count, best_move)
+        if self.repeated_move_count >= self.bot.MAX_REPEATED_MOVES:
+            logger.info("Detected move repetition, trying alternative move...")
+            alt_move = self.bot.get_alternative_move(best_move)
+            if alt_move and alt_move != best_move:
+                logger.info("Using alternative move: %s", alt_move)
+                self.repeated_move_count = 0
+                self.last_attempted_move = alt_move
+                return alt_move
+        return best_move
+
+    async def execute_moves(self):
+        """
+        Plays the search results that still belong to the current position
+        """
+        while True:
+            moves, best_move, turn_started = await self.best_moves.get()
+            if moves != self.current_moves:
+                continue
+
+            logger.info("Best move: %s", best_move)
+            best_move = self.avoid_repetition(best_move)
+            self.position_changed.clear()
+            await self.in_browser(self.bot.play_move, best_move)
+            self.move_played.set()
+            await self.in_engine(self.bot.start_pondering, best_move)
+
+            # If the move didn't land, search the position again, it is answered from the cache
+            try:
+                with self.bot.metrics.time("move_confirmation"):
+                    await asyncio.wait_for(self.position_changed.wait(), self.MOVE_CONFIRM_TIMEOUT)
+                self.consecutive_failed_moves = 0
+                self.bot.metrics.observe_move(turn_started)
+            except asyncio.TimeoutError:
+                if moves != self.current_moves:
+                    continue
+                self.consecutive_failed_moves += 1
+                logger.warning("Move may have failed. Consecutive failures: %s", self.consecutive_failed_moves)
+                if self.consecutive_failed_moves >= self.bot.MAX_FAILED_MOVES:
+                    logger.warning("Too many failed moves. Checking if we can continue...")
+                    if not await self.in_browser(self.bot.recover_from_failed_moves):
+                        # Ends the game like the synchronous loop does
+                        return
+                    self.consecutive_failed_moves = 0
+                await self.snapshots.put(self.latest_snapshot)
@@ -0,0 +1,352 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import chess
+
+logger = logging.getLogger(__name__)
+
+
+# One analysis record: Zobrist key, node count, score, encoded best move, depth, flags
+RECORD = struct.Struct("<QQiHBB")
+KEY = struct.Struct("<Q")
+
+# Index files start with a magic value and the log offset they include records up to
+HEADER = struct.Struct("<8sQ")
+MAGIC = b"CHSIDX01"
+
+# Set in the flags byte if the score is a mate distance instead of centipawns
+FLAG_MATE = 1
+
+# A merge lock older than this many seconds was left behind by a crashed process
+STALE_LOCK_SECONDS = 120
+
+PROMOTION_PIECES = " nbrq"
+
+
+def encode_move(uci):
+    """
+    Packs a UCI move into 16 bits: from square, to square and promotion piece
+    """
+    promotion = PROMOTION_PIECES.index(uci[4]) if len(uci) > 4 else 0
+    return (promotion << 12) | (chess.parse_square(uci[2:4]) << 6) | chess.parse_square(uci[0:2])
+
+
+def decode_move(value):
+    uci = chess.square_name(value & 63) + chess.square_name((value >> 6) & 63)
+    promotion = value >> 12
+    return uci + PROMOTION_PIECES[promotion] if promotion else uci
+
+
+def is_better(record, other):
+    # Deeper searches win, then the one that searched more nodes
+    return (record[4], record[1]) > (other[4], other[1])
+
+
+def generation_number(file_name):
+    # Index generations are named index-<time_ns>.bin
+    if file_name is None or not file_name.startswith("index-") or not file_name.endswith(".bin"):
+        return None
+    try:
+        return int(file_name[len("index-"):-len(".bin")])
+    except ValueError:
+        return None
+
+
+class AnalysisStore:
+    """
+    Persistent analysis results shared by every bot process
+    New results are appended as fixed-size records to records.log. A background
+    thread merges them into a sorted index file that every process memory-maps
+    and binary searches, so lookups read straight from the page cache.
+    Index generations are written to new files and published through
+    index.current, because a memory-mapped file can't be replaced on Windows.
+    Merges of all processes are serialized by the merge.lock file
+    """
+
+    def __init__(self, directory, merge_interval=30):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.log_path = os.path.join(directory, "records.log")
+        self.current_path = os.path.join(directory, "index.current")
+        self.lock_path = os.path.join(directory, "merge.lock")
+        self.log_file = open(self.log_path, "ab")
+
+        # Records appended by this process that the mapped index may not contain yet,
+        # dropped once a merged index generation has them
+        self.recent = {}
+
+        self.index_name = None
+        self.index_file = None
+        self.index_map = None
+        self.index_count = 0
+        self.last_index_check = 0
+
+        self.hits = 0
+        self.lock = threading.Lock()
+        self._load_index()
+
+        self.stop_event = threading.Event()
+        self.merge_thread = None
+        if merge_interval:
+            self.merge_thread = threading.Thread(target=self._merge_loop, args=(merge_interval,), daemon=True)
+            self.merge_thread.start()
+
+    def _read_current_name(self):
+        try:
+            with open(self.current_path) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _load_index(self):
+        """
+        Maps the current index generation, if it changed since the last call
+        """
+        name = self._read_current_name()
+        if name == self.index_name:
+            return
+        index_file = None
+        index_map = None
+        count = 0
+        if name is not None:
+            try:
+                index_file = open(os.path.join(self.directory, name), "rb")
+                size = os.fstat(index_file.fileno()).st_size
+                if size > HEADER.size:
+                    index_map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+                    count = (size - HEADER.size) // RECORD.size
+            except OSError as e:
+                logger.warning("Could not open analysis index %s: %s", name, e)
+                if index_file is not None:
+                    index_file.close()
+                return
+
+        with self.lock:
+            old_file, old_map = self.index_file, self.index_map
+            self.index_name = name
+            self.index_file = index_file
+            self.index_map = index_map
+            self.index_count = count
+        if old_map is not None:
+            old_map.close()
+        if old_file is not None:
+            old_file.close()
+        self._trim_recent()
+
+    def _trim_recent(self):
+        # The records the index holds as good or better are only looked up there from now on
+        with self.lock:
+            if self.index_map is None:
+                return
+            for zobrist_key, record in list(self.recent.items()):
+                indexed = self._find_in_index(zobrist_key)
+                if indexed is not None and not is_better(record, indexed):
+                    del self.recent[zobrist_key]
+
+    def _find_in_index(self, zobrist_key):
+        # Binary search over the sorted, memory-mapped records without copying them
+        index_map = self.index_map
+        low, high = 0, self.index_count
+        while low < high:
+            middle = (low + high) // 2
+            key = KEY.unpack_from(index_map, HEADER.size + middle * RECORD.size)[0]
+            if key < zobrist_key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.index_count:
+            record = RECORD.unpack_from(index_map, HEADER.size + low * RECORD.size)
+            if record[0] == zobrist_key:
+                return record
+        return None
+
+    def get(self, zobrist_key, depth):
+        """
+        Returns the stored result if it was searched to at least depth, None otherwise
+        The result is a dict with the keys "depth", "move", "nodes" and "cp" or "mate"
+        """
+        # Pick up index generations merged by other processes, at most once per second
+        now = time.monotonic()
+        if now - self.last_index_check > 1:
+            self.last_index_check = now
+            self._load_index()
+
+        record = self.recent.get(zobrist_key)
+        with self.lock:
+            if self.index_map is not None:
+                indexed = self._find_in_index(zobrist_key)
+                if indexed is not None and (record is None or is_better(indexed, record)):
+                    record = indexed
+
+        if record is None or record[4] < depth:
+            return None
+        self.hits += 1
+        result = {"depth": record[4], "move": decode_move(record[3]), "nodes": record[1]}
+        result["mate" if record[5] & FLAG_MATE else "cp"] = record[2]
+        return result
+
+    def put(self, zobrist_key, depth, move, info):
+        """
+        Appends a search result, info is the last parsed "info" line of the search
+        """
+        if "mate" in info:
+            score, flags = info["mate"], FLAG_MATE
+        else:
+            score, flags = info.get("cp", 0), 0
+        record = (zobrist_key, info.get("nodes", 0), score, encode_move(move), min(depth, 255), flags)
+
+        with self.lock:
+            existing = self.recent.get(zobrist_key)
+            if existing is not None and not is_better(record, existing):
+                return
+            self.recent[zobrist_key] = record
+        self.log_file.write(RECORD.pack(*record))
+        self.log_file.flush()
+
+    def _acquire_merge_lock(self):
+        """
+        Returns True if this process may merge, False while another process is merging
+        """
+        try:
+            os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            pass
+        try:
+            if time.time() - os.path.getmtime(self.lock_path) > STALE_LOCK_SECONDS:
+                os.remove(self.lock_path)
+                logger.warning("Removed a stale analysis store merge lock")
+        except OSError:
+            pass
+        return False
+
+    def _release_merge_lock(self):
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+    def merge(self, compact=False):
+        """
+        Merges the log into a new index generation
+        With compact, the log is emptied afterwards, only do this while no bot is running
+        Returns the number of records in the new index, or None if another process is merging
+        """
+        if not self._acquire_merge_lock():
+            return None
+        try:
+            return self._merge(compact)
+        finally:
+            self._release_merge_lock()
+
+    def _merge(self, compact):
+        self._load_index()
+        records = {}
+        log_offset = 0
+        with self.lock:
+            if self.index_map is not None:
+                log_offset = HEADER.unpack_from(self.index_map, 0)[1]
+                for i in range(self.index_count):
+                    record = RECORD.unpack_from(self.index_map, HEADER.size + i * RECORD.size)
+                    records[record[0]] = record
+
+        with open(self.log_path, "rb") as log_file:
+            log_file.seek(0, os.SEEK_END)
+            log_size = log_file.tell()
+            if log_offset > log_size:
+                # The log was compacted by another process
+                log_offset = 0
+            if log_offset == log_size and not compact:
+                return len(records)
+            log_file.seek(log_offset)
+            data = log_file.read(log_size - log_offset)
+        # Ignore a partially written record at the end, the next merge picks it up
+        complete_size = len(data) - len(data) % RECORD.size
+        for record in RECORD.iter_unpack(data[:complete_size]):
+            existing = records.get(record[0])
+            if existing is None or is_better(record, existing):
+                records[record[0]] = record
+        log_offset += complete_size
+
+        if compact:
+            self.log_file.close()
+            open(self.log_path, "wb").close()
+            self.log_file = open(self.log_path, "ab")
+            log_offset = 0
+
+        # Write the new generation, then publish it
+        name = f"index-{time.time_ns()}.bin"
+        with open(os.path.join(self.directory, name), "wb") as index_file:
+            index_file.write(HEADER.pack(MAGIC, log_offset))
+            for key in sorted(records):
+                index_file.write(RECORD.pack(*records[key]))
+        temp_path = f"{self.current_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(name)
+        for attempt in range(10):
+            try:
+                os.replace(temp_path, self.current_path)
+                break
+            except PermissionError:
+                # index.current is being read by another process on Windows
+                if attempt == 9:
+                    raise
+                time.sleep(0.05)
+
+        self._load_index()
+        self._remove_old_generations()
+        return len(records)
+
+    def _remove_old_generations(self):
+        # Only generations older than the published one, newer ones may be about to be published
+        published = generation_number(self.index_name)
+        if published is None:
+            return
+        for file_name in os.listdir(self.directory):
+            generation = generation_number(file_name)
+            if generation is not None and generation < published:
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    # Still mapped by another process, a later merge removes it
+                    pass
+
+    def _merge_loop(self, interval):
+        while not self.stop_event.wait(interval):
+            try:
+                self.merge()
+            except Exception as e:
+                logger.warning("Error merging analysis store: %s", e)
+
+    def close(self):
+        self.stop_event.set()
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+        self.log_file.close()
+        with self.lock:
+            if self.index_map is not None:
+                self.index_map.close()
+            if self.index_file is not None:
+                self.index_file.close()
+            self.index_map = None
+            self.index_file = None
+
+
+if __name__ == "__main__":
+    # Usage: python src/engine/analysis_store.py compact [directory]
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        print("Usage: python src/engine/analysis_store.py compact [directory]")
+        print("Merges all records into a fresh index and empties the log. Stop all bots first.")
+        sys.exit(1)
+    store = AnalysisStore(sys.argv[2] if len(sys.argv) > 2 else "analysis", merge_interval=0)
+    count = store.merge(compact=True)
+    store.close()
+    if count is None:
+        print("Another process is merging the analysis store, try again once it is done.")
+        sys.exit(1)
+    print(f"Compacted analysis store: {count} positions")
@@ -0,0 +1,240 @@
+import ctypes
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from engine.uci_engine import UciEngine
+
+
+# Tuned settings of every engine binary, keyed by its absolute path
+RESULTS_PATH = "auto_tune.json"
+
+# Positions of the time-to-depth sweep: an opening, a sharp middlegame and an endgame
+SWEEP_POSITIONS = [
+    "rnbqkb1r/pp2pppp/3p1n2/8/3NP3/8/PPP2PPP/RNBQKB1R w KQkq - 1 5",
+    "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP1B1PPP/R2QKB1R w KQ - 0 9",
+    "8/5pk1/6p1/p1r4p/P6P/2R3P1/5PK1/8 w - - 0 40"
+]
+SWEEP_DEPTH = 16
+
+# Depth of the bench runs, the default of 13 takes several seconds per thread count
+BENCH_DEPTH = 10
+
+# A larger setting has to be this much faster than a smaller one to be picked,
+# otherwise the measurement noise would decide
+MIN_GAIN = 1.05
+
+# Smallest and largest hash table tried, in MB
+MIN_HASH = 64
+MAX_HASH = 4096
+
+
+def get_core_count():
+    return os.cpu_count() or 1
+
+
+def get_free_memory():
+    """
+    Returns the memory available to new processes in MB, or None if it can't be read
+    """
+    if sys.platform == "win32":
+        class MemoryStatusEx(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong)
+            ]
+
+        status = MemoryStatusEx()
+        status.dwLength = ctypes.sizeof(MemoryStatusEx)
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return None
+        return status.ullAvailPhys // (1024 * 1024)
+
+    # MemAvailable counts the page cache that can be dropped, unlike the free pages
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_thread_candidates(cores):
+    """
+    Powers of two up to the core count, one core is left for the browser
+    """
+    max_threads = max(1, cores - 1)
+    candidates = []
+    threads = 1
+    while threads < max_threads:
+        candidates.append(threads)
+        threads *= 2
+    candidates.append(max_threads)
+    return candidates
+
+
+def get_hash_candidates(free_memory):
+    """
+    Powers of two from MIN_HASH up to half of the free memory
+    """
+    limit = min(MAX_HASH, free_memory // 2) if free_memory else 512
+    candidates = []
+    hash_size = MIN_HASH
+    while hash_size <= limit:
+        candidates.append(hash_size)
+        hash_size *= 2
+    return candidates or [max(16, limit)]
+
+
+def run_bench(path, threads, hash_size=16, depth=BENCH_DEPTH):
+    """
+    Runs the engine's built-in "bench" command and returns its nodes per second, or None
+    Stockfish prints the bench summary on stderr, so both streams are searched
+    """
+    try:
+        completed = subprocess.run(
+            [path, "bench", str(hash_size), str(threads), str(depth)],
+            stdin=subprocess.DEVNULL, capture_output=True, universal_newlines=True, timeout=300
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    match = re.search(r"Nodes/second\s*:\s*(\d+)", completed.stdout + completed.stderr)
+    return int(match.group(1)) if match else None
+
+
+def time_to_depth(path, threads, hash_size):
+    """
+    Returns the seconds the engine needs to search all sweep positions to SWEEP_DEPTH
+    """
+    engine = UciEngine(path, {"Threads": threads, "Hash": hash_size})
+    try:
+        total = 0
+        for fen in SWEEP_POSITIONS:
+            # Every position starts with an empty hash table, like a fresh game
+            engine.new_game()
+            engine.set_position([], fen=fen)
+            start = time.perf_counter()
+            engine.go(depth=SWEEP_DEPTH)
+            total += time.perf_counter() - start
+        return total
+    finally:
+        engine.quit()
+
+
+def pick_fastest(timings):
+    """
+    Returns the smallest setting whose time no larger setting beats by MIN_GAIN
+    timings is a list of (setting, seconds) sorted by setting
+    """
+    best_setting, best_time = timings[0]
+    for setting, seconds in timings[1:]:
+        if seconds * MIN_GAIN < best_time:
+            best_setting, best_time = setting, seconds
+    return best_setting, best_time
+
+
+def _binary_id(path):
+    # A replaced or updated binary has to be tuned again
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def load_settings(path, results_path=RESULTS_PATH):
+    """
+    Returns the stored settings of the engine binary, or None if it wasn't tuned on this machine
+    """
+    try:
+        with open(results_path) as f:
+            results = json.load(f)
+        settings = results[os.path.abspath(path)]
+        if settings["binary"] != _binary_id(path) or settings["cores"] != get_core_count():
+            return None
+        return settings
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_settings(path, settings, results_path=RESULTS_PATH):
+    try:
+        with open(results_path) as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        results = {}
+    results[os.path.abspath(path)] = settings
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def auto_tune(path, results_path=RESULTS_PATH, on_progress=None):
+    """
+    Finds the fastest Threads and Hash for the engine binary on this machine and stores them
+    bench measures how the node rate scales with the threads, thread counts that add
+    no speed (ex. hyper-threads) are dropped. The remaining ones are timed to a fixed
+    depth, then the hash sizes are timed with the fastest thread count
+    """
+    def progress(message):
+        if on_progress is not None:
+            on_progress(message)
+
+    cores = get_core_count()
+    free_memory = get_free_memory()
+
+    thread_candidates = []
+    bench_nps = {}
+    for threads in get_thread_candidates(cores):
+        progress(f"Bench, {threads} threads")
+        nps = run_bench(path, threads)
+        if nps is None:
+            # Not a Stockfish build with a bench command, time every thread count
+            thread_candidates = get_thread_candidates(cores)
+            break
+        if thread_candidates and nps < bench_nps[thread_candidates[-1]] * MIN_GAIN:
+            break
+        bench_nps[threads] = nps
+        thread_candidates.append(threads)
+
+    hash_candidates = get_hash_candidates(free_memory)
+    # The thread sweep uses a hash size that is large enough for the short searches
+    sweep_hash = hash_candidates[min(1, len(hash_candidates) - 1)]
+    thread_timings = []
+    for threads in thread_candidates:
+        progress(f"Time to depth, {threads} threads")
+        thread_timings.append((threads, time_to_depth(path, threads, sweep_hash)))
+    best_threads, _ = pick_fastest(thread_timings)
+
+    hash_timings = []
+    for hash_size in hash_candidates:
+        if hash_size == sweep_hash:
+            hash_timings.append((hash_size, dict(thread_timings)[best_threads]))
+            continue
+        progress(f"Time to depth, {hash_size} MB hash")
+        hash_timings.append((hash_size, time_to_depth(path, best_threads, hash_size)))
+    best_hash, best_time = pick_fastest(hash_timings)
+
+    settings = {
+        "threads": best_threads,
+        "hash": best_hash,
+        "nps": bench_nps.get(best_threads),
+        "time_to_depth": round(best_time, 3),
+        "cores": cores,
+        "free_memory": free_memory,
+        "binary": _binary_id(path),
+        "tuned_at": int(time.time())
+    }
+    save_settings(path, settings, results_path)
+    return settings
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+
+class EvalCache:
+    """
+    In-process cache of search results with LRU eviction
+    Entries are keyed by the Zobrist key of the position plus the search
+    parameters that change the result (skill level and MultiPV). The search
+    depth is stored with the entry, so a lookup hits whenever an earlier
+    search went at least as deep as the one being asked for. A shallower
+    search of the same position gets the deeper result back, so searching
+    again at a lower depth can't produce another move
+    """
+
+    # Rough size of one entry in bytes (key tuple, entry dict and a short PV)
+    ENTRY_SIZE = 640
+
+    def __init__(self, max_memory_mb=16):
+        self.max_entries = max(1, int(max_memory_mb * 1024 * 1024) // self.ENTRY_SIZE)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, zobrist_key, depth, skill_level, multipv=1):
+        """
+        Returns the cached entry if it was searched to at least depth, None otherwise
+        An entry is a dict with the keys "depth", "move", "cp" or "mate", "pv" and "lines"
+        """
+        key = (zobrist_key, skill_level, multipv)
+        entry = self.entries.get(key)
+        if entry is None or entry["depth"] < depth:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def get_lines(self, zobrist_key, skill_level, multipv=1):
+        """
+        Returns the ranked lines cached for the position at any depth, without counting a hit or miss
+        """
+        entry = self.entries.get((zobrist_key, skill_level, multipv))
+        return entry["lines"] if entry is not None else []
+
+    def put(self, zobrist_key, depth, skill_level, multipv, move, info, lines=None):
+        """
+        Stores a search result, info is the last parsed "info" line of the search
+        lines are the ranked MultiPV lines of the search
+        A deeper entry for the same position is never replaced by a shallower one
+        """
+        key = (zobrist_key, skill_level, multipv)
+        existing = self.entries.get(key)
+        if existing is not None and existing["depth"] > depth:
+            self.entries.move_to_end(key)
+            return
+
+        entry = {"depth": depth, "move": move, "pv": info.get("pv", [move]), "lines": lines or []}
+        if "mate" in info:
+            entry["mate"] = info["mate"]
+        elif "cp" in info:
+            entry["cp"] = info["cp"]
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self):
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_evictions": self.evictions
+        }
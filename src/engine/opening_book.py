@@ -0,0 +1,47 @@
+import chess.polyglot
+
+
+class OpeningBook:
+    """
+    A Polyglot (.bin) opening book that is asked before the engine
+    chess.polyglot memory-maps the file and finds the entries of a position
+    with a binary search on its Zobrist key, so a lookup costs no search time
+    """
+
+    def __init__(self, path, max_ply=20, weighted=True):
+        # Raises OSError if the file can't be opened
+        self.reader = chess.polyglot.open_reader(path)
+        self.max_ply = max_ply
+        self.weighted = weighted
+        self.hits = 0
+
+    def get_move(self, board, ply):
+        """
+        Returns a book move in UCI format, or None if the position is not in the book
+        or the game is past the maximum book ply
+        Weighted mode picks a move at random according to the entry weights,
+        otherwise the entry with the highest weight is played
+        """
+        if ply >= self.max_ply:
+            return None
+        try:
+            if self.weighted:
+                entry = self.reader.weighted_choice(board)
+            else:
+                entry = self.reader.find(board)
+        except IndexError:
+            return None
+        self.hits += 1
+        return entry.move.uci()
+
+    def get_lines(self, board):
+        """
+        Returns the book moves of the position as ranked lines, highest weight first
+        A line is a dict with the keys "move", "pv", "depth" and "weight"
+        """
+        entries = sorted(self.reader.find_all(board), key=lambda entry: entry.weight, reverse=True)
+        return [{"move": entry.move.uci(), "pv": [entry.move.uci()], "depth": 0, "weight": entry.weight}
+                for entry in entries]
+
+    def close(self):
+        self.reader.close()
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+import chess
+import chess.syzygy
+
+
+class Tablebase:
+    """
+    Syzygy endgame tablebases that are probed before the engine is asked
+    The WDL/DTZ files are opened once, and the ranked moves of every probed
+    position are kept in a bounded LRU cache
+    """
+
+    def __init__(self, directory, max_pieces=5, cache_size=4096):
+        # Raises OSError if the directory can't be read
+        self.tablebase = chess.syzygy.open_tablebase(directory)
+        self.max_pieces = max_pieces
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = 0
+
+    def get_move(self, board, zobrist_key):
+        """
+        Returns the tablebase move in UCI format, or None if the position
+        has too many pieces, still has castling rights or a table is missing
+        """
+        moves = self._get_ranked_moves(board, zobrist_key)
+        if not moves:
+            return None
+        self.hits += 1
+        return moves[0]
+
+    def get_lines(self, board, zobrist_key):
+        """
+        Returns the legal moves as ranked lines, best first, or an empty list if
+        the position can't be probed. A line is a dict with the keys "move", "pv" and "depth"
+        """
+        moves = self._get_ranked_moves(board, zobrist_key) or ()
+        return [{"move": move, "pv": [move], "depth": 0} for move in moves]
+
+    def _get_ranked_moves(self, board, zobrist_key):
+        if chess.popcount(board.occupied) > self.max_pieces or board.castling_rights:
+            return None
+
+        # DTZ depends on the halfmove clock, so it is part of the key
+        key = (zobrist_key, board.halfmove_clock)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        moves = self._probe_ranked_moves(board)
+        self.cache[key] = moves
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return moves
+
+    def _probe_ranked_moves(self, board):
+        """
+        Ranks the moves by their WDL result for the side to move, best first
+        Wins are converted as fast as DTZ allows, losses are dragged out as long as possible
+        Returns None if a table is missing
+        """
+        ranked = []
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    # Better than any win
+                    move_key = (3, 0)
+                else:
+                    # Probes are from the opponent's point of view after our move
+                    wdl = -self.tablebase.probe_wdl(board)
+                    dtz = abs(self.tablebase.probe_dtz(board))
+                    if wdl > 0:
+                        move_key = (wdl, -dtz)
+                    elif wdl < 0:
+                        move_key = (wdl, dtz)
+                    else:
+                        move_key = (wdl, 0)
+            except chess.syzygy.MissingTableError:
+                return None
+            finally:
+                board.pop()
+            ranked.append((move_key, move.uci()))
+
+        # sorted() is stable, so equal moves keep the move generation order
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return tuple(move for _, move in ranked)
+
+    def close(self):
+        self.tablebase.close()
@@ -0,0 +1,44 @@
+class TimeManager:
+    """
+    Turns the clocks from a page snapshot into search limits
+    Engines that still have a "Slow Mover" option budget the time themselves
+    from go wtime/btime/winc/binc. For the others the move time is computed
+    here and scaled by slow_mover the same way
+    """
+
+    # Time kept back for moving the mouse and the round trip to the website, in ms
+    MOVE_OVERHEAD = 300
+    MIN_MOVETIME = 50
+
+    def __init__(self, slow_mover=100, engine_uses_clock=True):
+        self.slow_mover = slow_mover
+        self.engine_uses_clock = engine_uses_clock
+
+    def get_limits(self, clocks, white_to_move, ply):
+        """
+        Returns the keyword arguments for UciEngine.go, or None if the page shows no clock
+        """
+        if not clocks or clocks.get("white") is None or clocks.get("black") is None:
+            return None
+        if self.engine_uses_clock:
+            # "Move Overhead" is set on the engine, so the clocks are passed as they are
+            increment = int((clocks.get("increment") or 0) * 1000)
+            return {"wtime": int(clocks["white"] * 1000), "btime": int(clocks["black"] * 1000),
+                    "winc": increment, "binc": increment}
+        return {"movetime": self.get_movetime(clocks, white_to_move, ply)}
+
+    def get_movetime(self, clocks, white_to_move, ply):
+        """
+        Returns the time to spend on this move in ms, or None if the page shows no clock
+        Also used on a ponder hit, where the engine can't be given the clocks anymore
+        """
+        if not clocks or clocks.get("white") is None or clocks.get("black") is None:
+            return None
+        increment = int((clocks.get("increment") or 0) * 1000)
+        time_left = int(clocks["white" if white_to_move else "black"] * 1000) - self.MOVE_OVERHEAD
+        # Assume the game lasts at least another 10 moves, 40 in the opening
+        moves_to_go = max(10, 40 - ply // 2)
+        movetime = (time_left / moves_to_go + increment * 0.75) * self.slow_mover / 100
+        # Never spend more than a quarter of what is left on one move
+        movetime = min(movetime, time_left / 4)
+        return max(self.MIN_MOVETIME, int(movetime))
@@ -0,0 +1,406 @@
+import subprocess
+import threading
+
+
+# Integer fields of a UCI "info" line that are followed by a single value
+INFO_INT_FIELDS = frozenset((
+    "depth", "seldepth", "multipv", "nodes", "nps", "hashfull",
+    "tbhits", "time", "currmovenumber", "cpuload"
+))
+
+
+def parse_info(line):
+    """
+    Parses a UCI "info" line into a dict in a single pass over its tokens
+    Ex. "info depth 12 score cp 34 nodes 1000 pv e2e4 e7e5"
+        -> {"depth": 12, "cp": 34, "nodes": 1000, "pv": ["e2e4", "e7e5"]}
+    """
+    tokens = line.split()
+    token_count = len(tokens)
+    info = {}
+    i = 1
+    while i < token_count:
+        key = tokens[i]
+        if key in INFO_INT_FIELDS:
+            info[key] = int(tokens[i + 1])
+            i += 2
+        elif key == "score":
+            # "score cp 34" or "score mate -3", optionally followed by a bound
+            info[tokens[i + 1]] = int(tokens[i + 2])
+            i += 3
+            if i < token_count and tokens[i] in ("lowerbound", "upperbound"):
+                info["bound"] = tokens[i]
+                i += 1
+        elif key == "currmove":
+            info["currmove"] = tokens[i + 1]
+            i += 2
+        elif key == "pv":
+            # The principal variation always runs to the end of the line
+            info["pv"] = tokens[i + 1:]
+            break
+        elif key == "string":
+            info["string"] = " ".join(tokens[i + 1:])
+            break
+        else:
+            i += 1
+    return info
+
+
+def score_value(info):
+    """
+    Returns the score of an info line in centipawns, mates count as +-100000 minus the distance
+    """
+    if "mate" in info:
+        mate = info["mate"]
+        return 100000 - mate if mate > 0 else -100000 - mate
+    return info.get("cp", 0)
+
+
+class UciEngine:
+    """
+    A long-lived UCI engine session
+    Keeps one engine process for the whole game, sends a single
+    "position ... moves ..." command per search and only re-sends
+    "setoption" when a value actually changed
+    """
+
+    def __init__(self, path, options=None):
+        # Raises FileNotFoundError / PermissionError if the path is not a usable executable
+        self.process = subprocess.Popen(
+            [path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            bufsize=1
+        )
+        self.write_lock = threading.Lock()
+
+        # Options advertised by the engine and the values we last sent
+        self.available_options = {}
+        self.options = {}
+
+        # The position last sent to the engine, as (fen, moves)
+        self.position = None
+
+        # The running "go ponder" search, read by a background thread. Its stop conditions
+        # are only set on ponderhit, the search runs until then
+        self.ponder_thread = None
+        self.ponder_result = None
+        self.ponder_controls = None
+        self.ponder_timer = None
+        self.controls_lock = threading.Lock()
+
+        # Per-game counters, reset on every "ucinewgame"
+        self.last_searched_position = None
+        self.searches = 0
+        self.warm_searches = 0
+        self.hashfull_total = 0
+        self.search_time_total = 0
+        self.early_stops = 0
+
+        self.name = None
+        self._handshake()
+
+        if options:
+            for name, value in options.items():
+                self.set_option(name, value)
+
+    def _send(self, command):
+        with self.write_lock:
+            self.process.stdin.write(command + "\n")
+            self.process.stdin.flush()
+
+    def _read_line(self):
+        line = self.process.stdout.readline()
+        if line == "":
+            raise EOFError("Engine process terminated unexpectedly")
+        return line.strip()
+
+    def _handshake(self):
+        self._send("uci")
+        while True:
+            line = self._read_line()
+            if line == "uciok":
+                break
+            if line.startswith("id name "):
+                self.name = line[8:]
+            elif line.startswith("option name "):
+                # Ex. "option name Hash type spin default 16 min 1 max 33554432"
+                rest = line[12:]
+                type_index = rest.find(" type ")
+                if type_index == -1:
+                    continue
+                name = rest[:type_index]
+                fields = rest[type_index + 1:].split()
+                default = None
+                if "default" in fields:
+                    default_index = fields.index("default") + 1
+                    default = fields[default_index] if default_index < len(fields) else ""
+                self.available_options[name.lower()] = (name, default)
+        self.is_ready()
+
+    def is_ready(self):
+        self._send("isready")
+        while self._read_line() != "readyok":
+            pass
+
+    def has_option(self, name):
+        return name.lower() in self.available_options
+
+    def set_option(self, name, value):
+        """
+        Sends "setoption" only if the engine knows the option and the value changed
+        Returns True if a command was sent
+        """
+        if not self.has_option(name):
+            return False
+        name = self.available_options[name.lower()][0]
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        value = str(value)
+        if self.options.get(name) == value:
+            return False
+        self._send(f"setoption name {name} value {value}")
+        self.options[name] = value
+        return True
+
+    def new_game(self):
+        """
+        Clears the engine hash table, only call this when a genuinely new game starts
+        """
+        self.stop_ponder()
+        self._send("ucinewgame")
+        self.position = None
+        self.last_searched_position = None
+        self.searches = 0
+        self.warm_searches = 0
+        self.hashfull_total = 0
+        self.search_time_total = 0
+        self.early_stops = 0
+        self.is_ready()
+
+    def _is_warm(self, position):
+        # A search is warm if it continues the previously searched line,
+        # so the hash table still holds the earlier searches of this game
+        if self.last_searched_position is None:
+            return False
+        last_fen, last_moves = self.last_searched_position
+        fen, moves = position
+        return fen == last_fen and moves[:len(last_moves)] == last_moves
+
+    def get_game_stats(self):
+        """
+        Returns the hash table usage counters for the current game
+        Stockfish doesn't report its hash hit rate over UCI, so the share of
+        searches that reused the hash of earlier searches is reported instead
+        """
+        if self.searches == 0:
+            return {"searches": 0}
+        return {
+            "searches": self.searches,
+            "hash_reuse": f"{100 * self.warm_searches // self.searches}%",
+            "hashfull": f"{self.hashfull_total / self.searches / 10:.1f}%",
+            "avg_search_ms": self.search_time_total // self.searches,
+            "early_stops": self.early_stops
+        }
+
+    def set_position(self, moves, fen=None):
+        """
+        Remembers the position to search next
+        The position is only written to the pipe when a search starts
+        """
+        self.position = (fen, list(moves))
+
+    def _position_command(self):
+        fen, moves = self.position if self.position is not None else (None, [])
+        command = f"position fen {fen}" if fen else "position startpos"
+        if moves:
+            command += " moves " + " ".join(moves)
+        return command
+
+    def go(self, depth=None, movetime=None, on_info=None, wtime=None, btime=None, winc=None, binc=None,
+           stable_iterations=None, stable_margin=20, stable_min_depth=8, ponder=False, multipv=None, nodes=None):
+        """
+        Searches the current position and blocks until "bestmove" arrives
+        Times are in milliseconds, with wtime/btime the engine budgets the move time itself
+        With nodes, the search stops after that many nodes, which doesn't depend on the machine load
+        With ponder, "go ponder" is sent and None is returned right away, finish the
+        search with ponder_hit() or stop_ponder(). Only pass a depth with ponder, the
+        time budget and the early stop are given to ponder_hit()
+        With multipv, the engine ranks that many moves in the same search
+        With stable_iterations, "stop" is sent once the best move stayed the same for that many
+        iterations from stable_min_depth on and the score moved by at most stable_margin centipawns.
+        The depth and time limits still apply as a hard cap
+        on_info is called with every parsed "info" line
+        Returns a dict with the best move, the ponder move, the last info line of the main line,
+        the ranked lines and the stop reason ("stable", "depth", "time" or "mate")
+        A line is a dict with the keys "move", "pv", "depth" and "cp" or "mate"
+        """
+        if multipv is not None:
+            self.set_option("MultiPV", multipv)
+        position = self.position if self.position is not None else (None, [])
+        if self._is_warm(position):
+            self.warm_searches += 1
+        self.last_searched_position = position
+        self._send(self._position_command())
+
+        command = "go ponder" if ponder else "go"
+        if depth is not None:
+            command += f" depth {depth}"
+        if movetime is not None:
+            command += f" movetime {movetime}"
+        if nodes is not None:
+            command += f" nodes {nodes}"
+        for name, value in (("wtime", wtime), ("btime", btime), ("winc", winc), ("binc", binc)):
+            if value is not None:
+                command += f" {name} {value}"
+        self._send(command)
+
+        controls = {"depth": depth, "stable_iterations": stable_iterations, "stable_margin": stable_margin,
+                    "stable_min_depth": stable_min_depth, "iterations": [], "stop_reason": None}
+        if ponder:
+            # Keep draining the output while pondering, so the engine never blocks on a full pipe
+            self.ponder_result = None
+            self.ponder_controls = dict(controls, stable_iterations=None)
+            self.ponder_thread = threading.Thread(target=self._read_ponder_search, args=(self.ponder_controls, on_info),
+                                                  daemon=True)
+            self.ponder_thread.start()
+            return None
+        return self._read_search(controls, on_info)
+
+    def _read_ponder_search(self, controls, on_info):
+        try:
+            self.ponder_result = self._read_search(controls, on_info)
+        except EOFError:
+            self.ponder_result = None
+
+    def is_pondering(self):
+        return self.ponder_thread is not None
+
+    def ponder_hit(self, movetime=None, stable_iterations=None, stable_margin=20, stable_min_depth=8):
+        """
+        The expected move was played, the ponder search continues as a normal search
+        The search is stopped after movetime ms from now, at the depth of the ponder
+        search or once the best move is stable, whichever comes first. Without a movetime
+        and a depth the search is stopped right away
+        Blocks until "bestmove" arrives and returns the same dict as go()
+        """
+        with self.controls_lock:
+            self.ponder_controls.update(stable_iterations=stable_iterations, stable_margin=stable_margin,
+                                        stable_min_depth=stable_min_depth)
+        self._send("ponderhit")
+        # The ponder search may already be stable, the next iteration could take long to finish
+        self._check_stable(self.ponder_controls)
+        if movetime is not None or self.ponder_controls["depth"] is None:
+            # The engine has no time limit for a ponder search, so the budget is kept here
+            self.ponder_timer = threading.Timer((movetime or 0) / 1000, self.stop)
+            self.ponder_timer.start()
+        self.ponder_thread.join()
+        self._cancel_ponder_timer()
+        self.ponder_thread = None
+        self.ponder_controls = None
+        return self.ponder_result
+
+    def _cancel_ponder_timer(self):
+        if self.ponder_timer is not None:
+            self.ponder_timer.cancel()
+            self.ponder_timer = None
+
+    def stop_ponder(self):
+        """
+        The opponent played another move, the ponder search is thrown away
+        """
+        if self.ponder_thread is None:
+            return
+        self.stop()
+        self.ponder_thread.join()
+        self._cancel_ponder_timer()
+        self.ponder_thread = None
+        self.ponder_result = None
+        self.ponder_controls = None
+
+    def _read_search(self, controls, on_info):
+        """
+        Reads the engine output of a search until "bestmove"
+        controls holds the depth and the early stop settings, they are read on every
+        line, so a ponder hit can change them while the search runs
+        """
+        last_info = {}
+        # The latest line for every MultiPV rank
+        lines = {}
+        while True:
+            line = self._read_line()
+            if line.startswith("info "):
+                # Skip "info string" and currmove lines, they carry no search result
+                if " pv " not in line and " score " not in line:
+                    continue
+                info = parse_info(line)
+                rank = info.get("multipv", 1)
+                if rank == 1:
+                    last_info = info
+                if info.get("pv"):
+                    ranked_line = {"move": info["pv"][0], "pv": info["pv"], "depth": info.get("depth", 0)}
+                    if "mate" in info:
+                        ranked_line["mate"] = info["mate"]
+                    else:
+                        ranked_line["cp"] = info.get("cp", 0)
+                    lines[rank] = ranked_line
+                if on_info is not None:
+                    on_info(info)
+
+                # An iteration is finished when its exact main line arrives
+                if info.get("pv") and "bound" not in info and rank == 1:
+                    with self.controls_lock:
+                        iterations = controls["iterations"]
+                        if iterations and iterations[-1][0] == info.get("depth"):
+                            iterations.pop()
+                        iterations.append((info.get("depth", 0), info["pv"][0], score_value(info)))
+                    self._check_stable(controls)
+            elif line.startswith("bestmove"):
+                stop_reason = controls["stop_reason"]
+                if stop_reason is None:
+                    if "mate" in last_info:
+                        stop_reason = "mate"
+                    elif controls["depth"] is not None and last_info.get("depth", 0) >= controls["depth"]:
+                        stop_reason = "depth"
+                    else:
+                        stop_reason = "time"
+                self.searches += 1
+                self.hashfull_total += last_info.get("hashfull", 0)
+                self.search_time_total += last_info.get("time", 0)
+                parts = line.split()
+                best_move = parts[1] if len(parts) > 1 and parts[1] != "(none)" else None
+                ponder = parts[3] if len(parts) > 3 and parts[2] == "ponder" else None
+                return {"move": best_move, "ponder": ponder, "info": last_info,
+                        "lines": [lines[rank] for rank in sorted(lines)], "stop_reason": stop_reason}
+
+    def _check_stable(self, controls):
+        """
+        Stops the search once the best move stayed the same for the last stable_iterations
+        iterations from stable_min_depth on and the score moved by at most stable_margin
+        """
+        with self.controls_lock:
+            stable_iterations = controls["stable_iterations"]
+            if not stable_iterations or controls["stop_reason"] is not None:
+                return
+            recent = controls["iterations"][-stable_iterations:]
+            scores = [score for _, _, score in recent]
+            if (len(recent) < stable_iterations or recent[0][0] < controls["stable_min_depth"]
+                    or any(move != recent[0][1] for _, move, _ in recent)
+                    or max(scores) - min(scores) > controls["stable_margin"]):
+                return
+            controls["stop_reason"] = "stable"
+            self.early_stops += 1
+        self.stop()
+
+    def stop(self):
+        self._send("stop")
+
+    def quit(self):
+        try:
+            self.stop_ponder()
+            self._send("quit")
+            self.process.wait(timeout=2)
+        except Exception:
+            self.process.kill()
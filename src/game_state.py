@@ -0,0 +1,94 @@
+import logging
+import re
+
+import chess
+import chess.polyglot
+
+logger = logging.getLogger(__name__)
+
+
+UCI_MOVE_REGEX = re.compile(r'^[a-h][1-8][a-h][1-8][qrbnQRBN]?$')
+
+
+class GameState:
+    """
+    Keeps the website's game as one chess.Board plus its move list
+    Every update only pops the plies that were taken back and pushes the new ones,
+    so a resync costs O(changed plies) instead of replaying the whole game
+    """
+
+    def __init__(self, fen=None):
+        self.reset(fen)
+
+    def reset(self, fen=None, website_moves=None):
+        """
+        Starts over from the initial position, or from fen if given
+        website_moves are the website moves that led to fen, the move lists read
+        after the reset continue them and are applied on top of fen
+        Raises ValueError if fen is invalid, the state is left as it was
+        """
+        board = chess.Board(fen) if fen else chess.Board()
+        self.starting_fen = fen
+        self.board = board
+        self.root_moves = list(website_moves or []) if fen else []
+
+        # One entry per ply: the move as the website shows it, the move in UCI format
+        # and the Zobrist key of the position after it (zobrist_keys[0] is the root position)
+        # The UCI moves and keys only cover the plies played after the root
+        self.website_moves = list(self.root_moves)
+        self.uci_moves = []
+        self.zobrist_keys = [chess.polyglot.zobrist_hash(self.board)]
+
+    def update(self, moves):
+        """
+        Brings the board in line with the move list read from the website
+        Ex. ["e4", "c5", "Nf3"], UCI moves are accepted too
+        Returns (popped plies, pushed plies), or None if a move couldn't be parsed
+        In that case the state stays valid up to the last parsed ply
+        """
+        rewound = 0
+        if self.starting_fen is not None and moves[:len(self.root_moves)] != self.root_moves:
+            # The move list doesn't lead through the FEN root anymore (a new game or a takeback
+            # past the resync), the website move list always starts from the initial position
+            rewound = len(self.website_moves)
+            self.reset()
+
+        # Longest common prefix with what we already have
+        common = 0
+        limit = min(len(moves), len(self.website_moves))
+        while common < limit and moves[common] == self.website_moves[common]:
+            common += 1
+
+        # Pop the rewound plies (takebacks, puzzle retries, new games)
+        popped = len(self.website_moves) - common
+        for _ in range(popped):
+            self.board.pop()
+            self.website_moves.pop()
+            self.uci_moves.pop()
+            self.zobrist_keys.pop()
+
+        # Push only the new plies
+        for move in moves[common:]:
+            try:
+                if UCI_MOVE_REGEX.match(move):
+                    chess_move = self.board.parse_uci(move.lower())
+                else:
+                    chess_move = self.board.parse_san(move)
+            except ValueError:
+                logger.warning("Could not parse move: %s", move)
+                return None
+            self.board.push(chess_move)
+            self.website_moves.append(move)
+            self.uci_moves.append(chess_move.uci())
+            self.zobrist_keys.append(chess.polyglot.zobrist_hash(self.board))
+
+        return rewound + popped, len(moves) - common
+
+    def get_zobrist_key(self):
+        """
+        Returns the Zobrist key of the current position
+        """
+        return self.zobrist_keys[-1]
+
+    def get_ply(self):
+        return len(self.website_moves)
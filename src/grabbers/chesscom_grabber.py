@@ -1,3 +1,4 @@
+import logging
 import re
 import time  # Added for delays
 from selenium.common import NoSuchElementException, StaleElementReferenceException
@@ -7,8 +8,59 @@ from selenium.webdriver.support import expected_conditions as EC
 
 from grabbers.grabber import Grabber
 
+logger = logging.getLogger(__name__)
+
 
 class ChesscomGrabber(Grabber):
+    move_list_selectors = ["wc-simple-move-list", "vertical-move-list", ".move-list", ".vertical-move-list"]
+    move_row_selector = ".move"
+    promotion_dialog_selector = ".promotion-window"
+
+    # Defines readMoveList(), shared by get_move_list() and snapshot()
+    # The game API is asked first, then the move elements. Before the first move element
+    # shows up, the first moves are guessed from the piece positions
+    move_list_script = '''
+        function readMoveList() {
+            try {
+                if (window.chesscom && window.chesscom.gameClient) {
+                    try {
+                        const gameData = window.chesscom.gameClient.getGameData();
+                        if (gameData && gameData.moveList && gameData.moveList.length > 0) {
+                            return gameData.moveList.map(m => m.san);
+                        }
+                    } catch (e) {
+                        console.error("Error accessing game data:", e);
+                    }
+                }
+
+                const moveElements = document.querySelectorAll('.move');
+                if (moveElements.length === 0) {
+                    // Check if any pieces have moved from their starting positions
+                    for (const piece of document.querySelectorAll('.piece')) {
+                        const square = piece.getAttribute('data-square');
+                        if (square === 'e4' && piece.classList.contains('wp')) return ['e4'];
+                        if (square === 'd4' && piece.classList.contains('wp')) return ['d4'];
+                        if (square === 'c4' && piece.classList.contains('wp')) return ['c4'];
+                        if (square === 'e5' && piece.classList.contains('bp')) return ['e4', 'e5'];
+                    }
+                    return [];
+                }
+
+                const extractedMoves = [];
+                for (const moveElement of moveElements) {
+                    for (const side of ['.white', '.black']) {
+                        const move = moveElement.querySelector(side);
+                        if (move && move.textContent.trim() !== '') extractedMoves.push(move.textContent.trim());
+                    }
+                }
+                return extractedMoves;
+            } catch (e) {
+                console.error('Error extracting moves:', e);
+                return null;
+            }
+        }
+    '''
+
     def __init__(self, chrome_url, chrome_session_id):
         super().__init__(chrome_url, chrome_session_id)
         self.tag_name = None
@@ -44,7 +96,7 @@ class ChesscomGrabber(Grabber):
                         if elem.is_displayed() and elem.size["width"] > 200:
                             self._board_elem = elem
                             self.board_size = elem.size["width"]
-                            print(f"Found board via {selector}: {elem.tag_name}, size: {elem.size}")
+                            logger.debug("Found board via %s: %s, size: %s", selector, elem.tag_name, elem.size)
                             return
                 except:
                     continue
@@ -56,7 +108,7 @@ class ChesscomGrabber(Grabber):
                     if elem.is_displayed() and elem.size["width"] > 200:
                         self._board_elem = elem
                         self.board_size = elem.size["width"]
-                        print(f"Found board via XPath: {elem.tag_name}, size: {elem.size}")
+                        logger.debug("Found board via XPath: %s, size: %s", elem.tag_name, elem.size)
                         return
             except:
                 pass
@@ -125,16 +177,16 @@ class ChesscomGrabber(Grabber):
                 if js_board:
                     self._board_elem = js_board
                     self.board_size = js_board.size["width"] if hasattr(js_board, "size") else 400
-                    print(f"Found board via JavaScript: size {self.board_size}")
+                    logger.debug("Found board via JavaScript: size %s", self.board_size)
                     return
             except Exception as e:
-                print(f"JavaScript board detection failed: {e}")
+                logger.warning("JavaScript board detection failed: %s", e)
                 
             # If we got here, we couldn't find the board
-            print("Failed to find chess board element")
+            logger.warning("Failed to find chess board element")
             self._board_elem = None
         except Exception as e:
-            print(f"Error finding board: {e}")
+            logger.warning("Error finding board: %s", e)
             self._board_elem = None
 
     def is_white(self):
@@ -187,13 +239,13 @@ class ChesscomGrabber(Grabber):
             ''')
             
             if result is not None:
-                print(f"Bottom clock is {'white' if result else 'black'} - player is {'white' if result else 'black'}")
+                logger.debug("Bottom clock is %s - player is %s", 'white' if result else 'black', 'white' if result else 'black')
             else:
-                print("Could not determine player color")
+                logger.warning("Could not determine player color")
                 
             return result
         except Exception as e:
-            print(f"Error in is_white: {e}")
+            logger.warning("Error in is_white: %s", e)
             return None
 
     def is_game_over(self):
@@ -210,7 +262,7 @@ class ChesscomGrabber(Grabber):
                 try:
                     element = self.chrome.find_element(By.CSS_SELECTOR, selector)
                     if element and element.is_displayed():
-                        print(f"Game over detected: found {selector}")
+                        logger.info("Game over detected: found %s", selector)
                         return True
                 except NoSuchElementException:
                     continue
@@ -220,7 +272,7 @@ class ChesscomGrabber(Grabber):
                 result_texts = self.chrome.find_elements(By.XPATH, "//*[contains(text(), 'Checkmate') or contains(text(), 'Resignation') or contains(text(), 'Timeout') or contains(text(), 'Draw offered')]")
                 for result in result_texts:
                     if result.is_displayed():
-                        print(f"Game over detected via text: {result.text}")
+                        logger.info("Game over detected via text: %s", result.text)
                         return True
             except:
                 pass
@@ -229,122 +281,122 @@ class ChesscomGrabber(Grabber):
             # If no clear game over indicator is found, assume game is ongoing
             return False
         except Exception as e:
-            print(f"Error checking if game is over: {e}")
+            logger.warning("Error checking if game is over: %s", e)
             return False
 
     def get_move_list(self):
         """
         Improved method to extract the list of moves from Chess.com's move list
+        Uses the same script as snapshot(), so both always agree on the ply count
         """
         try:
-            # First check if there are any moves yet
-            has_moves = self.chrome.execute_script('''
-                return document.querySelectorAll('.move').length > 0;
-            ''')
-            
-            if not has_moves:
-                # Alternative method to detect first move when move elements aren't found
-                try:
-                    first_move = self.chrome.execute_script('''
-                        // Check if any pieces have moved from their starting positions
-                        const pieces = document.querySelectorAll('.piece');
-                        for (const piece of pieces) {
-                            const square = piece.getAttribute('data-square');
-                            if (square) {
-                                // For white's moves (e.g., e4)
-                                if (square === 'e4' && piece.classList.contains('wp')) {
-                                    return ['e4'];
-                                }
-                                // For other common opening moves
-                                if (square === 'd4' && piece.classList.contains('wp')) {
-                                    return ['d4'];
-                                }
-                                if (square === 'c4' && piece.classList.contains('wp')) {
-                                    return ['c4'];
-                                }
-                                if (square === 'e5' && piece.classList.contains('bp')) {
-                                    return ['e4', 'e5'];
-                                }
-                            }
-                        }
-                        
-                        // Check move history object if available
-                        if (window.chesscom && window.chesscom.gameClient) {
-                            try {
-                                const gameData = window.chesscom.gameClient.getGameData();
-                                if (gameData && gameData.moveList && gameData.moveList.length > 0) {
-                                    return gameData.moveList.map(m => m.san);
-                                }
-                            } catch (e) {
-                                console.error("Error accessing game data:", e);
-                            }
-                        }
-                        
-                        return null;
-                    ''')
-                    
-                    if first_move:
-                        print(f"Detected first move(s) via piece positions: {first_move}")
-                        return first_move
-                except Exception as e:
-                    print(f"Error detecting first move: {e}")
-                
-                print("No moves found, treating as a new game or waiting for first move")
-                return []
-            
-            # More reliable method to extract moves from Chess.com
-            moves = self.chrome.execute_script('''
-                try {
-                    // Try different methods to get moves
-                    
-                    // Method 1: Direct API access
-                    if (window.chesscom && window.chesscom.gameClient) {
-                        try {
-                            const gameData = window.chesscom.gameClient.getGameData();
-                            if (gameData && gameData.moveList && gameData.moveList.length > 0) {
-                                return gameData.moveList.map(m => m.san);
-                            }
-                        } catch (e) {
-                            console.error("Error accessing game data:", e);
+            return self.chrome.execute_script(self.move_list_script + "return readMoveList();")
+        except Exception as e:
+            logger.warning("Error in get_move_list: %s", e)
+            return None
+
+    def snapshot(self):
+        """
+        Reads moves, orientation, board rect, clocks and the game state flags in one round trip
+        """
+        try:
+            return self.chrome.execute_script(self.move_list_script + '''
+                function isVisible(elem) {
+                    return elem !== null && elem.offsetParent !== null;
+                }
+
+                function parseClock(elem) {
+                    if (!elem) return null;
+                    const parts = elem.textContent.replace(/[^0-9:.]/g, '').split(':');
+                    let seconds = 0;
+                    for (const part of parts) seconds = seconds * 60 + parseFloat(part || '0');
+                    return seconds;
+                }
+
+                // Like get_move_list(), the page is read again if the move list can't be read
+                const moves = readMoveList();
+                if (moves === null) return null;
+                let increment = null;
+                if (window.chesscom && window.chesscom.gameClient) {
+                    try {
+                        const gameData = window.chesscom.gameClient.getGameData();
+                        // The increment is given in tenths of a second
+                        if (gameData && typeof gameData.timeIncrement1 === 'number') increment = gameData.timeIncrement1 / 10;
+                    } catch (e) {}
+                }
+
+                // Board rect, the same selectors update_board_elem tries
+                let boardRect = null;
+                const boardSelectors = ['.board-layout-chessboard', '.board-render', '.board-play', '.board-container',
+                                        '.board', '.chessboard', '.game-board', '#board-single', '[data-board]'];
+                for (const selector of boardSelectors) {
+                    for (const elem of document.querySelectorAll(selector)) {
+                        const rect = elem.getBoundingClientRect();
+                        if (isVisible(elem) && rect.width > 200) {
+                            boardRect = {x: rect.left + window.scrollX, y: rect.top + window.scrollY,
+                                         width: rect.width, height: rect.height};
+                            break;
                         }
                     }
-                    
-                    // Method 2: Parse move elements
-                    const moveElements = document.querySelectorAll('.move');
-                    console.log('Found ' + moveElements.length + ' move elements in DOM');
-                    
-                    if (moveElements.length === 0) {
-                        return [];
-                    }
-                    
-                    let extractedMoves = [];
-                    
-                    // Process each move element
-                    moveElements.forEach(moveElement => {
-                        // Extract white's move
-                        const whiteMove = moveElement.querySelector('.white');
-                        if (whiteMove && whiteMove.textContent.trim() !== '') {
-                            extractedMoves.push(whiteMove.textContent.trim());
-                        }
-                        
-                        // Extract black's move
-                        const blackMove = moveElement.querySelector('.black');
-                        if (blackMove && blackMove.textContent.trim() !== '') {
-                            extractedMoves.push(blackMove.textContent.trim());
+                    if (boardRect) break;
+                }
+
+                // Orientation, the same checks is_white does
+                let isWhite = null;
+                const layout = document.querySelector('.board-layout-chessboard');
+                const orientation = layout ? layout.getAttribute('data-board-orientation') : null;
+                const bottomClock = document.querySelector('.clock-bottom');
+                if (orientation) {
+                    isWhite = orientation === 'white';
+                } else if (bottomClock && bottomClock.classList.contains('clock-white')) {
+                    isWhite = true;
+                } else if (bottomClock && bottomClock.classList.contains('clock-black')) {
+                    isWhite = false;
+                }
+
+                // Game over modal or result text
+                let gameOver = ['.game-over-modal', '.game-result-component', '.result-wrap', '.game-over-header']
+                    .some(selector => isVisible(document.querySelector(selector)));
+                if (!gameOver) {
+                    const results = document.evaluate(
+                        "//*[contains(text(), 'Checkmate') or contains(text(), 'Resignation') or contains(text(), 'Timeout') or contains(text(), 'Draw offered')]",
+                        document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+                    for (let i = 0; i < results.snapshotLength; i++) {
+                        if (isVisible(results.snapshotItem(i))) {
+                            gameOver = true;
+                            break;
                         }
-                    });
-                    
-                    console.log('Extracted ' + extractedMoves.length + ' moves from DOM elements');
-                    return extractedMoves;
-                } catch (e) {
-                    console.error('Error extracting moves:', e);
-                    return null;
+                    }
                 }
+
+                const url = window.location.href.toLowerCase();
+                const isPuzzles = url.includes('/puzzles/') || url.includes('/puzzle/') || url.includes('/tactics/') ||
+                                  Boolean(window.puzzleControls || window.tacticsControls || window.puzzleId) ||
+                                  document.querySelector('.daily-puzzle, .puzzle-container, .puzzles-container, .tactics-board') !== null;
+
+                const bodyText = document.body.innerText;
+                const connectionIssue = document.querySelector('.icon-offline, .offline-content') !== null ||
+                                        (document.querySelector('.error-code') !== null && bodyText.includes('ERR_'));
+
+                return {
+                    moves: moves,
+                    white_to_move: moves.length % 2 === 0,
+                    is_white: isWhite,
+                    board_rect: boardRect,
+                    game_over: gameOver,
+                    aborted: bodyText.includes('Game Aborted'),
+                    is_puzzles: isPuzzles,
+                    connection_issue: connectionIssue,
+                    geometry_dirty: window.__botGeometryDirty !== false,
+                    clocks: {
+                        white: parseClock(document.querySelector('.clock-white .clock-time, .white-clock, .clock-component.white .time, .clock-white')),
+                        black: parseClock(document.querySelector('.clock-black .clock-time, .black-clock, .clock-component.black .time, .clock-black')),
+                        increment: increment
+                    }
+                };
             ''')
-            
-            return moves
         except Exception as e:
-            print(f"Error in get_move_list: {e}")
+            logger.warning("Error in snapshot: %s", e)
             return None
 
     def is_game_puzzles(self):
@@ -396,7 +448,7 @@ class ChesscomGrabber(Grabber):
                 
             return False
         except Exception as e:
-            print(f"Error checking if game is puzzles: {e}")
+            logger.warning("Error checking if game is puzzles: %s", e)
             return False
 
     def click_puzzle_next(self):
@@ -477,10 +529,10 @@ class ChesscomGrabber(Grabber):
             except:
                 pass
                 
-            print("Could not find next puzzle button")
+            logger.warning("Could not find next puzzle button")
             return False
         except Exception as e:
-            print(f"Error clicking puzzle next: {e}")
+            logger.warning("Error clicking puzzle next: %s", e)
             return False
 
     def get_player_time(self):
@@ -543,7 +595,7 @@ class ChesscomGrabber(Grabber):
                         except:
                             pass
             except Exception as e:
-                print(f"JS time detection failed: {e}")
+                logger.warning("JS time detection failed: %s", e)
             
             # Fallback to traditional method
             clock_selectors = [
@@ -593,7 +645,7 @@ class ChesscomGrabber(Grabber):
                 # Just seconds
                 return float(time_text)
         except Exception as e:
-            print(f"Error getting player time: {e}")
+            logger.warning("Error getting player time: %s", e)
             return None
 
     def make_mouseless_move(self, move_str, pre_move=False):
@@ -700,5 +752,5 @@ class ChesscomGrabber(Grabber):
             
             return result
         except Exception as e:
-            print(f"Error in make_mouseless_move: {e}")
+            logger.warning("Error in make_mouseless_move: %s", e)
             return False
@@ -0,0 +1,66 @@
+from abc import ABC, abstractmethod
+
+
+# Predicates for Grabber.wait_until
+# Each one is called with the grabber and returns a truthy value once the condition holds
+class Condition(ABC):
+    # True if the condition can only change when the move list changes,
+    # then wait_until re-checks it as soon as a move lands instead of polling
+    watches_moves = False
+
+    @abstractmethod
+    def __call__(self, grabber):
+        pass
+
+
+class PlyCountIncreased(Condition):
+    """
+    The move list has more than ply_count moves, ex. after making a move
+    """
+    watches_moves = True
+
+    def __init__(self, ply_count):
+        self.ply_count = ply_count
+
+    def __call__(self, grabber):
+        moves = grabber.get_move_list()
+        return moves is not None and len(moves) > self.ply_count
+
+
+class PromotionDialogVisible(Condition):
+    """
+    The website shows its promotion piece picker
+    """
+
+    def __call__(self, grabber):
+        if not grabber.promotion_dialog_selector:
+            return False
+        return grabber.chrome.execute_script("""
+            const dialog = document.querySelector(arguments[0]);
+            return dialog !== null && dialog.offsetParent !== null;
+        """, grabber.promotion_dialog_selector)
+
+
+class BoardPresent(Condition):
+    """
+    The page finished loading and the board element exists, ex. after a reload
+    """
+
+    def __call__(self, grabber):
+        try:
+            if grabber.chrome.execute_script("return document.readyState") != "complete":
+                return False
+        except Exception:
+            return False
+        grabber.update_board_elem()
+        return grabber.get_board() is not None
+
+
+class ConnectionRestored(Condition):
+    """
+    The page no longer shows a connection problem
+    """
+
+    def __call__(self, grabber):
+        snapshot = grabber.snapshot()
+        return snapshot is not None and not snapshot["connection_issue"]
@@ -0,0 +1,267 @@
+import random
+import threading
+import time
+
+import chess
+
+from engine.uci_engine import UciEngine
+from grabbers.grabber import Grabber
+
+
+class RandomOpponent:
+    """
+    Plays a random legal move
+    """
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def __call__(self, board):
+        return self.random.choice(list(board.legal_moves))
+
+    def close(self):
+        pass
+
+
+class ScriptedOpponent:
+    """
+    Plays the UCI moves of a script, the move of ply n is script[n]
+    Once the script runs out or a move is illegal, the fallback opponent moves instead
+    """
+
+    def __init__(self, script, fallback=None):
+        self.script = script
+        self.fallback = fallback or RandomOpponent()
+
+    def __call__(self, board):
+        ply = len(board.move_stack)
+        if ply < len(self.script):
+            move = chess.Move.from_uci(self.script[ply])
+            if board.is_legal(move):
+                return move
+        return self.fallback(board)
+
+    def close(self):
+        self.fallback.close()
+
+
+class EngineOpponent:
+    """
+    Plays the move of its own engine session, searched for movetime ms
+    """
+
+    def __init__(self, path, movetime=10, options=None):
+        self.engine = UciEngine(path, options)
+        self.movetime = movetime
+
+    def __call__(self, board):
+        if not board.move_stack:
+            self.engine.new_game()
+        self.engine.set_position([move.uci() for move in board.move_stack])
+        move = self.engine.go(movetime=self.movetime)["move"]
+        return chess.Move.from_uci(move) if move else RandomOpponent()(board)
+
+    def close(self):
+        self.engine.quit()
+
+
+class FakeGrabber(Grabber):
+    """
+    An in-memory website backed by a chess.Board, so the bot loop runs without Selenium
+    The opponent answers from a background thread, like a real opponent would.
+    Every page read and move sleeps latency seconds plus up to jitter seconds to stand in
+    for the WebDriver round trip. After a game ends a new one starts in the same "tab",
+    until games games were played or total_plies plies were made, so long benchmarks need only one bot.
+    move_latencies holds the time from our turn starting to our move landing, in seconds
+    """
+
+    # Seconds between the end of a game and the start of the next one
+    NEW_GAME_DELAY = 0.05
+
+    # Screen position of the top left corner of the board and the size of a square
+    BOARD_ORIGIN = (100, 100)
+    SQUARE_SIZE = 64
+
+    def __init__(self, is_white=True, opponent=None, latency=0.0, jitter=0.0, games=1, max_plies=200,
+                 total_plies=None, seed=None):
+        # No browser is attached, so Grabber.__init__ is not called
+        self.chrome = None
+        self._board_elem = "fake-board"
+        self.move_changes_seen = 0
+        self.square_tables = None
+        self.square_size = self.SQUARE_SIZE
+
+        self.player_is_white = is_white
+        self.opponent = opponent or RandomOpponent(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.games_left = games
+        self.max_plies = max_plies
+        self.total_plies = total_plies
+
+        # Game state, guarded by the condition
+        self.changed = threading.Condition()
+        self.version = 0
+        self.version_seen = 0
+        self.board = chess.Board()
+        self.san_moves = []
+        self.over = False
+        self.turn_started = time.perf_counter()
+        self.move_latencies = []
+        self.plies = 0
+        self.games_played = 0
+
+        self.stop_event = threading.Event()
+        self.opponent_thread = threading.Thread(target=self._play_opponent, daemon=True)
+        self.opponent_thread.start()
+
+    def _dom(self):
+        # Stands in for the WebDriver round trip
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _is_our_turn(self):
+        return self.board.turn == (chess.WHITE if self.player_is_white else chess.BLACK)
+
+    def _push(self, move):
+        # Call with the condition held
+        self.san_moves.append(self.board.san(move))
+        self.board.push(move)
+        self.plies += 1
+        if self.total_plies is not None and self.plies >= self.total_plies:
+            self.over = True
+        self.version += 1
+        if self._is_our_turn():
+            self.turn_started = time.perf_counter()
+        self.changed.notify_all()
+
+    def _is_game_finished(self):
+        return self.board.is_game_over() or len(self.san_moves) >= self.max_plies
+
+    def _start_next_game(self):
+        # Call with the condition held
+        self.games_played += 1
+        self.games_left -= 1
+        if self.games_left <= 0:
+            self.over = True
+        else:
+            self.board = chess.Board()
+            self.san_moves = []
+            self.turn_started = time.perf_counter()
+        self.version += 1
+        self.changed.notify_all()
+
+    def _play_opponent(self):
+        while not self.stop_event.is_set():
+            with self.changed:
+                self.changed.wait_for(
+                    lambda: self.stop_event.is_set() or self.over
+                    or self._is_game_finished() or not self._is_our_turn()
+                )
+                if self.stop_event.is_set() or self.over:
+                    return
+                finished = self._is_game_finished()
+                board = self.board.copy()
+            if finished:
+                # Leave the final position on the "page" for a moment, like the website does
+                time.sleep(self.NEW_GAME_DELAY)
+                with self.changed:
+                    self._start_next_game()
+                continue
+            move = self.opponent(board)
+            with self.changed:
+                if self.board.move_stack == board.move_stack:
+                    self._push(move)
+
+    def takeback(self, plies=1):
+        """
+        Takes back the last plies, like an accepted takeback offer
+        """
+        with self.changed:
+            for _ in range(min(plies, len(self.san_moves))):
+                self.board.pop()
+                self.san_moves.pop()
+            self.version += 1
+            if self._is_our_turn():
+                self.turn_started = time.perf_counter()
+            self.changed.notify_all()
+
+    def update_board_elem(self):
+        self._dom()
+
+    def update_board_geometry(self):
+        return True
+
+    def get_square_pos(self, square, is_white):
+        file = chess.FILE_NAMES.index(square[0])
+        rank = int(square[1]) - 1
+        if is_white is False:
+            file, rank = 7 - file, 7 - rank
+        return (self.BOARD_ORIGIN[0] + (file + 0.5) * self.SQUARE_SIZE,
+                self.BOARD_ORIGIN[1] + (7 - rank + 0.5) * self.SQUARE_SIZE)
+
+    def wait_for_change(self, timeout):
+        with self.changed:
+            changed = self.changed.wait_for(lambda: self.version != self.version_seen, timeout=timeout)
+            self.version_seen = self.version
+        return changed
+
+    def is_white(self):
+        self._dom()
+        return self.player_is_white
+
+    def is_game_over(self):
+        self._dom()
+        return self.over
+
+    def get_move_list(self):
+        self._dom()
+        with self.changed:
+            return list(self.san_moves)
+
+    def snapshot(self):
+        self._dom()
+        with self.changed:
+            return {
+                "moves": list(self.san_moves),
+                "white_to_move": self.board.turn == chess.WHITE,
+                "is_white": self.player_is_white,
+                "board_rect": {"x": self.BOARD_ORIGIN[0], "y": self.BOARD_ORIGIN[1],
+                               "width": 8 * self.SQUARE_SIZE, "height": 8 * self.SQUARE_SIZE},
+                "game_over": self.over,
+                "aborted": False,
+                "is_puzzles": False,
+                "connection_issue": False,
+                "clocks": {"white": None, "black": None, "increment": None},
+                "geometry_dirty": False
+            }
+
+    def is_game_puzzles(self):
+        return False
+
+    def click_puzzle_next(self):
+        pass
+
+    def make_mouseless_move(self, move, move_count=0, pre_move=False):
+        self._dom()
+        with self.changed:
+            try:
+                parsed = chess.Move.from_uci(move)
+            except ValueError:
+                return False
+            if self.over or not self._is_our_turn() or not self.board.is_legal(parsed):
+                return False
+            self.move_latencies.append(time.perf_counter() - self.turn_started)
+            self._push(parsed)
+        return True
+
+    def make_direct_dom_move(self, move):
+        return self.make_mouseless_move(move)
+
+    def close(self):
+        self.stop_event.set()
+        with self.changed:
+            self.changed.notify_all()
+        self.opponent.close()
@@ -1,14 +1,40 @@
+import logging
+import time
 from abc import ABC, abstractmethod
 
 from utilities import attach_to_session
 
+logger = logging.getLogger(__name__)
+
 
 # Base abstract class for different chess sites
 class Grabber(ABC):
+    # CSS selectors of the element holding the move list, tried in order
+    # The first match gets a MutationObserver (see wait_for_change)
+    move_list_selectors = []
+
+    # If none of the selectors match, the parent of the first element
+    # matching this selector is observed instead
+    move_row_selector = None
+
+    # CSS selector of the promotion piece picker
+    promotion_dialog_selector = None
+
+    # Longest interval between two checks of wait_until, in seconds
+    MAX_POLL_INTERVAL = 0.5
+
     def __init__(self, chrome_url, chrome_session_id):
         self.chrome = attach_to_session(chrome_url, chrome_session_id)
         self._board_elem = None
 
+        # Number of move list mutations seen by the last wait_for_change call
+        self.move_changes_seen = 0
+
+        # Square -> screen position lookup tables, keyed by orientation (True for white)
+        # Built once by update_board_geometry and dropped when the page reports a resize/scroll
+        self.square_tables = None
+        self.square_size = None
+
     def get_board(self):
         return self._board_elem
 
@@ -18,6 +44,172 @@ class Grabber(ABC):
         canvas_y_offset = self.chrome.execute_script("return window.screenY + (window.outerHeight - window.innerHeight) - window.scrollY;")
         return canvas_x_offset, canvas_y_offset
 
+    # Reads the board rect, window offset and device pixel ratio in one script
+    # and builds the square -> screen position tables for both orientations
+    # Also installs the resize/scroll listener that sets the page's geometry dirty flag,
+    # which snapshot() reports as "geometry_dirty"
+    # Returns True on success
+    def update_board_geometry(self):
+        try:
+            geometry = self.chrome.execute_script("""
+                const board = arguments[0] || document.querySelector('.board-layout-chessboard, .board, .cg-wrap');
+                if (!board) return null;
+                if (!window.__botGeometryListener) {
+                    const markDirty = () => { window.__botGeometryDirty = true; };
+                    window.addEventListener('resize', markDirty, {passive: true});
+                    window.addEventListener('scroll', markDirty, {passive: true});
+                    window.__botGeometryListener = true;
+                }
+                window.__botGeometryDirty = false;
+                const rect = board.getBoundingClientRect();
+                return {
+                    left: rect.left,
+                    top: rect.top,
+                    width: rect.width,
+                    height: rect.height,
+                    window_x: window.screenX + (window.outerWidth - window.innerWidth) / 2,
+                    window_y: window.screenY + (window.outerHeight - window.innerHeight),
+                    dpr: window.devicePixelRatio || 1
+                };
+            """, self._board_elem)
+        except Exception as e:
+            logger.warning("Error reading board geometry: %s", e)
+            geometry = None
+
+        if not geometry or geometry["width"] == 0:
+            self.square_tables = None
+            return False
+
+        dpr = geometry["dpr"]
+        square_size = min(geometry["width"], geometry["height"]) / 8
+        origin_x = geometry["window_x"] + geometry["left"]
+        origin_y = geometry["window_y"] + geometry["top"]
+
+        white_table = {}
+        black_table = {}
+        for file in range(8):
+            for rank in range(8):
+                square = "abcdefgh"[file] + str(rank + 1)
+                # White - a1 is at bottom left, black - a1 is at top right
+                white_table[square] = (
+                    (origin_x + (file + 0.5) * square_size) * dpr,
+                    (origin_y + (7 - rank + 0.5) * square_size) * dpr
+                )
+                black_table[square] = (
+                    (origin_x + (7 - file + 0.5) * square_size) * dpr,
+                    (origin_y + (rank + 0.5) * square_size) * dpr
+                )
+
+        self.square_tables = {True: white_table, False: black_table}
+        self.square_size = square_size * dpr
+        return True
+
+    # Drops the lookup tables, they are rebuilt on the next get_square_pos call
+    def invalidate_board_geometry(self):
+        self.square_tables = None
+
+    # Returns the screen position of the center of a square, Ex. "e4"
+    # Only the first call after an invalidation costs a script round trip
+    def get_square_pos(self, square, is_white):
+        if self.square_tables is None and not self.update_board_geometry():
+            return None
+        return self.square_tables[is_white is not False].get(square)
+
+    # Blocks until the move list changes or the timeout (in seconds) passes
+    # A MutationObserver installed on the move list buffers changes in the page,
+    # and a single async script returns as soon as a change lands
+    # Returns True if the move list changed, False on timeout
+    def wait_for_change(self, timeout):
+        # Stay below Selenium's default 30 second script timeout
+        timeout = min(timeout, 25)
+        try:
+            changes = self.chrome.execute_async_script("""
+                const selectors = arguments[0];
+                const rowSelector = arguments[1];
+                const seen = arguments[2];
+                const timeoutMs = arguments[3];
+                const callback = arguments[arguments.length - 1];
+
+                // (Re)install the observer if the page was reloaded or the move list was replaced
+                const state = window.__botMoveObserver;
+                if (!state || !document.contains(state.target)) {
+                    let target = null;
+                    for (const selector of selectors) {
+                        target = document.querySelector(selector);
+                        if (target) break;
+                    }
+                    if (!target && rowSelector) {
+                        const row = document.querySelector(rowSelector);
+                        if (row) target = row.parentElement;
+                    }
+                    if (!target) {
+                        callback(null);
+                        return;
+                    }
+                    if (state) state.observer.disconnect();
+                    window.__botMoveChanges = window.__botMoveChanges || 0;
+                    const observer = new MutationObserver(() => {
+                        window.__botMoveChanges++;
+                        const waiter = window.__botMoveWaiter;
+                        window.__botMoveWaiter = null;
+                        if (waiter) waiter();
+                    });
+                    observer.observe(target, {childList: true, subtree: true, characterData: true});
+                    window.__botMoveObserver = {observer: observer, target: target};
+                }
+
+                // A change already landed since the last call
+                if (window.__botMoveChanges !== seen) {
+                    callback(window.__botMoveChanges);
+                    return;
+                }
+
+                const timer = setTimeout(() => {
+                    window.__botMoveWaiter = null;
+                    callback(window.__botMoveChanges);
+                }, timeoutMs);
+                window.__botMoveWaiter = () => {
+                    clearTimeout(timer);
+                    callback(window.__botMoveChanges);
+                };
+            """, self.move_list_selectors, self.move_row_selector, self.move_changes_seen, int(timeout * 1000))
+        except Exception as e:
+            logger.warning("Error waiting for a move list change: %s", e)
+            changes = None
+
+        if changes is None:
+            # No move list to observe yet, fall back to polling
+            time.sleep(min(timeout, 0.1))
+            return True
+
+        changed = changes != self.move_changes_seen
+        self.move_changes_seen = changes
+        return changed
+
+    # Blocks until predicate(self) is true or the timeout (in seconds) passes
+    # Typed predicates are in grabbers/conditions.py. The ones that watch the move list are
+    # re-checked as soon as a move lands, the others are polled with an interval that starts
+    # at poll_backoff seconds and doubles up to MAX_POLL_INTERVAL
+    # Returns the last predicate result
+    def wait_until(self, predicate, timeout, poll_backoff=0.05):
+        deadline = time.monotonic() + timeout
+        interval = poll_backoff
+        watches_moves = getattr(predicate, "watches_moves", False)
+        while True:
+            result = predicate(self)
+            remaining = deadline - time.monotonic()
+            if result or remaining <= 0:
+                return result
+            if watches_moves:
+                self.wait_for_change(min(interval, remaining))
+            else:
+                time.sleep(min(interval, remaining))
+            interval = min(interval * 2, self.MAX_POLL_INTERVAL)
+
+    # Releases what the grabber holds besides the browser session
+    def close(self):
+        pass
+
     # Sets the _board_elem variable
     @abstractmethod
     def update_board_elem(self):
@@ -41,6 +233,20 @@ class Grabber(ABC):
     def get_move_list(self):
         pass
 
+    # Reads the whole page state with a single injected script
+    # Returns a dict with the keys:
+    #   "moves": the move list, Ex. ["e4", "c5", "Nf3"]
+    #   "white_to_move": True if it is white's turn
+    #   "is_white": the board orientation, None if it is not found
+    #   "board_rect": {"x", "y", "width", "height"} of the board, None if it is not found
+    #   "game_over", "aborted", "is_puzzles", "connection_issue": page state flags
+    #   "clocks": {"white": seconds, "black": seconds, "increment": seconds}, None values if not shown
+    #   "geometry_dirty": True if the page was resized or scrolled since update_board_geometry
+    # Returns None if the script failed
+    @abstractmethod
+    def snapshot(self):
+        pass
+
     # Returns True if the player does puzzles
     # and False if not
     @abstractmethod
@@ -0,0 +1,282 @@
+import http.client
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+from grabbers.grabber import Grabber
+
+logger = logging.getLogger(__name__)
+
+
+class ApiClient:
+    """
+    Small HTTP client for the Lichess API
+    Requests reuse a pool of keep-alive connections, so posting a move costs no
+    TCP/TLS handshake. Streams get their own connection because they stay open
+    """
+
+    def __init__(self, base_url, token, pool_size=4, timeout=10):
+        url = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.host = url.netloc
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _new_connection(self, timeout=None):
+        return self.connection_class(self.host, timeout=timeout or self.timeout)
+
+    def _get_connection(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def _release_connection(self, connection):
+        try:
+            self.pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method, path, body=None):
+        """
+        Sends a request on a pooled connection and returns (status, parsed JSON or None)
+        A connection the server closed in the meantime is replaced once
+        """
+        for attempt in range(2):
+            connection = self._get_connection()
+            try:
+                connection.request(method, path, body=body, headers=self.headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    ConnectionError, BrokenPipeError):
+                connection.close()
+                if attempt == 1:
+                    raise
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self._release_connection(connection)
+            try:
+                return response.status, json.loads(data) if data else None
+            except ValueError:
+                return response.status, None
+
+    def stream(self, path, stop_event):
+        """
+        Yields the events of an NDJSON stream until it ends or stop_event is set
+        Empty keep-alive lines are skipped
+        """
+        # Lichess sends a keep-alive line every few seconds, so a longer silence means the stream is dead
+        connection = self._new_connection(timeout=30)
+        try:
+            connection.request("GET", path, headers=self.headers)
+            response = connection.getresponse()
+            if response.status != 200:
+                raise ConnectionError(f"Stream {path} returned HTTP {response.status}")
+            while not stop_event.is_set():
+                line = response.readline()
+                if not line:
+                    return
+                line = line.strip()
+                if line:
+                    yield line
+        finally:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class LichessApiGrabber(Grabber):
+    """
+    Plays through the official Lichess Bot API instead of the browser
+    A background thread follows the game's NDJSON event stream, the page snapshot is
+    built from the last event and moves are posted over pooled keep-alive connections.
+    There is no board on screen, so the screen position methods return None
+    Only games from the standard starting position are supported
+    """
+
+    def __init__(self, token, game_id=None, base_url="https://lichess.org", record_path=None):
+        # No browser is attached, so Grabber.__init__ is not called
+        self._board_elem = None
+        self.chrome = None
+        self.move_changes_seen = 0
+        self.square_tables = None
+        self.square_size = None
+
+        self.client = ApiClient(base_url, token)
+        self.game_id = game_id
+        self.account_id = None
+        self.record_file = None
+        if record_path:
+            if os.path.dirname(record_path):
+                os.makedirs(os.path.dirname(record_path), exist_ok=True)
+            self.record_file = open(record_path, "a")
+
+        # Game state from the event stream, guarded by the condition
+        self.changed = threading.Condition()
+        self.version = 0
+        self.version_seen = 0
+        self.white_id = None
+        self.moves = []
+        self.clocks = {"white": None, "black": None, "increment": None}
+        self.status = None
+        self.connected = False
+
+        self.stop_event = threading.Event()
+        self.stream_thread = None
+
+    def _record(self, line):
+        if self.record_file is not None:
+            self.record_file.write(line.decode() + "\n")
+            self.record_file.flush()
+
+    def _find_game_id(self):
+        # Wait for the next game of the account on the event stream
+        for line in self.client.stream("/api/stream/event", self.stop_event):
+            event = json.loads(line)
+            if event.get("type") == "gameStart":
+                game = event["game"]
+                return game.get("gameId") or game.get("id")
+        return None
+
+    def _apply_state(self, state):
+        moves = state.get("moves", "")
+        self.moves = moves.split() if moves else []
+        self.clocks = {
+            "white": state["wtime"] / 1000 if "wtime" in state else None,
+            "black": state["btime"] / 1000 if "btime" in state else None,
+            "increment": state["winc"] / 1000 if "winc" in state else None
+        }
+        self.status = state.get("status")
+
+    def _follow_game(self):
+        """
+        Reads the game stream and reconnects after a dropped connection
+        """
+        while not self.stop_event.is_set():
+            try:
+                for line in self.client.stream(f"/api/bot/game/stream/{self.game_id}", self.stop_event):
+                    self._record(line)
+                    event = json.loads(line)
+                    with self.changed:
+                        if event.get("type") == "gameFull":
+                            self.white_id = event.get("white", {}).get("id")
+                            if event.get("initialFen", "startpos") != "startpos":
+                                logger.info("Games from a custom position are not supported")
+                            self._apply_state(event["state"])
+                        elif event.get("type") == "gameState":
+                            self._apply_state(event)
+                        else:
+                            continue
+                        self.connected = True
+                        self.version += 1
+                        self.changed.notify_all()
+                    if self.status not in (None, "created", "started"):
+                        return
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                logger.warning("Game stream error: %s", e)
+            with self.changed:
+                self.connected = False
+                self.changed.notify_all()
+            self.stop_event.wait(1)
+
+    def update_board_elem(self):
+        """
+        Starts following the game, the game stands in for the board element
+        """
+        if self.stream_thread is None:
+            try:
+                status, account = self.client.request("GET", "/api/account")
+                if status == 200 and account:
+                    self.account_id = account.get("id")
+                if self.game_id is None:
+                    self.game_id = self._find_game_id()
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                logger.warning("Could not reach the Lichess API: %s", e)
+                return
+            if self.game_id is None:
+                return
+            self.stream_thread = threading.Thread(target=self._follow_game, daemon=True)
+            self.stream_thread.start()
+
+        # Wait for the first event so the color and the moves are known
+        with self.changed:
+            self.changed.wait_for(lambda: self.version > 0 or self.stop_event.is_set(), timeout=10)
+            self._board_elem = self.game_id if self.version > 0 else None
+
+    def update_board_geometry(self):
+        return False
+
+    def get_square_pos(self, square, is_white):
+        return None
+
+    def wait_for_change(self, timeout):
+        with self.changed:
+            changed = self.changed.wait_for(lambda: self.version != self.version_seen, timeout=timeout)
+            self.version_seen = self.version
+        return changed
+
+    def is_white(self):
+        if self.white_id is None or self.account_id is None:
+            return None
+        return self.white_id == self.account_id
+
+    def is_game_over(self):
+        return self.status not in (None, "created", "started")
+
+    def get_move_list(self):
+        with self.changed:
+            return list(self.moves)
+
+    def snapshot(self):
+        with self.changed:
+            return {
+                "moves": list(self.moves),
+                "white_to_move": len(self.moves) % 2 == 0,
+                "is_white": self.is_white(),
+                "board_rect": None,
+                "game_over": self.is_game_over() and self.status != "aborted",
+                "aborted": self.status == "aborted",
+                "is_puzzles": False,
+                "connection_issue": not self.connected,
+                "clocks": dict(self.clocks),
+                "geometry_dirty": False
+            }
+
+    def is_game_puzzles(self):
+        return False
+
+    def click_puzzle_next(self):
+        pass
+
+    def make_mouseless_move(self, move, move_count=0, pre_move=False):
+        try:
+            status, response = self.client.request("POST", f"/api/bot/game/{self.game_id}/move/{move}")
+        except (OSError, http.client.HTTPException) as e:
+            logger.warning("Could not post move %s: %s", move, e)
+            return False
+        if status != 200:
+            logger.warning("Move %s was rejected: %s", move, response)
+            return False
+        return True
+
+    def make_direct_dom_move(self, move):
+        return self.make_mouseless_move(move)
+
+    def close(self):
+        self.stop_event.set()
+        self.client.close()
+        if self.record_file is not None:
+            self.record_file.close()
@@ -1,4 +1,4 @@
-import re
+import logging
 import time
 
 from selenium.common import NoSuchElementException
@@ -6,12 +6,17 @@ from selenium.webdriver.common.by import By
 
 from grabbers.grabber import Grabber
 
+logger = logging.getLogger(__name__)
+
 
 class LichessGrabber(Grabber):
+    # rm6 also exists before the first move, when l4x hasn't been created yet
+    move_list_selectors = ["rm6", "l4x", ".puzzle__moves"]
+    promotion_dialog_selector = "#promotion-choice"
+
     def __init__(self, chrome_url, chrome_session_id):
         super().__init__(chrome_url, chrome_session_id)
-        self.tag_name = None
-        self.moves_list = {}
+        self.moves_list = []
 
     def update_board_elem(self):
         try:
@@ -44,7 +49,7 @@ class LichessGrabber(Grabber):
             # Check if it contains any game over messages
             over_text = game_over_elem.text.lower()
             if any(x in over_text for x in ["aborted", "victory", "defeat", "draw", "checkmate", "stalemate", "time"]):
-                print(f"Game over detected with text: {over_text}")
+                logger.info("Game over detected with text: %s", over_text)
                 return True
 
             # If we don't have an exception at this point, we have found the game over window
@@ -61,7 +66,7 @@ class LichessGrabber(Grabber):
                 # Check common game over messages in the document
                 page_text = self.chrome.find_element(By.TAG_NAME, 'body').text.lower()
                 if any(x in page_text for x in ['game aborted', 'game over', 'victory', 'defeat', 'draw']):
-                    print(f"Game over detected in page text")
+                    logger.info("Game over detected in page text")
                     return True
 
                 # If we don't have an exception at this point and the window's class is not "complete",
@@ -73,82 +78,172 @@ class LichessGrabber(Grabber):
                     # Check common game over messages in the document
                     page_text = self.chrome.find_element(By.TAG_NAME, 'body').text.lower()
                     if any(x in page_text for x in ['game aborted', 'game over', 'victory', 'defeat', 'draw']):
-                        print(f"Game over detected in page text")
+                        logger.info("Game over detected in page text")
                         return True
                 except:
                     pass
                 return False
 
-    def set_moves_tag_name(self):
-        if self.is_game_puzzles():
-            return False
-
-        move_list_elem = self.get_normal_move_list_elem()
-
-        if move_list_elem is None or move_list_elem == []:
-            return False
-
+    def get_move_list(self):
+        """
+        Reads the move list (normal or puzzles) in a single script round trip
+        The script returns only the moves that weren't processed yet and marks them,
+        the whole list is only sent again if it no longer matches (takebacks, reloads)
+        """
         try:
-            last_child = move_list_elem.find_element(By.XPATH, "*[last()]")
-            self.tag_name = last_child.tag_name
-
-            return True
-        except NoSuchElementException:
-            return False
+            result = self.chrome.execute_script("""
+                function byXPath(path) {
+                    return document.evaluate(path, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+                }
+
+                const knownCount = arguments[0];
+                const sanRegex = /^[NBRQK]?[a-h]?[1-8]?x?[a-h][1-8]=?[NBRQ]?[+#]?$|^O-O(-O)?[+#]?$/;
+                const isPuzzles = byXPath('/html/body/div[2]/main/aside/div[1]/div[1]/div/p[1]') !== null;
+
+                // The same elements get_puzzles_move_list_elem and get_normal_move_list_elem find
+                let moveElems;
+                if (isPuzzles) {
+                    const moveList = byXPath('/html/body/div[2]/main/div[2]/div[2]/div');
+                    if (!moveList) return null;
+                    moveElems = moveList.querySelectorAll('move');
+                } else {
+                    const moveList = byXPath('//*[@id="main-wrap"]/main/div[1]/rm6/l4x');
+                    if (!moveList) {
+                        // rm6 without l4x means there are no moves yet
+                        return byXPath('//*[@id="main-wrap"]/main/div[1]/rm6') ? {moves: [], total: 0, reset: true, skipped: []} : null;
+                    }
+                    moveElems = moveList.children;
+                }
+
+                // Processed elements keep their SAN in data-processed ("" for non-move elements)
+                const allMoves = [];
+                const newMoves = [];
+                const skipped = [];
+                let processedCount = 0;
+                for (const elem of moveElems) {
+                    let move = elem.getAttribute('data-processed');
+                    if (move !== null) {
+                        if (move !== '') processedCount++;
+                    } else {
+                        move = elem.innerText.replace(/[^a-zA-Z0-9+-]/g, '');
+                        // Skip non-chess move messages like "Gameaborted"
+                        if (move !== '' && !sanRegex.test(move)) {
+                            skipped.push(move);
+                            move = '';
+                        }
+                        elem.setAttribute('data-processed', move);
+                        if (move !== '') newMoves.push(move);
+                    }
+                    if (move !== '') allMoves.push(move);
+                }
+
+                const reset = processedCount !== knownCount;
+                return {moves: reset ? allMoves : newMoves, total: allMoves.length, reset: reset, skipped: skipped};
+            """, len(self.moves_list))
+        except Exception as e:
+            logger.warning("Error in get_move_list: %s", e)
+            return None
 
-    def get_move_list(self):
-        # sourcery skip: assign-if-exp, merge-else-if-into-elif, use-fstring-for-concatenation
-        is_puzzles = self.is_game_puzzles()
+        if result is None:
+            return None
 
-        # Find the move list element
-        if is_puzzles:
-            move_list_elem = self.get_puzzles_move_list_elem()
+        for move in result["skipped"]:
+            logger.debug("Skipping non-standard move text: %s", move)
 
-            if move_list_elem is None:
-                return None
+        if result["reset"]:
+            self.moves_list = result["moves"]
         else:
-            move_list_elem = self.get_normal_move_list_elem()
+            self.moves_list.extend(result["moves"])
 
-            if move_list_elem is None:
-                return None
-            if (not move_list_elem) or (self.tag_name is None and self.set_moves_tag_name() is False):
-                return []
+        return list(self.moves_list)
 
-        # Get the move elements (children of the move list element)
+    def snapshot(self):
+        """
+        Reads moves, orientation, board rect, clocks and the game state flags in one round trip
+        """
         try:
-            if not is_puzzles:
-                if not self.moves_list:
-                    # If the moves list is empty, find all moves
-                    children = move_list_elem.find_elements(By.CSS_SELECTOR, self.tag_name)
-                else:
-                    # If the moves list is not empty, find only the new moves
-                    children = move_list_elem.find_elements(By.CSS_SELECTOR, self.tag_name + ":not([data-processed])")
-            else:
-                if not self.moves_list:
-                    # If the moves list is empty, find all moves
-                    children = move_list_elem.find_elements(By.CSS_SELECTOR, "move")
-                else:
-                    # If the moves list is not empty, find only the new moves
-                    children = move_list_elem.find_elements(By.CSS_SELECTOR, "move:not([data-processed])")
-        except NoSuchElementException:
+            return self.chrome.execute_script("""
+                function byXPath(path) {
+                    return document.evaluate(path, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+                }
+
+                function parseClock(elem) {
+                    if (!elem) return null;
+                    const parts = elem.textContent.replace(/[^0-9:.]/g, '').split(':');
+                    let seconds = 0;
+                    for (const part of parts) seconds = seconds * 60 + parseFloat(part || '0');
+                    return seconds;
+                }
+
+                const sanRegex = /^[NBRQK]?[a-h]?[1-8]?x?[a-h][1-8]=?[NBRQ]?[+#]?$|^O-O(-O)?[+#]?$/;
+                const bodyText = document.body.innerText.toLowerCase();
+                const isPuzzles = byXPath('/html/body/div[2]/main/aside/div[1]/div[1]/div/p[1]') !== null;
+
+                // Move list, the same elements get_move_list reads
+                let moveElems = [];
+                if (isPuzzles) {
+                    const puzzleList = byXPath('/html/body/div[2]/main/div[2]/div[2]/div');
+                    if (puzzleList) moveElems = puzzleList.querySelectorAll('move');
+                } else {
+                    const moveList = byXPath('//*[@id="main-wrap"]/main/div[1]/rm6/l4x');
+                    if (moveList) moveElems = moveList.children;
+                }
+                const moves = [];
+                for (const elem of moveElems) {
+                    const move = elem.innerText.replace(/[^a-zA-Z0-9+-]/g, '');
+                    if (sanRegex.test(move)) moves.push(move);
+                }
+
+                // Board and orientation
+                const board = byXPath('//*[@id="main-wrap"]/main/div[1]/div[1]/div/cg-container') ||
+                              byXPath('/html/body/div[2]/main/div[1]/div/cg-container');
+                let isWhite = null;
+                let boardRect = null;
+                if (board) {
+                    const ranks = board.querySelector('.ranks');
+                    if (ranks) isWhite = !ranks.classList.contains('black');
+                    const rect = board.getBoundingClientRect();
+                    boardRect = {x: rect.left + window.scrollX, y: rect.top + window.scrollY,
+                                 width: rect.width, height: rect.height};
+                }
+
+                // Game over window, puzzle completion and page messages
+                const puzzleWindow = byXPath('/html/body/div[2]/main/div[2]/div[3]/div[1]');
+                const gameOver = byXPath('//*[@id="main-wrap"]/main/aside/div/section[2]') !== null ||
+                                 (puzzleWindow !== null && puzzleWindow.className === 'complete') ||
+                                 ['game aborted', 'game over', 'victory', 'defeat'].some(x => bodyText.includes(x));
+                const aborted = bodyText.includes('game aborted') || bodyText.includes('abandoned') ||
+                                document.querySelectorAll('.game-abort, .result-wrap').length > 0;
+
+                const connectionIssue = document.querySelector('.reconnect, .connection-lost, .reload-button, .lag.severe, .error-code, .icon-offline, .offline-content') !== null ||
+                                        bodyText.includes('socket disconnected') || bodyText.includes('connection lost');
+
+                return {
+                    moves: moves,
+                    white_to_move: moves.length % 2 === 0,
+                    is_white: isWhite,
+                    board_rect: boardRect,
+                    game_over: gameOver,
+                    aborted: aborted,
+                    is_puzzles: isPuzzles,
+                    connection_issue: connectionIssue,
+                    geometry_dirty: window.__botGeometryDirty !== false,
+                    clocks: {
+                        white: parseClock(document.querySelector('.rclock-white .time')),
+                        black: parseClock(document.querySelector('.rclock-black .time')),
+                        // The time control is shown as "3+2" in the game info box
+                        increment: (() => {
+                            const setup = document.querySelector('.game__meta .setup');
+                            const match = setup ? setup.textContent.match(/(\d+)\+(\d+)/) : null;
+                            return match ? parseInt(match[2]) : null;
+                        })()
+                    }
+                };
+            """)
+        except Exception as e:
+            logger.warning("Error in snapshot: %s", e)
             return None
 
-        # Get the moves from the elements
-        for move_element in children:
-            # Sanitize the move
-            move = re.sub(r"[^a-zA-Z0-9+-]", "", move_element.text)
-            
-            # Skip non-chess move messages like "Gameaborted"
-            if move != "" and re.match(r'^[NBRQK]?[a-h]?[1-8]?x?[a-h][1-8]=?[NBRQ]?[+#]?$|^O-O(-O)?[+#]?$', move):
-                self.moves_list[move_element.id] = move
-            elif move != "":
-                print(f"Skipping non-standard move text: {move}")
-
-            # Mark the move as processed
-            self.chrome.execute_script("arguments[0].setAttribute('data-processed', 'true')", move_element)
-
-        return [val for val in self.moves_list.values()]
-
     def get_puzzles_move_list_elem(self):
         try:
             # Try finding the move list in the puzzles page
@@ -226,10 +321,10 @@ class LichessGrabber(Grabber):
                         self.chrome.execute_script(script)
                         success = True
                     except Exception as e:
-                        print(f"Error in alternative premove method: {e}")
+                        logger.warning("Error in alternative premove method: %s", e)
                         success = False
                     
-                print(f"Set JavaScript premove: {move}, success: {success}")
+                logger.debug("Set JavaScript premove: %s, success: %s", move, success)
                 return success
             else:
                 # Make a regular move
@@ -250,7 +345,7 @@ class LichessGrabber(Grabber):
                     self.chrome.execute_script(script)
                     return True
                 except Exception as e:
-                    print(f"Primary socket method failed: {e}")
+                    logger.warning("Primary socket method failed: %s", e)
                     
                     try:
                         # Try an alternative direct socket approach
@@ -258,10 +353,10 @@ class LichessGrabber(Grabber):
                         self.chrome.execute_script(script)
                         return True
                     except Exception as e:
-                        print(f"Alternative socket method failed too: {e}")
+                        logger.warning("Alternative socket method failed too: %s", e)
                         return False
         except Exception as e:
-            print(f"Error in make_mouseless_move: {e}")
+            logger.warning("Error in make_mouseless_move: %s", e)
             # Fall back to mouse-based approach if JavaScript fails
             return False
         
@@ -464,29 +559,29 @@ class LichessGrabber(Grabber):
                 """
                 
                 result = self.chrome.execute_script(script)
-                print(f"Direct DOM move result: {result}")
+                logger.debug("Direct DOM move result: %s", result)
                 
                 if isinstance(result, dict) and result.get('success') is True:
-                    print(f"Move successful using method: {result.get('method')}")
+                    logger.debug("Move successful using method: %s", result.get('method'))
                     return True
                 else:
                     error_msg = result.get('error') if isinstance(result, dict) else "Unknown error"
-                    print(f"Move failed: {error_msg}")
+                    logger.warning("Move failed: %s", error_msg)
                     
                     # If we still have retries left, try again
                     if retry_count < max_retries:
                         retry_count += 1
-                        print(f"Retrying... (attempt {retry_count} of {max_retries})")
+                        logger.info("Retrying... (attempt %s of %s)", retry_count, max_retries)
                         # Wait a bit before retrying
                         time.sleep(0.5)
                         continue
                     return False
                     
             except Exception as e:
-                print(f"Error in make_direct_dom_move: {e}")
+                logger.warning("Error in make_direct_dom_move: %s", e)
                 if retry_count < max_retries:
                     retry_count += 1
-                    print(f"Retrying after exception... (attempt {retry_count} of {max_retries})")
+                    logger.info("Retrying after exception... (attempt %s of %s)", retry_count, max_retries)
                     time.sleep(0.5)
                     continue
                 return False
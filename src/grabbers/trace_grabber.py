@@ -0,0 +1,341 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from grabbers.grabber import Grabber
+
+logger = logging.getLogger(__name__)
+
+
+# Trace format version, the first line of every trace is a header with it
+TRACE_VERSION = 1
+
+# Grabber attributes read by the bot, their values go into the trace too
+RECORDED_ATTRIBUTES = ("square_size", "_board_elem")
+
+
+def open_trace(path, mode):
+    # Traces ending in .gz are compressed, a JSON line per call compresses well
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def script_id(script):
+    # Scripts are identified by a short hash instead of their text to keep the trace small
+    return hashlib.sha1(script.encode()).hexdigest()[:8]
+
+
+def _to_json(value):
+    # Web elements and other objects can't be replayed, only that something was returned
+    return f"<{type(value).__name__}>"
+
+
+class TraceError(Exception):
+    """
+    An exception raised by the recorded grabber, raised again on replay with the same message
+    """
+
+
+class TraceRecorder:
+    """
+    Appends one event per call to the trace file: [start, duration, name, args, result]
+    start and duration are in seconds, start counts from the start of the recording.
+    Calls that raised have {"error": message} as their result
+    """
+
+    # The file is flushed every this many events, so a crash loses little
+    FLUSH_INTERVAL = 50
+
+    def __init__(self, path, grabber_name):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open_trace(path, "w")
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.events = 0
+        self.file.write(json.dumps({"version": TRACE_VERSION, "grabber": grabber_name, "time": time.time()}) + "\n")
+
+    def call(self, name, func, args):
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.write(start, name, args, {"error": str(e)})
+            raise
+        self.write(start, name, args, result)
+        return result
+
+    def write(self, start, name, args, result):
+        event = [round(start - self.started, 4), round(time.perf_counter() - start, 4), name, list(args), result]
+        line = json.dumps(event, default=_to_json, separators=(",", ":"))
+        with self.lock:
+            self.file.write(line + "\n")
+            self.events += 1
+            if self.events % self.FLUSH_INTERVAL == 0:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingChrome:
+    """
+    Stands in for the Selenium driver and records the scripts the bot runs directly
+    """
+
+    def __init__(self, chrome, recorder):
+        self._chrome = chrome
+        self._recorder = recorder
+
+    def execute_script(self, script, *args):
+        return self._recorder.call("chrome.execute_script", lambda *_: self._chrome.execute_script(script, *args),
+                                   (script_id(script),))
+
+    def execute_async_script(self, script, *args):
+        return self._recorder.call("chrome.execute_async_script",
+                                   lambda *_: self._chrome.execute_async_script(script, *args), (script_id(script),))
+
+    def refresh(self):
+        return self._recorder.call("chrome.refresh", lambda: self._chrome.refresh(), ())
+
+    def __getattr__(self, name):
+        return getattr(self._chrome, name)
+
+
+class RecordingGrabber(Grabber):
+    """
+    Wraps a grabber and records every call the bot makes, with its result and timing, to a trace
+    wait_until is recorded as one call, so its replay doesn't depend on how often it polled.
+    The recorder belongs to the caller, so a grabber created again after a reconnect
+    keeps writing to the same trace
+    """
+
+    def __init__(self, grabber, recorder):
+        # The wrapped grabber owns the browser session, so Grabber.__init__ is not called
+        self._grabber = grabber
+        self._recorder = recorder
+        self.chrome = RecordingChrome(grabber.chrome, self._recorder) if grabber.chrome is not None else None
+
+    def _call(self, name, *args):
+        return self._recorder.call(name, getattr(self._grabber, name), args)
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not on the wrapper
+        if name in RECORDED_ATTRIBUTES:
+            return self._recorder.call(name, lambda: getattr(self._grabber, name), ())
+        return getattr(self._grabber, name)
+
+    def update_board_elem(self):
+        return self._call("update_board_elem")
+
+    def get_board(self):
+        return self._call("get_board")
+
+    def is_white(self):
+        return self._call("is_white")
+
+    def is_game_over(self):
+        return self._call("is_game_over")
+
+    def get_move_list(self):
+        return self._call("get_move_list")
+
+    def snapshot(self):
+        return self._call("snapshot")
+
+    def is_game_puzzles(self):
+        return self._call("is_game_puzzles")
+
+    def click_puzzle_next(self):
+        return self._call("click_puzzle_next")
+
+    def make_mouseless_move(self, *args):
+        return self._call("make_mouseless_move", *args)
+
+    def make_direct_dom_move(self, move):
+        return self._call("make_direct_dom_move", move)
+
+    def update_board_geometry(self):
+        return self._call("update_board_geometry")
+
+    def invalidate_board_geometry(self):
+        return self._call("invalidate_board_geometry")
+
+    def get_square_pos(self, square, is_white):
+        return self._call("get_square_pos", square, is_white)
+
+    def wait_for_change(self, timeout):
+        return self._call("wait_for_change", timeout)
+
+    def wait_until(self, predicate, timeout, poll_backoff=0.05):
+        return self._recorder.call(
+            "wait_until", lambda *_: self._grabber.wait_until(predicate, timeout, poll_backoff),
+            (type(predicate).__name__, timeout)
+        )
+
+    def close(self):
+        self._grabber.close()
+
+
+class TracePlayer:
+    """
+    Hands out the recorded events in order
+    A call that doesn't match the next event skips ahead to the next event of the same name
+    within LOOKAHEAD events, the skipped events are counted as divergences. Every call waits
+    as long as the recorded call took, divided by speed. Speed 0 replays without waiting
+    """
+
+    # Events searched for a call that doesn't match the next one, further ones would lose the sync
+    LOOKAHEAD = 20
+
+    def __init__(self, path, speed=1.0):
+        with open_trace(path, "r") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != TRACE_VERSION:
+                raise ValueError(f"Unsupported trace version {header.get('version')}")
+            self.events = [json.loads(line) for line in f if line.strip()]
+        self.grabber_name = header.get("grabber")
+        self.speed = speed
+        self.position = 0
+        self.divergences = 0
+        self.lock = threading.Lock()
+
+    def is_finished(self):
+        return self.position >= len(self.events)
+
+    def next(self, name, args):
+        """
+        Returns the recorded result of the next call of name
+        Raises EOFError at the end of the trace and LookupError if the call is not near the current event
+        """
+        with self.lock:
+            if self.position >= len(self.events):
+                raise EOFError("The trace is used up")
+            position = self.position
+            end = min(len(self.events), self.position + self.LOOKAHEAD)
+            while position < end and self.events[position][2] != name:
+                position += 1
+            if position == end:
+                self.divergences += 1
+                raise LookupError(f"No {name} call near event {self.position} of the trace")
+            if position != self.position:
+                self.divergences += position - self.position
+                logger.debug("Skipped %s events to reach %s", position - self.position, name)
+            _, duration, _, recorded_args, result = self.events[position]
+            self.position = position + 1
+
+        if recorded_args != list(args):
+            self.divergences += 1
+            logger.debug("%s called with %s, recorded with %s", name, list(args), recorded_args)
+        if self.speed:
+            time.sleep(duration / self.speed)
+        if isinstance(result, dict) and set(result) == {"error"}:
+            raise TraceError(result["error"])
+        return result
+
+
+class ReplayChrome:
+    """
+    Answers the bot's direct driver calls from the trace
+    """
+
+    def __init__(self, player):
+        self._player = player
+
+    def execute_script(self, script, *args):
+        return self._player.next("chrome.execute_script", (script_id(script),))
+
+    def execute_async_script(self, script, *args):
+        return self._player.next("chrome.execute_async_script", (script_id(script),))
+
+    def refresh(self):
+        return self._player.next("chrome.refresh", ())
+
+
+class ReplayGrabber(Grabber):
+    """
+    Plays a trace back in place of a browser, so the bot loop can be profiled and
+    regression tested without Chrome or a network. Once the trace is used up the
+    game is reported as over, so the bot loop ends
+    Web elements are replayed as a placeholder string, so only their presence is known
+    """
+
+    def __init__(self, path, speed=1.0):
+        # No browser is attached, so Grabber.__init__ is not called
+        self.player = TracePlayer(path, speed)
+        self.chrome = ReplayChrome(self.player)
+        self.move_changes_seen = 0
+        self.square_tables = None
+        self.last_snapshot = None
+
+    def _replay(self, name, args=(), default=None):
+        try:
+            return self.player.next(name, args)
+        except (EOFError, LookupError):
+            return default
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not on the grabber
+        if name in RECORDED_ATTRIBUTES:
+            return self._replay(name)
+        raise AttributeError(name)
+
+    def update_board_elem(self):
+        return self._replay("update_board_elem")
+
+    def get_board(self):
+        return self._replay("get_board")
+
+    def is_white(self):
+        return self._replay("is_white")
+
+    def is_game_over(self):
+        return self._replay("is_game_over", default=True)
+
+    def get_move_list(self):
+        return self._replay("get_move_list")
+
+    def snapshot(self):
+        try:
+            self.last_snapshot = self.player.next("snapshot", ())
+        except LookupError:
+            return self.last_snapshot
+        except EOFError:
+            if self.last_snapshot is None:
+                return None
+            # The trace is used up, end the game
+            return dict(self.last_snapshot, game_over=True)
+        return self.last_snapshot
+
+    def is_game_puzzles(self):
+        return self._replay("is_game_puzzles", default=False)
+
+    def click_puzzle_next(self):
+        return self._replay("click_puzzle_next")
+
+    def make_mouseless_move(self, *args):
+        return self._replay("make_mouseless_move", args, default=False)
+
+    def make_direct_dom_move(self, move):
+        return self._replay("make_direct_dom_move", (move,), default=False)
+
+    def update_board_geometry(self):
+        return self._replay("update_board_geometry", default=False)
+
+    def invalidate_board_geometry(self):
+        return self._replay("invalidate_board_geometry")
+
+    def get_square_pos(self, square, is_white):
+        return self._replay("get_square_pos", (square, is_white))
+
+    def wait_for_change(self, timeout):
+        return self._replay("wait_for_change", (timeout,), default=False)
+
+    def wait_until(self, predicate, timeout, poll_backoff=0.05):
+        return self._replay("wait_until", (type(predicate).__name__, timeout), default=False)
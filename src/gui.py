@@ -1,3 +1,4 @@
+import json
 import multiprocessing
 import multiprocess
 import threading
@@ -11,6 +12,9 @@ from webdriver_manager.chrome import ChromeDriverManager
 import keyboard
 from overlay import run  # Ensure overlay.py exists and defines run()
 from stockfish_bot import StockfishBot  # Ensure stockfish_bot.py exists and defines StockfishBot
+from orchestrator import Orchestrator
+from engine.auto_tune import auto_tune, load_settings
+import log_config
 
 class GUI:
     def __init__(self, master):
@@ -66,6 +70,14 @@ class GUI:
         self.status_text.pack()
         status_label.pack(anchor=tk.NW)
 
+        # Per-game engine statistics
+        self.stats_text = tk.Label(left_frame, text="", justify=tk.LEFT, font=("TkDefaultFont", 8))
+        self.stats_text.pack(anchor=tk.NW)
+
+        # Stage latencies of the last finished game
+        self.metrics_text = tk.Label(left_frame, text="", justify=tk.LEFT, font=("TkDefaultFont", 8))
+        self.metrics_text.pack(anchor=tk.NW)
+
         # Website chooser radio buttons
         self.website = tk.StringVar(value="chesscom")
         self.chesscom_radio_button = tk.Radiobutton(
@@ -78,6 +90,25 @@ class GUI:
             command=self.on_website_change
         )
         self.lichess_radio_button.pack(anchor=tk.NW)
+        self.lichess_api_radio_button = tk.Radiobutton(
+            left_frame, text="Lichess Bot API", variable=self.website, value="lichess_api",
+            command=self.on_website_change
+        )
+        self.lichess_api_radio_button.pack(anchor=tk.NW)
+
+        # Bot account API token (only visible for the Lichess Bot API)
+        self.api_token_frame = tk.Frame(left_frame)
+        tk.Label(self.api_token_frame, text="API Token").pack(side=tk.LEFT)
+        self.api_token = tk.StringVar(value="")
+        self.api_token_entry = tk.Entry(self.api_token_frame, textvariable=self.api_token, show="*", width=20)
+        self.api_token_entry.pack()
+        api_games_frame = tk.Frame(self.api_token_frame)
+        tk.Label(api_games_frame, text="Concurrent Games").pack(side=tk.LEFT)
+        self.api_games = tk.IntVar(value=1)
+        self.api_games_entry = tk.Entry(api_games_frame, textvariable=self.api_games, justify="center", width=4)
+        self.api_games_entry.pack()
+        api_games_frame.pack(anchor=tk.NW)
+        self.api_token_frame.pack_forget()  # Initially hidden
 
         # Tournament mode checkbox (only visible for Lichess)
         self.tournament_mode_frame = tk.Frame(left_frame)
@@ -200,6 +231,34 @@ class GUI:
         self.stockfish_depth_scale.pack()
         stockfish_depth_frame.pack(anchor=tk.NW)
 
+        # Budget the search from the game clocks instead of the depth
+        self.enable_time_management = tk.IntVar(value=0)
+        self.time_management_check_button = tk.Checkbutton(
+            left_frame, text="Use clock instead of depth", variable=self.enable_time_management
+        )
+        self.time_management_check_button.pack(anchor=tk.NW)
+
+        # End searches early in quiet positions
+        self.enable_early_stop = tk.IntVar(value=0)
+        self.early_stop_check_button = tk.Checkbutton(
+            left_frame, text="Stop early when stable", variable=self.enable_early_stop
+        )
+        self.early_stop_check_button.pack(anchor=tk.NW)
+
+        # Think on the opponent's time
+        self.enable_ponder = tk.IntVar(value=0)
+        self.ponder_check_button = tk.Checkbutton(
+            left_frame, text="Ponder", variable=self.enable_ponder
+        )
+        self.ponder_check_button.pack(anchor=tk.NW)
+
+        # Watch the page while the engine searches
+        self.enable_async_loop = tk.IntVar(value=0)
+        self.async_loop_check_button = tk.Checkbutton(
+            left_frame, text="Overlap search and page reads", variable=self.enable_async_loop
+        )
+        self.async_loop_check_button.pack(anchor=tk.NW)
+
         # Memory entry field
         memory_frame = tk.Frame(left_frame)
         tk.Label(memory_frame, text="Memory").pack(side=tk.LEFT)
@@ -218,9 +277,35 @@ class GUI:
         self.cpu_threads_entry = tk.Entry(
             cpu_threads_frame, textvariable=self.cpu_threads, justify="center", width=7
         )
-        self.cpu_threads_entry.pack()
+        self.cpu_threads_entry.pack(side=tk.LEFT)
+        self.auto_tune_button = tk.Button(
+            cpu_threads_frame, text="Auto-tune", command=self.on_auto_tune_button_listener
+        )
+        self.auto_tune_button.pack(padx=(5, 0))
         cpu_threads_frame.pack(anchor=tk.NW)
 
+        # Evaluation cache size entry field
+        eval_cache_frame = tk.Frame(left_frame)
+        tk.Label(eval_cache_frame, text="Eval Cache").pack(side=tk.LEFT)
+        self.eval_cache_memory = tk.IntVar(value=16)
+        self.eval_cache_entry = tk.Entry(
+            eval_cache_frame, textvariable=self.eval_cache_memory, justify="center", width=7
+        )
+        self.eval_cache_entry.pack(side=tk.LEFT)
+        tk.Label(eval_cache_frame, text="MB").pack()
+        eval_cache_frame.pack(anchor=tk.NW)
+
+        # Number of ranked lines shown as overlay arrows. Searches rank at least two lines,
+        # so the second one is there for repetition avoidance. More lines slow the search down
+        multipv_frame = tk.Frame(left_frame)
+        tk.Label(multipv_frame, text="Lines (MultiPV)").pack(side=tk.LEFT)
+        self.multipv = tk.IntVar(value=2)
+        self.multipv_entry = tk.Entry(
+            multipv_frame, textvariable=self.multipv, justify="center", width=4
+        )
+        self.multipv_entry.pack()
+        multipv_frame.pack(anchor=tk.NW)
+
         # Separator for Miscellaneous options
         separator_frame = tk.Frame(left_frame)
         separator = ttk.Separator(separator_frame, orient="horizontal")
@@ -252,6 +337,68 @@ class GUI:
         self.stockfish_path_text = tk.Label(left_frame, text="", wraplength=180)
         self.stockfish_path_text.pack(anchor=tk.NW)
 
+        # Select opening book button
+        self.book_path = ""
+        self.select_book_button = tk.Button(
+            left_frame, text="Select Opening Book", command=self.on_select_book_button_listener
+        )
+        self.select_book_button.pack(anchor=tk.NW)
+
+        # Opening book path display
+        self.book_path_text = tk.Label(left_frame, text="", wraplength=180)
+        self.book_path_text.pack(anchor=tk.NW)
+
+        # Opening book options
+        book_ply_frame = tk.Frame(left_frame)
+        tk.Label(book_ply_frame, text="Max Book Ply").pack(side=tk.LEFT)
+        self.book_max_ply = tk.IntVar(value=20)
+        self.book_max_ply_entry = tk.Entry(
+            book_ply_frame, textvariable=self.book_max_ply, justify="center", width=6
+        )
+        self.book_max_ply_entry.pack()
+        book_ply_frame.pack(anchor=tk.NW)
+        self.enable_book_weighted = tk.IntVar(value=1)
+        self.book_weighted_check_button = tk.Checkbutton(
+            left_frame, text="Weighted book moves", variable=self.enable_book_weighted
+        )
+        self.book_weighted_check_button.pack(anchor=tk.NW)
+
+        # Select Syzygy tablebase directory button
+        self.tablebase_path = ""
+        self.select_tablebase_button = tk.Button(
+            left_frame, text="Select Tablebases", command=self.on_select_tablebase_button_listener
+        )
+        self.select_tablebase_button.pack(anchor=tk.NW)
+
+        # Tablebase path display
+        self.tablebase_path_text = tk.Label(left_frame, text="", wraplength=180)
+        self.tablebase_path_text.pack(anchor=tk.NW)
+
+        # Tablebase piece count
+        tablebase_pieces_frame = tk.Frame(left_frame)
+        tk.Label(tablebase_pieces_frame, text="Tablebase Pieces").pack(side=tk.LEFT)
+        self.tablebase_pieces = tk.IntVar(value=5)
+        self.tablebase_pieces_entry = tk.Entry(
+            tablebase_pieces_frame, textvariable=self.tablebase_pieces, justify="center", width=4
+        )
+        self.tablebase_pieces_entry.pack()
+        tablebase_pieces_frame.pack(anchor=tk.NW)
+
+        # Keep search results on disk across sessions
+        self.enable_analysis_store = tk.IntVar(value=1)
+        self.analysis_store_check_button = tk.Checkbutton(
+            left_frame, text="Save analysis to disk", variable=self.enable_analysis_store
+        )
+        self.analysis_store_check_button.pack(anchor=tk.NW)
+
+        # Record the website traffic for offline replay (benchmarks/replay_trace.py),
+        # Bot API games also record their game stream for benchmarks/lichess_api_server.py
+        self.enable_trace = tk.IntVar(value=0)
+        self.trace_check_button = tk.Checkbutton(
+            left_frame, text="Record grabber trace", variable=self.enable_trace
+        )
+        self.trace_check_button.pack(anchor=tk.NW)
+
         left_frame.grid(row=0, column=0, padx=5, sticky=tk.NW)
 
         # Right frame for moves Treeview
@@ -276,6 +423,18 @@ class GUI:
             right_frame, text="Export PGN", command=self.on_export_pgn_button_listener
         )
         self.export_pgn_button.pack(anchor=tk.NW, fill=tk.X)
+
+        # Log level of every module, applied when the bot starts
+        log_levels_frame = tk.LabelFrame(right_frame, text="Log Levels")
+        self.log_levels = {}
+        for row, module in enumerate(log_config.MODULES):
+            tk.Label(log_levels_frame, text=module).grid(row=row, column=0, sticky=tk.W)
+            self.log_levels[module] = tk.StringVar(value=log_config.DEFAULT_LEVEL)
+            ttk.Combobox(
+                log_levels_frame, textvariable=self.log_levels[module], values=log_config.LEVELS,
+                state="readonly", width=9
+            ).grid(row=row, column=1, sticky=tk.E)
+        log_levels_frame.pack(anchor=tk.NW, fill=tk.X, pady=(10, 0))
         right_frame.grid(row=0, column=1, sticky=tk.NW)
 
         # Start background threads
@@ -293,6 +452,16 @@ class GUI:
             self.enable_tournament_mode.set(False)
             self.is_tournament_mode = False
 
+        # The Bot API plays without a browser
+        if self.website.get() == "lichess_api":
+            self.api_token_frame.pack(after=self.lichess_api_radio_button, anchor=tk.NW)
+            if not self.running:
+                self.start_button["state"] = "normal"
+        else:
+            self.api_token_frame.pack_forget()
+            if not self.opened_browser:
+                self.start_button["state"] = "disabled"
+
     def on_tournament_mode_change(self):
         self.is_tournament_mode = self.enable_tournament_mode.get()
 
@@ -349,6 +518,7 @@ class GUI:
                         self.clear_tree()
                         self.match_moves = []
                         self.game_over_shown = False
+                        self.stats_text["text"] = ""
                         self.status_text["text"] = "Running"
                         self.status_text["fg"] = "green"
                         self.status_text.update()
@@ -362,10 +532,17 @@ class GUI:
                         self.insert_move(move)
                         self.tree.yview_moveto(1)
                     elif data.startswith("M_MOVE"):
-                        moves = data[6:].split(",")
-                        self.match_moves += moves
+                        # The whole move list, sent at the start and after takebacks
+                        moves = data[6:].split(",") if len(data) > 6 else []
+                        self.match_moves = moves
                         self.set_moves(moves)
                         self.tree.yview_moveto(1)
+                    elif data.startswith("STATS"):
+                        self.set_stats(json.loads(data[5:]))
+                    elif data.startswith("GAMES"):
+                        self.set_games(json.loads(data[5:]))
+                    elif data.startswith("METRICS"):
+                        self.set_metrics(json.loads(data[7:]))
                     # Only process error and restart messages if NOT in tournament mode
                     elif not self.is_tournament_mode:
                         if data.startswith("RESTART"):
@@ -443,9 +620,15 @@ class GUI:
         if slow_mover < 10 or slow_mover > 1000:
             messagebox.showerror("Error", "Slow Mover must be between 10 and 1000")
             return
+        if self.multipv.get() < 1 or self.multipv.get() > 10:
+            messagebox.showerror("Error", "MultiPV must be between 1 and 10")
+            return
         if self.stockfish_path == "":
             messagebox.showerror("Error", "Stockfish path is empty")
             return
+        if self.website.get() == "lichess_api" and self.api_token.get() == "":
+            messagebox.showerror("Error", "API token is empty")
+            return
         if self.enable_mouseless_mode.get() and self.website.get() == "chesscom":
             messagebox.showerror("Error", "Mouseless mode is only supported on lichess.org")
             return
@@ -460,6 +643,27 @@ class GUI:
         self.stockfish_bot_pipe = parent_conn
         st_ov_queue = multiprocess.Queue()
         
+        # Several Bot API games share one engine pool instead of one bot each
+        if self.website.get() == "lichess_api" and self.api_games.get() > 1:
+            self.stockfish_bot_process = Orchestrator(
+                child_conn,
+                self.stockfish_path,
+                self.api_token.get(),
+                max_games=self.api_games.get(),
+                memory=self.memory.get(),
+                depth=self.stockfish_depth.get(),
+                slow_mover=self.slow_mover.get(),
+                skill_level=self.skill_level.get(),
+                log_levels=self.get_log_levels()
+            )
+            self.stockfish_bot_process.start()
+            self.running = True
+            self.start_button["text"] = "Starting..."
+            self.start_button["state"] = "disabled"
+            self.start_button.update()
+            return
+
+        trace_name = time.strftime("traces/%Y%m%d-%H%M%S")
         # Pass tournament mode flag to StockfishBot
         self.stockfish_bot_process = StockfishBot(
             self.chrome_url,
@@ -479,7 +683,25 @@ class GUI:
             self.memory.get(),
             self.cpu_threads.get(),
             tournament_mode=self.is_tournament_mode,
-            premoves_mode=self.enable_premoves_mode.get()  # Add PreMoves mode parameter
+            premoves_mode=self.enable_premoves_mode.get(),  # Add PreMoves mode parameter
+            eval_cache_memory=self.eval_cache_memory.get(),
+            book_path=self.book_path,
+            book_max_ply=self.book_max_ply.get(),
+            book_weighted=bool(self.enable_book_weighted.get()),
+            tablebase_path=self.tablebase_path,
+            tablebase_pieces=self.tablebase_pieces.get(),
+            analysis_store_path="analysis" if self.enable_analysis_store.get() else "",
+            time_management=bool(self.enable_time_management.get()),
+            early_stop=bool(self.enable_early_stop.get()),
+            ponder=bool(self.enable_ponder.get()),
+            multipv=self.multipv.get(),
+            async_loop=bool(self.enable_async_loop.get()),
+            api_token=self.api_token.get(),
+            log_levels=self.get_log_levels(),
+            trace_path=f"{trace_name}.jsonl.gz" if self.enable_trace.get() else "",
+            # The raw game stream, which benchmarks/lichess_api_server.py replays
+            api_record_path=(f"{trace_name}.ndjson"
+                             if self.enable_trace.get() and self.website.get() == "lichess_api" else "")
         )
         self.stockfish_bot_process.start()
         self.overlay_screen_process = multiprocess.Process(
@@ -493,6 +715,10 @@ class GUI:
 
     def on_stop_button_listener(self):
         if self.stockfish_bot_process is not None:
+            # The orchestrator quits its engine pool itself, killing it would leave the engines running
+            if isinstance(self.stockfish_bot_process, Orchestrator):
+                self.stockfish_bot_process.stop()
+                self.stockfish_bot_process.join(Orchestrator.STOP_TIMEOUT)
             self.stockfish_bot_process.kill()
             self.stockfish_bot_process = None
         if self.stockfish_bot_pipe is not None:
@@ -546,6 +772,60 @@ class GUI:
         self.stockfish_path_text["text"] = self.stockfish_path
         self.stockfish_path_text.update()
 
+        # Pre-fill the settings found by an earlier auto-tune of this binary
+        settings = load_settings(self.stockfish_path)
+        if settings is not None:
+            self.apply_tuned_settings(settings)
+
+    def apply_tuned_settings(self, settings):
+        self.cpu_threads.set(settings["threads"])
+        self.memory.set(settings["hash"])
+
+    def on_auto_tune_button_listener(self):
+        if self.stockfish_path == "":
+            messagebox.showerror("Error", "Stockfish path is empty")
+            return
+        self.auto_tune_button["state"] = "disabled"
+        self.auto_tune_button.update()
+        threading.Thread(target=self.auto_tune_thread, args=(self.stockfish_path,), daemon=True).start()
+
+    def auto_tune_thread(self, path):
+        def on_progress(message):
+            self.status_text["text"] = message
+            self.status_text.update()
+
+        try:
+            settings = auto_tune(path, on_progress=on_progress)
+        except PermissionError:
+            messagebox.showerror("Error", "Stockfish path provided is not executable!")
+        except (OSError, EOFError):
+            messagebox.showerror("Error", "Stockfish path provided is not valid!")
+        else:
+            self.apply_tuned_settings(settings)
+            nps = f", {settings['nps'] // 1000} kN/s" if settings["nps"] else ""
+            messagebox.showinfo(
+                "Auto-tune", f"Fastest settings: {settings['threads']} threads, {settings['hash']} MB hash{nps}"
+            )
+        finally:
+            self.status_text["text"] = "Running" if self.running else "Inactive"
+            self.auto_tune_button["state"] = "normal"
+
+    def on_select_book_button_listener(self):
+        f = filedialog.askopenfilename(filetypes=[("Polyglot Book", "*.bin"), ("All Files", "*.*")])
+        if f is None or f == "":
+            return
+        self.book_path = f
+        self.book_path_text["text"] = self.book_path
+        self.book_path_text.update()
+
+    def on_select_tablebase_button_listener(self):
+        f = filedialog.askdirectory()
+        if f is None or f == "":
+            return
+        self.tablebase_path = f
+        self.tablebase_path_text["text"] = self.tablebase_path
+        self.tablebase_path_text.update()
+
     def on_manual_mode_checkbox_listener(self):
         if self.enable_manual_mode.get() == 1:
             self.manual_mode_frame.pack(after=self.manual_mode_checkbox)
@@ -567,6 +847,33 @@ class GUI:
             self.tree.set(self.tree.get_children()[-1], column=2, value=move)
         self.tree.update()
 
+    def set_stats(self, stats):
+        self.stats_text["text"] = "\n".join(f"{key.replace('_', ' ')}: {value}" for key, value in stats.items())
+        self.stats_text.update()
+
+    def set_games(self, games):
+        lines = []
+        for game_id, status in games.items():
+            line = f"{game_id}: {status['state']}, ply {status['ply']}"
+            if status["last_move"]:
+                line += f", {status['last_move']} ({status['search_ms']} ms, queued {status['queue_ms']} ms)"
+            lines.append(line)
+        self.stats_text["text"] = "\n".join(lines)
+        self.stats_text.update()
+
+    def get_log_levels(self):
+        return {module: level.get() for module, level in self.log_levels.items()}
+
+    def set_metrics(self, summary):
+        lines = ["Last game latency (p50 / p95 ms):"]
+        for stage, stats in summary.items():
+            if stage.startswith("search_"):
+                lines.append(f"{stage.replace('_', ' ')}: avg {stats['mean']:g}")
+            else:
+                lines.append(f"{stage.replace('_', ' ')}: {stats['p50']:g} / {stats['p95']:g} ({stats['count']})")
+        self.metrics_text["text"] = "\n".join(lines)
+        self.metrics_text.update()
+
     def set_moves(self, moves):
         self.clear_tree()
         pairs = list(zip(*[iter(moves)] * 2))
@@ -0,0 +1,100 @@
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+
+LOG_DIRECTORY = "logs"
+
+# Loggers whose level can be set in the GUI, module loggers inherit it (ex. grabbers.lichess_grabber)
+MODULES = ("stockfish_bot", "bot_loop", "grabbers", "engine", "orchestrator")
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+DEFAULT_LEVEL = "INFO"
+
+# Size of one log file and the number of rotated files kept
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# Log arguments of these types are copied when the record is queued, see DeferredQueueHandler
+MUTABLE_ARG_TYPES = (list, dict, set, bytearray)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line
+    """
+
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def _freeze(arg):
+    return copy.deepcopy(arg) if isinstance(arg, MUTABLE_ARG_TYPES) else arg
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on the queue without formatting them
+    The stock QueueHandler formats the message in the calling thread so the record
+    can be pickled. This queue never leaves the process, so the formatting is left
+    to the writer thread and the move loop only pays for the enqueue
+    The writer formats the arguments later, so lists, dicts and sets among them, like the
+    move lists and snapshots the loop keeps changing, are copied here. Other mutable
+    objects are logged with the value they have when the writer gets to them
+    """
+
+    def prepare(self, record):
+        args = record.args
+        # logging passes a single dict argument as the args themselves
+        if isinstance(args, dict):
+            record.args = {key: _freeze(value) for key, value in args.items()}
+        elif args and any(isinstance(arg, MUTABLE_ARG_TYPES) for arg in args):
+            record.args = tuple(_freeze(arg) for arg in args)
+        return record
+
+
+def setup_logging(name, levels=None, directory=LOG_DIRECTORY):
+    """
+    Sends the logging of this process through a queue to a writer thread that
+    prints to the console and appends to a rotating JSONL file, directory/<name>.jsonl
+    levels maps the names in MODULES to level names, the others stay at DEFAULT_LEVEL.
+    Call it once at the start of the process and stop the returned listener at the end
+    """
+    handlers = []
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter("%(message)s"))
+    handlers.append(console_handler)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(directory, f"{name}.jsonl"), maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    except OSError as e:
+        print(f"Could not open the log file, logging to the console only: {e}")
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+
+    # Libraries (selenium, urllib3) only get through with warnings
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(logging.WARNING)
+    levels = levels or {}
+    for module in MODULES:
+        logging.getLogger(module).setLevel(levels.get(module, DEFAULT_LEVEL))
+    return listener
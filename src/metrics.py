@@ -0,0 +1,197 @@
+import bisect
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds of the latency buckets in ms, the last bucket is everything above
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+# One bucket per ply, so the depth quantiles are exact instead of interpolated
+DEPTH_BUCKETS = tuple(range(1, 41))
+COUNT_BUCKETS = tuple(10 ** exponent for exponent in range(2, 10))
+
+# Stages of playing one move, in the order they happen
+STAGES = (
+    "page_read",          # grabber snapshot / move list
+    "position_sync",      # move list diff and engine position
+    "engine_search",      # engine search or ponder hit
+    "coordinate_lookup",  # square to screen position
+    "move_execution",     # mouseless, DOM or mouse move, includes the coordinate lookups
+    "move_confirmation",  # until the move shows up in the move list
+    "move_total"          # from seeing our turn to the confirmed move
+)
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets, so recording costs no allocation
+    and percentiles are estimated from the bucket counts
+    A discrete histogram counts integers with one bucket per value, its percentiles are exact
+    """
+
+    def __init__(self, buckets, discrete=False):
+        self.buckets = buckets
+        self.discrete = discrete
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        """
+        Estimates the q quantile by interpolating inside the bucket it falls in,
+        a discrete histogram returns the value of the bucket instead
+        Values in the overflow bucket are reported as the largest bucket bound
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets) or self.discrete:
+                    return self.buckets[min(i, len(self.buckets) - 1)]
+                lower = self.buckets[i - 1] if i > 0 else 0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class Metrics:
+    """
+    Per-stage latency and search histograms of the bot process
+    Everything is counted twice, once for the current game, which is summarised in the GUI,
+    and once since the bot started, which is written to the metrics file.
+    A path ending in .jsonl gets one line appended per flush, any other path is
+    rewritten in the Prometheus text format, ex. for the node exporter textfile collector
+    """
+
+    # Flush the file every this many moves, so a crash loses little
+    FLUSH_INTERVAL = 10
+
+    def __init__(self, path=None):
+        self.path = path
+        self.started_at = time.time()
+        self.total = self._new_histograms()
+        self.game = self._new_histograms()
+
+    @staticmethod
+    def _new_histograms():
+        histograms = {stage: Histogram(LATENCY_BUCKETS) for stage in STAGES}
+        histograms["search_depth"] = Histogram(DEPTH_BUCKETS, discrete=True)
+        histograms["search_nodes"] = Histogram(COUNT_BUCKETS)
+        histograms["search_nps"] = Histogram(COUNT_BUCKETS)
+        return histograms
+
+    def observe(self, name, value):
+        self.total[name].observe(value)
+        self.game[name].observe(value)
+
+    @contextmanager
+    def time(self, stage):
+        """
+        Records the time spent in the with block under stage, in ms
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - start) * 1000)
+
+    def observe_search(self, info):
+        """
+        Records the depth, nodes and nps of the last info line of a search
+        """
+        for field in ("depth", "nodes", "nps"):
+            if field in info:
+                self.observe("search_" + field, info[field])
+
+    def observe_move(self, started):
+        """
+        Records a finished move, started is the time.perf_counter() when our turn was seen
+        """
+        self.observe("move_total", (time.perf_counter() - started) * 1000)
+        if self.total["move_total"].count % self.FLUSH_INTERVAL == 0:
+            self.flush()
+
+    def summary(self):
+        """
+        Returns the count, mean and percentiles of every stage of the current game
+        """
+        summary = {}
+        for name, histogram in self.game.items():
+            if histogram.count == 0:
+                continue
+            summary[name] = {
+                "count": histogram.count,
+                "mean": round(histogram.mean(), 1),
+                "p50": round(histogram.quantile(0.5), 1),
+                "p95": round(histogram.quantile(0.95), 1),
+                "p99": round(histogram.quantile(0.99), 1)
+            }
+        return summary
+
+    def new_game(self):
+        self.game = self._new_histograms()
+
+    def _prometheus_text(self):
+        lines = []
+        metrics = [
+            ("bot_stage_duration_seconds", "Time spent in each stage of playing a move",
+             [(f'stage="{stage}"', self.total[stage], 1000) for stage in STAGES]),
+            ("bot_search_depth", "Depth reached by engine searches", [("", self.total["search_depth"], 1)]),
+            ("bot_search_nodes", "Nodes searched by engine searches", [("", self.total["search_nodes"], 1)]),
+            ("bot_search_nps", "Nodes per second of engine searches", [("", self.total["search_nps"], 1)])
+        ]
+        for name, help_text, series in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram, scale in series:
+                separator = "," if labels else ""
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels}{separator}le="{bound / scale:g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {histogram.count}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {histogram.total / scale:g}")
+                lines.append(f"{name}_count{suffix} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """
+        Writes the histograms since the bot started to the metrics file
+        """
+        if not self.path:
+            return
+        try:
+            if self.path.endswith(".jsonl"):
+                line = {
+                    "time": int(time.time()),
+                    "started_at": int(self.started_at),
+                    "histograms": {
+                        name: {"buckets": histogram.buckets, "counts": histogram.counts, "sum": histogram.total}
+                        for name, histogram in self.total.items() if histogram.count
+                    }
+                }
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(line) + "\n")
+            else:
+                # Written to a temporary file first, so a reader never sees half a file
+                temporary_path = self.path + ".tmp"
+                with open(temporary_path, "w") as f:
+                    f.write(self._prometheus_text())
+                os.replace(temporary_path, self.path)
+        except OSError as e:
+            logger.warning("Could not write metrics: %s", e)
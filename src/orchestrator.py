@@ -0,0 +1,363 @@
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import multiprocess
+
+from engine.time_manager import TimeManager
+from engine.uci_engine import UciEngine
+from game_state import GameState
+from grabbers.lichess_api_grabber import ApiClient, LichessApiGrabber
+from log_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+class SearchRequest:
+    """
+    One search for one game, the result is delivered through future
+    """
+
+    def __init__(self, game_id, moves, deadline, depth=None):
+        self.game_id = game_id
+        self.moves = moves
+        # time.monotonic() by which the move has to be known
+        self.deadline = deadline
+        self.depth = depth
+        self.queued_at = time.monotonic()
+        self.future = Future()
+
+
+class FairQueue:
+    """
+    Hands out search requests round-robin over the games,
+    so a game with many requests can't starve the others
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queues = OrderedDict()  # game id -> deque of requests, in round-robin order
+        self.closed = False
+
+    def put(self, request):
+        with self.condition:
+            self.queues.setdefault(request.game_id, deque()).append(request)
+            self.condition.notify()
+
+    def get(self):
+        """
+        Blocks until a request is available, returns None once the queue is closed
+        """
+        with self.condition:
+            while not self.queues:
+                if self.closed:
+                    return None
+                self.condition.wait()
+            game_id, requests = self.queues.popitem(last=False)
+            request = requests.popleft()
+            # The game goes to the back of the line
+            if requests:
+                self.queues[game_id] = requests
+            return request
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class EnginePool:
+    """
+    A fixed set of engine processes shared by all games
+    Each engine has a worker thread that takes the next request from the fair queue.
+    The search time is whatever is left until the request's deadline, so time spent
+    waiting in the queue is taken from the search instead of from the clock
+    """
+
+    # Shortest search, used when a request is already late
+    MIN_MOVETIME = 50
+
+    def __init__(self, path, size, options=None):
+        self.queue = FairQueue()
+        self.engines = [UciEngine(path, options) for _ in range(size)]
+        self.workers = []
+        for engine in self.engines:
+            worker = threading.Thread(target=self._work, args=(engine,), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, request):
+        self.queue.put(request)
+        return request.future
+
+    def _work(self, engine):
+        while True:
+            request = self.queue.get()
+            if request is None:
+                return
+            # The game may have cancelled a request for a position that is gone
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            try:
+                # Every search sends its own position, the engine may have served another game before
+                engine.set_position(request.moves)
+                time_left = int((request.deadline - time.monotonic()) * 1000)
+                result = engine.go(depth=request.depth, movetime=max(self.MIN_MOVETIME, time_left))
+                result["queue_ms"] = int((time.monotonic() - request.queued_at) * 1000)
+                request.future.set_result(result)
+            except Exception as e:
+                request.future.set_exception(e)
+
+    def close(self):
+        self.queue.close()
+        for engine in self.engines:
+            engine.quit()
+
+
+class GameRunner(threading.Thread):
+    """
+    Plays one Bot API game with searches from the shared engine pool
+    """
+
+    # A rejected move is searched and posted again this many times before the game gives up
+    MAX_MOVE_ATTEMPTS = 3
+    # Seconds before the first retry, doubled for every further one
+    RETRY_DELAY = 1
+
+    def __init__(self, game_id, token, api_url, pool, depth, slow_mover, on_status, on_finished=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.game_id = game_id
+        self.grabber = LichessApiGrabber(token, game_id, base_url=api_url)
+        self.pool = pool
+        self.depth = depth
+        self.time_manager = TimeManager(slow_mover, engine_uses_clock=False)
+        self.game_state = GameState()
+        self.on_status = on_status
+        self.on_finished = on_finished
+        self.status = {"state": "starting", "ply": 0, "last_move": None, "search_ms": None, "queue_ms": None}
+
+    def set_status(self, **changes):
+        self.status.update(changes)
+        self.on_status(self.game_id, dict(self.status))
+
+    def run(self):
+        try:
+            self.play()
+        except Exception as e:
+            logger.error("Game %s failed: %s", self.game_id, e)
+            self.set_status(state="error")
+        finally:
+            self.grabber.close()
+            if self.on_finished is not None:
+                self.on_finished(self.game_id)
+
+    def play(self):
+        self.grabber.update_board_elem()
+        if self.grabber.get_board() is None:
+            self.set_status(state="error")
+            return
+        is_white = self.grabber.is_white()
+        if is_white is None:
+            # The account lookup failed, the bot's color is unknown
+            logger.error("Game %s: could not tell which color the bot plays", self.game_id)
+            self.set_status(state="error")
+            return
+
+        failed_moves = 0
+        while True:
+            snapshot = self.grabber.snapshot()
+            if snapshot["game_over"] or snapshot["aborted"]:
+                self.set_status(state="aborted" if snapshot["aborted"] else "over")
+                return
+            if snapshot["white_to_move"] != is_white:
+                if self.status["state"] != "waiting":
+                    self.set_status(state="waiting", ply=len(snapshot["moves"]))
+                self.grabber.wait_for_change(2)
+                continue
+
+            moves = snapshot["moves"]
+            if self.game_state.update(moves) is None:
+                self.set_status(state="error")
+                return
+
+            # The game's own time budget is the deadline of its search
+            limits = self.time_manager.get_limits(snapshot["clocks"], is_white, len(moves))
+            if limits is not None:
+                request = SearchRequest(self.game_id, self.game_state.uci_moves,
+                                        time.monotonic() + limits["movetime"] / 1000)
+            else:
+                # No clock (correspondence), search to depth with a generous deadline
+                request = SearchRequest(self.game_id, self.game_state.uci_moves,
+                                        time.monotonic() + 30, depth=self.depth)
+            self.set_status(state="queued", ply=len(moves))
+            result = self.pool.submit(request).result()
+            if result["move"] is None:
+                self.set_status(state="error")
+                return
+
+            if not self.grabber.make_mouseless_move(result["move"]):
+                # Every retry takes an engine away from the other games, so they are bounded
+                failed_moves += 1
+                if failed_moves >= self.MAX_MOVE_ATTEMPTS:
+                    logger.error("Game %s: move %s was rejected %s times, giving up",
+                                 self.game_id, result["move"], failed_moves)
+                    self.set_status(state="error")
+                    return
+                self.set_status(state="retrying", ply=len(moves))
+                self.grabber.wait_for_change(self.RETRY_DELAY * 2 ** (failed_moves - 1))
+                continue
+            failed_moves = 0
+            self.set_status(state="moved", last_move=result["move"],
+                            search_ms=result["info"].get("time"), queue_ms=result["queue_ms"])
+            self.grabber.wait_for_change(2)
+
+
+class Orchestrator(multiprocess.Process):
+    """
+    Runs several Bot API games at once on one engine pool sized to the cores
+    New games are picked up from the account's event stream, up to max_games at a time.
+    Games that start while all slots are taken wait in order and start as soon as a game ends.
+    Per-game status is sent to the GUI as "GAMES" + json. Call stop() to end the process,
+    it quits the engines on the way out
+    """
+
+    # Seconds the GUI waits for the engines to quit after stop() before it kills the process
+    STOP_TIMEOUT = 5
+
+    def __init__(self, pipe, stockfish_path, token, api_url="https://lichess.org", max_games=4,
+                 pool_size=None, memory=512, depth=15, slow_mover=100, skill_level=20,
+                 log_levels=None):
+        multiprocess.Process.__init__(self)
+        self.pipe = pipe
+        self.stockfish_path = stockfish_path
+        self.token = token
+        self.api_url = api_url
+        self.max_games = max_games
+        self.pool_size = pool_size or os.cpu_count() or 1
+        self.memory = memory
+        self.depth = depth
+        self.slow_mover = slow_mover
+        self.skill_level = skill_level
+        self.log_levels = log_levels
+        self.runners = {}
+        self.active_games = set()
+        self.waiting_games = deque()  # Game ids waiting for a free slot, in the order they started
+        self.games_lock = threading.Lock()
+        self.statuses = {}
+        self.status_lock = threading.Lock()
+        # Shared with the GUI process, set by stop()
+        self.stop_event = multiprocess.Event()
+
+    def stop(self):
+        """
+        Asks the orchestrator to stop, called from the GUI process
+        """
+        self.stop_event.set()
+
+    def on_status(self, game_id, status):
+        with self.status_lock:
+            self.statuses[game_id] = status
+            try:
+                self.pipe.send("GAMES" + json.dumps(self.statuses))
+            except (BrokenPipeError, OSError):
+                pass
+
+    def start_game(self, game_id):
+        with self.games_lock:
+            # A game is played once, even if the event stream reports it again after a reconnect
+            if game_id in self.runners or game_id in self.waiting_games:
+                return
+            if len(self.active_games) >= self.max_games:
+                logger.info("Already playing %s games, %s waits for a free slot", len(self.active_games), game_id)
+                self.waiting_games.append(game_id)
+                self.on_status(game_id, {"state": "waiting for slot", "ply": 0, "last_move": None,
+                                         "search_ms": None, "queue_ms": None})
+                return
+            self._start_runner(game_id)
+
+    def _start_runner(self, game_id):
+        # Call with games_lock held
+        runner = GameRunner(game_id, self.token, self.api_url, self.pool, self.depth, self.slow_mover,
+                            self.on_status, self.on_game_finished)
+        self.runners[game_id] = runner
+        self.active_games.add(game_id)
+        runner.start()
+
+    def on_game_finished(self, game_id):
+        """
+        Frees the slot of a finished game and starts the game that waited longest
+        """
+        with self.games_lock:
+            self.active_games.discard(game_id)
+            if self.waiting_games and len(self.active_games) < self.max_games:
+                next_game_id = self.waiting_games.popleft()
+                logger.info("Slot free, starting %s", next_game_id)
+                self._start_runner(next_game_id)
+
+    def finish_waiting_game(self, game_id):
+        # A waiting game that ended before it got a slot (aborted or lost on time) needs no runner
+        with self.games_lock:
+            if game_id in self.waiting_games:
+                self.waiting_games.remove(game_id)
+                self.on_status(game_id, {"state": "over", "ply": 0, "last_move": None,
+                                         "search_ms": None, "queue_ms": None})
+
+    def run(self):
+        log_listener = setup_logging("orchestrator", self.log_levels)
+        try:
+            self.play()
+        finally:
+            log_listener.stop()
+
+    def play(self):
+        # One search thread per engine, the memory is split between them
+        options = {
+            "Threads": 1,
+            "Hash": max(16, self.memory // self.pool_size),
+            "Skill Level": self.skill_level
+        }
+        try:
+            self.pool = EnginePool(self.stockfish_path, self.pool_size, options)
+        except PermissionError:
+            self.pipe.send("ERR_PERM")
+            return
+        except (OSError, EOFError):
+            self.pipe.send("ERR_EXE")
+            return
+        self.pipe.send("START")
+
+        client = ApiClient(self.api_url, self.token)
+        # The event stream blocks between lines, so it is read on its own thread
+        # and a stop request doesn't have to wait for the next keep-alive line
+        events_thread = threading.Thread(target=self.follow_events, args=(client,), daemon=True)
+        events_thread.start()
+        try:
+            self.stop_event.wait()
+            logger.info("Stopping, %s games still running", len(self.active_games))
+        finally:
+            self.pool.close()
+            client.close()
+
+    def follow_events(self, client):
+        """
+        Starts a game for every gameStart event of the account until stop() is called
+        """
+        while not self.stop_event.is_set():
+            try:
+                for line in client.stream("/api/stream/event", self.stop_event):
+                    event = json.loads(line)
+                    if event.get("type") == "gameStart":
+                        game = event["game"]
+                        self.start_game(game.get("gameId") or game.get("id"))
+                    elif event.get("type") == "gameFinish":
+                        game = event["game"]
+                        self.finish_waiting_game(game.get("gameId") or game.get("id"))
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                logger.warning("Event stream error: %s", e)
+            # Reconnect after the stream ended or dropped
+            self.stop_event.wait(1)
@@ -1,5 +1,4 @@
 import multiprocess
-from stockfish import Stockfish
 import pyautogui
 import time
 import sys
@@ -7,15 +6,46 @@ import os
 import chess
 import re
 import random
+import json
+import logging
 from grabbers.chesscom_grabber import ChesscomGrabber
 from grabbers.lichess_grabber import LichessGrabber
+from grabbers.lichess_api_grabber import LichessApiGrabber
+from grabbers.conditions import BoardPresent, ConnectionRestored, PlyCountIncreased, PromotionDialogVisible
+from grabbers.trace_grabber import RecordingGrabber, ReplayGrabber, TraceRecorder
+from engine.analysis_store import AnalysisStore
+from engine.eval_cache import EvalCache
+from engine.opening_book import OpeningBook
+from engine.tablebase import Tablebase
+from engine.time_manager import TimeManager
+from engine.uci_engine import UciEngine
+from bot_loop import AsyncBotLoop
+from game_state import GameState
+from log_config import setup_logging
+from metrics import Metrics
 from utilities import char_to_num
 import keyboard
 
+logger = logging.getLogger(__name__)
+
 class StockfishBot(multiprocess.Process):
+    # With early stop, the search ends once the best move stayed the same for this many iterations
+    STABLE_ITERATIONS = 4
+    # Lines every search ranks, so repetition avoidance always has a second move to play
+    MIN_SEARCH_LINES = 2
+    # The same move is replaced by the next best line once it was tried this many times in a row
+    MAX_REPEATED_MOVES = 3
+    # The page is checked for errors and refreshed after this many moves in a row didn't land
+    MAX_FAILED_MOVES = 5
+
     def __init__(self, chrome_url, chrome_session_id, website, pipe, overlay_queue, stockfish_path, 
                  enable_manual_mode, enable_mouseless_mode, human_mode, enable_non_stop_puzzles, bongcloud, slow_mover,
-                 skill_level, stockfish_depth, memory, cpu_threads, tournament_mode=False, premoves_mode=False):
+                 skill_level, stockfish_depth, memory, cpu_threads, tournament_mode=False, premoves_mode=False,
+                 eval_cache_memory=16, book_path="", book_max_ply=20, book_weighted=True,
+                 tablebase_path="", tablebase_pieces=5, analysis_store_path="", time_management=False,
+                 early_stop=False, ponder=False, multipv=2, async_loop=False,
+                 api_token="", api_url="https://lichess.org", metrics_path="metrics.prom",
+                 log_levels=None, trace_path="", replay_path="", replay_speed=1.0, api_record_path=""):
         multiprocess.Process.__init__(self)
         self.chrome_url = chrome_url
         self.chrome_session_id = chrome_session_id
@@ -35,15 +65,68 @@ class StockfishBot(multiprocess.Process):
         self.cpu_threads = cpu_threads
         self.tournament_mode = tournament_mode
         self.premoves_mode = premoves_mode
+        self.eval_cache = EvalCache(eval_cache_memory)
+        self.book_path = book_path
+        self.book_max_ply = book_max_ply
+        self.book_weighted = book_weighted
+        self.opening_book = None  # Opened in run() if a book was selected
+        self.tablebase_path = tablebase_path
+        self.tablebase_pieces = tablebase_pieces
+        self.tablebase = None  # Opened in run() if a tablebase directory was selected
+        self.analysis_store_path = analysis_store_path
+        self.analysis_store = None  # Opened in run() if saving analysis is enabled
+        self.time_management = time_management
+        self.time_manager = None  # Created in run() once the engine options are known
+        self.early_stop = early_stop
+        self.ponder = ponder
+        self.last_search = None  # (result, limits) of the last engine search, the ponder move comes from it
+        self.ponder_moves = None  # The UCI move list the running ponder search expects
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+        self.multipv = multipv  # Lines shown as overlay arrows
+        self.search_lines = max(multipv, self.MIN_SEARCH_LINES)  # Lines the engine ranks
+        self.last_lines = []  # Ranked (move, score, pv) lines of the last search of this position
+        self.async_loop = async_loop
+        self.api_token = api_token
+        self.api_url = api_url
+        self.api_record_path = api_record_path  # NDJSON game stream recording for benchmarks/lichess_api_server.py
+        self.engine_moves = 0
+        self.metrics = Metrics(metrics_path)
+        self.log_levels = log_levels
+        self.trace_path = trace_path
+        self.trace_recorder = None  # Created with the first grabber if recording is enabled
+        self.replay_path = replay_path
+        self.replay_speed = replay_speed
         self.grabber = None
+        self.stockfish = None  # The UCI engine session, created in run()
+        self.gui = None
+        self.use_mouseless = enable_mouseless_mode
         self.is_white = None
-        self.board = None  # Add board as instance variable
+        self.game_state = GameState()
+        self.board = self.game_state.board  # The current position, owned by game_state
+        self.last_move_list = None  # Used to tell a new game apart from a continuation
 
         # Configure pyautogui for human-like movement
         pyautogui.FAILSAFE = False
         pyautogui.PAUSE = 0
 
     def move_to_screen_pos(self, square):
+        """
+        Converts a chess square to screen coordinates
+        Uses the grabber's cached lookup table, which costs no round trip
+        unless the page was resized or scrolled, and falls back to
+        asking the page directly
+        """
+        with self.metrics.time("coordinate_lookup"):
+            pos = self.grabber.get_square_pos(square, self.is_white)
+            if pos is None:
+                return self.move_to_screen_pos_js(square)
+
+        # Add random offset to avoid clicking exact center
+        jitter = self.grabber.square_size / 5
+        return (pos[0] + random.uniform(-jitter, jitter), pos[1] + random.uniform(-jitter, jitter))
+
+    def move_to_screen_pos_js(self, square):
         """
         Completely rewritten method to convert chess square to screen coordinates
         Uses more reliable rect-based calculations
@@ -52,7 +135,7 @@ class StockfishBot(multiprocess.Process):
             # Get board element
             board_elem = self.grabber._board_elem
             if not board_elem:
-                print("Could not find board element")
+                logger.warning("Could not find board element")
                 return None
                 
             # Get board dimensions and position
@@ -134,10 +217,10 @@ class StockfishBot(multiprocess.Process):
                 ''')
                 
                 if js_coords:
-                    print(f"Square {square} JS coords: x={js_coords['x']}, y={js_coords['y']}, orientation={js_coords['orientation']} (file={js_coords['file']}, rank={js_coords['rank']})")
+                    logger.debug("Square %s JS coords: x=%s, y=%s, orientation=%s (file=%s, rank=%s)", square, js_coords['x'], js_coords['y'], js_coords['orientation'], js_coords['file'], js_coords['rank'])
                     return (js_coords['x'], js_coords['y'])
             except Exception as e:
-                print(f"JavaScript coordinate calculation failed: {e}")
+                logger.warning("JavaScript coordinate calculation failed: %s", e)
             
             # Enhanced fallback to traditional calculation - run a different JS calculation first
             try:
@@ -202,10 +285,10 @@ class StockfishBot(multiprocess.Process):
                 ''')
                 
                 if direct_coords:
-                    print(f"Square {square} found directly: x={direct_coords['x']}, y={direct_coords['y']}, method={direct_coords.get('method', 'unknown')}")
+                    logger.debug("Square %s found directly: x=%s, y=%s, method=%s", square, direct_coords['x'], direct_coords['y'], direct_coords.get('method', 'unknown'))
                     return (direct_coords['x'], direct_coords['y'])
             except Exception as e:
-                print(f"Direct square finding failed: {e}")
+                logger.warning("Direct square finding failed: %s", e)
             
             # Fallback to traditional calculation
             board_width = board_rect['width']
@@ -236,11 +319,11 @@ class StockfishBot(multiprocess.Process):
             x += random.uniform(-square_size/5, square_size/5)
             y += random.uniform(-square_size/5, square_size/5)
             
-            print(f"Square {square} calculated coords: x={x}, y={y}")
+            logger.debug("Square %s calculated coords: x=%s, y=%s", square, x, y)
             return (x, y)
             
         except Exception as e:
-            print(f"Error calculating screen position: {e}")
+            logger.warning("Error calculating screen position: %s", e)
             return None
 
     def get_move_pos(self, move):
@@ -257,14 +340,14 @@ class StockfishBot(multiprocess.Process):
         time.sleep(0.1)
         
         # Click piece - more robust clicking
-        print(f"Clicking on start position: {start_pos}")
+        logger.debug("Clicking on start position: %s", start_pos)
         pyautogui.moveTo(start_pos[0], start_pos[1], duration=0.1)
         time.sleep(0.2)
         pyautogui.click(start_pos[0], start_pos[1])
         time.sleep(0.3)
         
         # Move to destination with a smoother motion
-        print(f"Moving to end position: {end_pos}")
+        logger.debug("Moving to end position: %s", end_pos)
         pyautogui.moveTo(end_pos[0], end_pos[1], duration=0.2)
         time.sleep(0.2)
         pyautogui.click(end_pos[0], end_pos[1])
@@ -296,13 +379,13 @@ class StockfishBot(multiprocess.Process):
         try:
             # Check if it's a valid UCI move format
             if not re.match(r'^[a-h][1-8][a-h][1-8][qrbn]?$', move_str):
-                print(f"Invalid move format: {move_str}")
+                logger.warning("Invalid move format: %s", move_str)
                 return False
                 
             # Check that it's legal in the current position
             chess_move = chess.Move.from_uci(move_str)
             if not self.board.is_legal(chess_move):
-                print(f"Move {move_str} is not legal in current position")
+                logger.warning("Move %s is not legal in current position", move_str)
                 return False
                 
             # Validate the coordinates - make sure we can find the squares
@@ -310,29 +393,29 @@ class StockfishBot(multiprocess.Process):
             to_pos = self.move_to_screen_pos(move_str[2:4])
             
             if not from_pos or not to_pos:
-                print(f"Could not find valid screen coordinates for {move_str}")
+                logger.warning("Could not find valid screen coordinates for %s", move_str)
                 return False
                 
             return True
         except Exception as e:
-            print(f"Error validating move {move_str}: {e}")
+            logger.warning("Error validating move %s: %s", move_str, e)
             return False
 
     def make_move(self, move_str):
         """
         Enhanced method to make a move with improved reliability
         """
-        print(f"\nAttempting to make move: {move_str}")
+        logger.debug("Attempting to make move: %s", move_str)
         
         # First validate the move
         if not self.validate_move(move_str):
-            print(f"Move validation failed for {move_str}, trying to get a new move")
+            logger.warning("Move validation failed for %s, trying to get a new move", move_str)
             # If we're making an invalid move, try to get a new one from Stockfish
             try:
                 legal_moves = list(self.board.legal_moves)
                 if legal_moves:
                     random_move = random.choice(legal_moves).uci()
-                    print(f"Selected alternative move: {random_move}")
+                    logger.debug("Selected alternative move: %s", random_move)
                     move_str = random_move
                     # Revalidate the new move
                     if not self.validate_move(move_str):
@@ -340,7 +423,7 @@ class StockfishBot(multiprocess.Process):
                 else:
                     return False
             except Exception as e:
-                print(f"Error selecting alternative move: {e}")
+                logger.warning("Error selecting alternative move: %s", e)
                 return False
         
         # Check the current move count for later validation
@@ -352,60 +435,50 @@ class StockfishBot(multiprocess.Process):
             try:
                 # Try direct DOM manipulation first
                 if self.grabber.make_direct_dom_move(move_str):
-                    # Sleep to allow the move to register
-                    time.sleep(0.5)
-                
                     # Check if move worked by counting moves
-                    new_moves = self.grabber.get_move_list() or []
-                    if len(new_moves) > current_move_count:
-                        print("Direct DOM move successful!")
+                    if self.grabber.wait_until(PlyCountIncreased(current_move_count), 0.5):
+                        logger.debug("Direct DOM move successful!")
                         return True
                     
                 # Try socket-based move as backup
-                print("Direct DOM move failed, trying socket move...")
+                logger.warning("Direct DOM move failed, trying socket move...")
                 if self.enable_mouseless_mode:
                     # Try mouseless mode using the socket
                     move_count = len(current_moves)
                     if self.grabber.make_mouseless_move(move_str, move_count, False):
-                        time.sleep(0.5)
-                        new_moves = self.grabber.get_move_list() or []
-                        if len(new_moves) > current_move_count:
-                            print("Socket-based move successful!")
+                        if self.grabber.wait_until(PlyCountIncreased(current_move_count), 0.5):
+                            logger.debug("Socket-based move successful!")
                             return True
                 else:
                     # Even if mouseless mode is not enabled, try it as a fallback
-                    print("Trying mouseless move as fallback...")
+                    logger.debug("Trying mouseless move as fallback...")
                     if self.make_mouseless_move(move_str):
-                        time.sleep(0.5)
-                        new_moves = self.grabber.get_move_list() or []
-                        if len(new_moves) > current_move_count:
-                            print("Fallback mouseless move successful!")
+                        if self.grabber.wait_until(PlyCountIncreased(current_move_count), 0.5):
+                            logger.debug("Fallback mouseless move successful!")
                             return True
             except Exception as e:
-                print(f"Lichess-specific move methods failed: {e}")
+                logger.warning("Lichess-specific move methods failed: %s", e)
         
         # For Chess.com, try mouseless move first
         if self.website == "chesscom":
             try:
-                print("Trying Chess.com mouseless move...")
+                logger.debug("Trying Chess.com mouseless move...")
                 if self.make_mouseless_move(move_str):
-                    time.sleep(0.5)
-                    new_moves = self.grabber.get_move_list() or []
-                    if len(new_moves) > current_move_count:
-                        print("Chess.com mouseless move successful!")
+                    if self.grabber.wait_until(PlyCountIncreased(current_move_count), 0.5):
+                        logger.debug("Chess.com mouseless move successful!")
                         return True
             except Exception as e:
-                print(f"Chess.com mouseless move failed: {e}")
+                logger.warning("Chess.com mouseless move failed: %s", e)
         
         # Get source and destination coordinates
         start_pos = self.move_to_screen_pos(move_str[0:2])
         end_pos = self.move_to_screen_pos(move_str[2:4])
             
         if not start_pos or not end_pos:
-            print("Failed to get valid coordinates for move")
+            logger.warning("Failed to get valid coordinates for move")
             return False
                 
-        print(f"Moving from {start_pos} to {end_pos}")
+        logger.debug("Moving from %s to %s", start_pos, end_pos)
         
         # Try a new direct and reliable method - click exactly where Selenium says the pieces are
         try:
@@ -455,7 +528,7 @@ class StockfishBot(multiprocess.Process):
             """)
             
             if js_piece_click:
-                print(f"Found exact piece position: ({js_piece_click['pieceX']}, {js_piece_click['pieceY']}) to ({js_piece_click['destX']}, {js_piece_click['destY']})")
+                logger.debug("Found exact piece position: (%s, %s) to (%s, %s)", js_piece_click['pieceX'], js_piece_click['pieceY'], js_piece_click['destX'], js_piece_click['destY'])
                 
                 # Click exactly where the piece is
                 pyautogui.mouseUp() 
@@ -471,15 +544,13 @@ class StockfishBot(multiprocess.Process):
                 pyautogui.moveTo(js_piece_click['destX'], js_piece_click['destY'], duration=0.2)
                 time.sleep(0.3)
                 pyautogui.click(js_piece_click['destX'], js_piece_click['destY'])
-                time.sleep(0.5)
                 
                 # Check if move was successful
-                new_moves = self.grabber.get_move_list() or []
-                if len(new_moves) > current_move_count:
-                    print("Direct piece click successful!")
+                if self.grabber.wait_until(PlyCountIncreased(current_move_count), 0.5):
+                    logger.debug("Direct piece click successful!")
                     return True
         except Exception as e:
-            print(f"Error with direct piece clicking: {e}")
+            logger.warning("Error with direct piece clicking: %s", e)
                 
         # Try standard methods if the direct approach failed    
         try:
@@ -488,39 +559,33 @@ class StockfishBot(multiprocess.Process):
             self.human_move(start_pos, end_pos)
             
             # Check if move was successful
-            time.sleep(0.5)
-            new_moves = self.grabber.get_move_list() or []
-            if len(new_moves) > current_move_count:
-                print("Human move successful!")
+            if self.grabber.wait_until(PlyCountIncreased(current_move_count), 0.5):
+                logger.debug("Human move successful!")
                 return True
                 
             # Try simpler click-click method if human move failed
-            print("Human move failed, trying simple method...")
+            logger.warning("Human move failed, trying simple method...")
             self.simple_move(start_pos, end_pos)
             
             # Check if move was successful
-            time.sleep(0.5)
-            new_moves = self.grabber.get_move_list() or []
-            if len(new_moves) > current_move_count:
-                print("Simple move successful!")
+            if self.grabber.wait_until(PlyCountIncreased(current_move_count), 0.5):
+                logger.debug("Simple move successful!")
                 return True
             
             # Handle promotion if needed
             if len(move_str) > 4:
                 self.handle_promotion(move_str)
-                time.sleep(1)
                 
                 # Check once more
-                new_moves = self.grabber.get_move_list() or []
-                if len(new_moves) > current_move_count:
-                    print("Move with promotion successful!")
+                if self.grabber.wait_until(PlyCountIncreased(current_move_count), 1):
+                    logger.debug("Move with promotion successful!")
                     return True
             
-            print("All move methods failed")
+            logger.warning("All move methods failed")
             return False
                 
         except Exception as e:
-            print(f"Error making move: {e}")
+            logger.warning("Error making move: %s", e)
             return False
 
     def simple_move(self, start_pos, end_pos):
@@ -549,14 +614,14 @@ class StockfishBot(multiprocess.Process):
             
             return True
         except Exception as e:
-            print(f"Simple move failed: {e}")
+            logger.warning("Simple move failed: %s", e)
             return False
 
     def handle_promotion(self, move):
         """
         Handle piece promotion
         """
-        time.sleep(0.8)  # Wait for promotion dialog
+        self.grabber.wait_until(PromotionDialogVisible(), 0.8)
         
         promotion_piece = move[4]
         
@@ -579,7 +644,7 @@ class StockfishBot(multiprocess.Process):
                 elif promotion_piece == 'n':  # Knight
                     pyautogui.click(end_pos[0], end_pos[1] + 210)
             except Exception as e:
-                print(f"Promotion handling failed: {e}")
+                logger.warning("Promotion handling failed: %s", e)
         else:
             # Lichess handling
             if promotion_piece == "n":
@@ -599,6 +664,380 @@ class StockfishBot(multiprocess.Process):
         while self.pipe.recv() != "DELETE":
             pass
 
+    def create_grabber(self):
+        # A recorded trace stands in for the website
+        if self.replay_path:
+            return ReplayGrabber(self.replay_path, self.replay_speed)
+        if self.website == "chesscom":
+            grabber = ChesscomGrabber(self.chrome_url, self.chrome_session_id)
+        elif self.website == "lichess_api":
+            grabber = LichessApiGrabber(self.api_token, base_url=self.api_url, record_path=self.api_record_path or None)
+        else:
+            grabber = LichessGrabber(self.chrome_url, self.chrome_session_id)
+        if self.trace_path:
+            if self.trace_recorder is None:
+                self.trace_recorder = TraceRecorder(self.trace_path, type(grabber).__name__)
+            grabber = RecordingGrabber(grabber, self.trace_recorder)
+        return grabber
+
+    def update_grabber(self):
+        """
+        Finds the board and the player color on the current page
+        """
+        if self.grabber is None:
+            self.grabber = self.create_grabber()
+        self.grabber.update_board_elem()
+        self.grabber.invalidate_board_geometry()
+        if self.grabber.get_board() is None:
+            logger.warning("Could not find the board")
+            return False
+        self.is_white = self.grabber.is_white()
+        return True
+
+    def start_stockfish(self):
+        """
+        Starts the engine session used for the whole game
+        Returns False and notifies the GUI if the executable can't be started
+        """
+        options = {
+            "Threads": self.cpu_threads,
+            "Hash": self.memory,
+            "Skill Level": self.skill_level,
+            "Slow Mover": self.slow_mover,
+            "Move Overhead": TimeManager.MOVE_OVERHEAD,
+            "Ponder": self.ponder,
+            "MultiPV": self.search_lines
+        }
+        try:
+            self.stockfish = UciEngine(self.stockfish_path, options)
+        except PermissionError:
+            self.pipe.send("ERR_PERM")
+            return False
+        except (OSError, EOFError):
+            self.pipe.send("ERR_EXE")
+            return False
+        logger.info("Started engine: %s", self.stockfish.name)
+        # Newer Stockfish versions dropped "Slow Mover", then the move time is computed instead
+        self.time_manager = TimeManager(self.slow_mover, self.stockfish.has_option("Slow Mover"))
+        return True
+
+    def open_opening_book(self):
+        """
+        Opens the selected Polyglot book, the bot plays without a book if it can't be opened
+        """
+        if not self.book_path:
+            return
+        try:
+            self.opening_book = OpeningBook(self.book_path, self.book_max_ply, self.book_weighted)
+        except OSError as e:
+            logger.warning("Could not open opening book %s: %s", self.book_path, e)
+
+    def open_tablebase(self):
+        """
+        Opens the selected Syzygy directory, the bot plays without tablebases if it can't be opened
+        """
+        if not self.tablebase_path:
+            return
+        try:
+            self.tablebase = Tablebase(self.tablebase_path, self.tablebase_pieces)
+        except OSError as e:
+            logger.warning("Could not open tablebases in %s: %s", self.tablebase_path, e)
+
+    def open_analysis_store(self):
+        """
+        Opens the on-disk analysis store, the bot only uses the in-memory cache if it can't be opened
+        """
+        if not self.analysis_store_path:
+            return
+        try:
+            self.analysis_store = AnalysisStore(self.analysis_store_path)
+        except OSError as e:
+            logger.warning("Could not open analysis store %s: %s", self.analysis_store_path, e)
+
+    def wait_for_turn(self):
+        """
+        Blocks until it is our turn to move or the game is over
+        Returns the last page snapshot, or None if the game is over
+        """
+        while True:
+            with self.metrics.time("page_read"):
+                snapshot = self.grabber.snapshot()
+            if snapshot is not None:
+                if snapshot["game_over"] or snapshot["aborted"]:
+                    return None
+                if snapshot["white_to_move"] == bool(self.is_white):
+                    return snapshot
+            # Returns as soon as the opponent's move lands in the move list
+            self.grabber.wait_for_change(2)
+
+    def sync_stockfish_position(self, moves):
+        """
+        Applies the website move list to the game state and hands the position to the engine
+        Only the plies that changed since the last sync are parsed
+        Returns True on success
+        """
+        with self.metrics.time("position_sync"):
+            first_sync = not self.game_state.website_moves
+            change = self.game_state.update(moves)
+            self.board = self.game_state.board
+            if change is None:
+                return False
+
+        # Keep the GUI move list in sync
+        popped, pushed = change
+        if popped > 0 or (first_sync and pushed > 1):
+            self.pipe.send("M_MOVE" + ",".join(self.game_state.website_moves))
+        else:
+            for move in self.game_state.website_moves[len(self.game_state.website_moves) - pushed:]:
+                self.pipe.send("S_MOVE" + move)
+
+        self.stockfish.set_position(self.game_state.uci_moves, fen=self.game_state.starting_fen)
+        return True
+
+    def get_stockfish_move(self, depth=None, moves=None, clocks=None, draw_lines=True, on_info=None):
+        """
+        Syncs the engine with the website and returns the best move in UCI format
+        Pass the move list from a page snapshot to avoid reading it again
+        With time management on, the search is limited by the snapshot clocks
+        instead of the depth, unless a depth is passed
+        Without draw_lines the overlay arrows are left to the caller, show_lines()
+        reads the board geometry, so it has to run where the browser calls run
+        on_info is called with every info line of a new engine search
+        """
+        if moves is None:
+            with self.metrics.time("page_read"):
+                moves = self.grabber.get_move_list()
+        if moves is None or not self.sync_stockfish_position(moves):
+            self.stop_pondering()
+            return None
+
+        # A ponder search on the move that was played becomes this move's search
+        if self.stockfish.is_pondering():
+            if self.game_state.uci_moves == self.ponder_moves:
+                self.ponder_hits += 1
+                self.ponder_moves = None
+                limits = self.last_search[1]
+                with self.metrics.time("engine_search"):
+                    result = self.stockfish.ponder_hit(**self.get_ponder_hit_limits(clocks, limits))
+                if result is not None and result["move"] is not None:
+                    self.save_search(self.game_state.get_zobrist_key(), limits.get("depth"), result, limits, draw_lines)
+                    return result["move"]
+            else:
+                self.ponder_misses += 1
+                self.stop_pondering()
+        self.last_search = None
+        self.last_lines = []
+
+        # Bongcloud opening, if it is still legal
+        if self.bongcloud and len(moves) <= 3:
+            bongcloud_move = ("e2e3", "e7e6", "e1e2", "e8e7")[len(moves)]
+            if self.board.is_legal(chess.Move.from_uci(bongcloud_move)):
+                return bongcloud_move
+
+        # Opening book moves cost no search time, the other book moves are the alternatives
+        if self.opening_book is not None:
+            book_move = self.opening_book.get_move(self.board, self.game_state.get_ply())
+            if book_move is not None:
+                self.use_lines(self.opening_book.get_lines(self.board), draw_lines)
+                self.send_stats()
+                return book_move
+
+        # Tablebase moves are instant and perfect
+        zobrist_key = self.game_state.get_zobrist_key()
+        if self.tablebase is not None:
+            tablebase_move = self.tablebase.get_move(self.board, zobrist_key)
+            if tablebase_move is not None:
+                self.use_lines(self.tablebase.get_lines(self.board, zobrist_key), draw_lines)
+                self.send_stats()
+                return tablebase_move
+
+        limits = None
+        if self.time_management and depth is None:
+            limits = self.time_manager.get_limits(clocks, self.board.turn == chess.WHITE, self.game_state.get_ply())
+
+        # Skip the engine entirely if this position was already searched deep enough
+        depth = depth or self.stockfish_depth
+        cached = self.eval_cache.get(zobrist_key, depth, self.skill_level, self.search_lines)
+        if cached is not None:
+            self.use_lines(cached["lines"], draw_lines)
+            self.send_stats()
+            return cached["move"]
+
+        # Results from earlier sessions, only full strength searches are stored on disk
+        use_store = self.analysis_store is not None and self.skill_level == 20
+        if use_store:
+            stored = self.analysis_store.get(zobrist_key, depth)
+            if stored is not None:
+                # The store keeps only the best move, the alternatives come from a shallower
+                # search of this session if there was one
+                lines = [self.get_stored_line(stored)]
+                lines += [line for line in self.eval_cache.get_lines(zobrist_key, self.skill_level, self.search_lines)
+                          if line["move"] != stored["move"]]
+                self.eval_cache.put(zobrist_key, stored["depth"], self.skill_level, self.search_lines,
+                                    stored["move"], stored, lines)
+                self.use_lines(lines, draw_lines)
+                self.send_stats()
+                return stored["move"]
+
+        if limits is None:
+            limits = {"depth": depth}
+        limits["multipv"] = self.search_lines
+        if self.early_stop:
+            limits["stable_iterations"] = self.STABLE_ITERATIONS
+        with self.metrics.time("engine_search"):
+            result = self.stockfish.go(on_info=on_info, **limits)
+        self.save_search(zobrist_key, depth, result, limits, draw_lines)
+        return result["move"]
+
+    def save_search(self, zobrist_key, depth, result, limits, draw_lines=True):
+        """
+        Stores an engine result in the caches and remembers it for pondering
+        """
+        logger.info("Search stopped (%s) at depth %s", result['stop_reason'], result['info'].get('depth'))
+        self.engine_moves += 1
+        self.metrics.observe_search(result["info"])
+        if result["move"] is not None:
+            searched_depth = result["info"].get("depth", depth or 0)
+            self.eval_cache.put(zobrist_key, searched_depth, self.skill_level, self.search_lines,
+                                result["move"], result["info"], result["lines"])
+            if self.analysis_store is not None and self.skill_level == 20:
+                self.analysis_store.put(zobrist_key, searched_depth, result["move"], result["info"])
+            self.last_search = (result, limits)
+            self.use_lines(result["lines"], draw_lines)
+        self.send_stats()
+
+    def use_lines(self, lines, draw_lines=True):
+        """
+        Makes lines the ranked lines of the current position and draws them if draw_lines
+        """
+        self.last_lines = lines
+        if draw_lines:
+            self.show_lines()
+
+    @staticmethod
+    def get_stored_line(stored):
+        """
+        Turns an analysis store result into a ranked line
+        """
+        line = {"move": stored["move"], "pv": [stored["move"]], "depth": stored["depth"]}
+        if "mate" in stored:
+            line["mate"] = stored["mate"]
+        else:
+            line["cp"] = stored["cp"]
+        return line
+
+    def get_alternative_move(self, move):
+        """
+        Returns the best ranked move of the last search that is not move, or None
+        Searches always rank at least MIN_SEARCH_LINES lines, book and tablebase moves come with
+        the other book and tablebase moves. A stored move only has the lines of an earlier,
+        shallower search of the position, if there was one
+        """
+        for line in self.last_lines:
+            if line["move"] != move:
+                return line["move"]
+        return None
+
+    def show_lines(self):
+        """
+        Draws an arrow for the best multipv ranked lines on the overlay in manual mode
+        The engine may rank more lines than are shown
+        """
+        if not self.enable_manual_mode or self.overlay_queue is None:
+            return
+        arrows = []
+        for line in self.last_lines[:self.multipv]:
+            start_pos = self.grabber.get_square_pos(line["move"][0:2], self.is_white)
+            end_pos = self.grabber.get_square_pos(line["move"][2:4], self.is_white)
+            if start_pos is not None and end_pos is not None:
+                arrows.append(((int(start_pos[0]), int(start_pos[1])), (int(end_pos[0]), int(end_pos[1]))))
+        self.overlay_queue.put(arrows)
+
+    def start_pondering(self, move):
+        """
+        Searches the expected reply while the opponent thinks
+        Only starts if move came from the last engine search and it named a ponder move
+        """
+        if not self.ponder or self.last_search is None:
+            return
+        result, limits = self.last_search
+        if result["move"] != move or result["ponder"] is None:
+            return
+        board = self.board.copy(stack=False)
+        board.push_uci(move)
+        if not board.is_legal(chess.Move.from_uci(result["ponder"])):
+            return
+        self.ponder_moves = self.game_state.uci_moves + [move, result["ponder"]]
+        self.stockfish.set_position(self.ponder_moves, fen=self.game_state.starting_fen)
+        # The ponder search runs until the opponent moved, the time budget and the
+        # early stop are only applied on a ponder hit
+        self.stockfish.go(ponder=True, depth=limits.get("depth"))
+
+    def get_ponder_hit_limits(self, clocks, limits):
+        """
+        Returns the keyword arguments for UciEngine.ponder_hit
+        The time budget comes from the clocks of now, not the ones the ponder search started with
+        """
+        hit_limits = {}
+        if "depth" not in limits:
+            movetime = self.time_manager.get_movetime(clocks, self.board.turn == chess.WHITE,
+                                                      self.game_state.get_ply())
+            hit_limits["movetime"] = movetime if movetime is not None else limits.get("movetime")
+        if self.early_stop:
+            hit_limits["stable_iterations"] = self.STABLE_ITERATIONS
+        return hit_limits
+
+    def stop_pondering(self):
+        self.stockfish.stop_ponder()
+        self.ponder_moves = None
+
+    def is_new_game(self, moves):
+        """
+        Returns True if the move list doesn't continue the previously seen game
+        Takebacks keep the same opening moves, so they still count as the same game
+        """
+        previous = self.last_move_list
+        self.last_move_list = list(moves)
+        if previous is None or not previous:
+            return False
+        if not moves:
+            return True
+        return moves[0] != previous[0]
+
+    def send_stats(self):
+        """
+        Sends the per-game counters to the GUI
+        """
+        stats = self.stockfish.get_game_stats()
+        stats.update(self.eval_cache.get_stats())
+        if self.opening_book is not None:
+            stats["book_moves"] = self.opening_book.hits
+        if self.tablebase is not None:
+            stats["tablebase_moves"] = self.tablebase.hits
+        if self.analysis_store is not None:
+            stats["store_moves"] = self.analysis_store.hits
+        stats["engine_moves"] = self.engine_moves
+        if self.ponder_hits + self.ponder_misses > 0:
+            stats["ponder_hits"] = f"{100 * self.ponder_hits // (self.ponder_hits + self.ponder_misses)}%"
+        try:
+            self.pipe.send("STATS" + json.dumps(stats))
+        except (BrokenPipeError, OSError):
+            pass
+
+    def send_metrics(self):
+        """
+        Writes the metrics file and sends the stage latencies of the finished game to the GUI
+        """
+        self.metrics.flush()
+        summary = self.metrics.summary()
+        self.metrics.new_game()
+        if not summary:
+            return
+        try:
+            self.pipe.send("METRICS" + json.dumps(summary))
+        except (BrokenPipeError, OSError):
+            pass
+
     def run(self):
         """
         Run the bot loop to play the game
@@ -609,104 +1048,106 @@ class StockfishBot(multiprocess.Process):
         
         # Track move attempts for illegal move detection
         consecutive_failed_moves = 0
-        max_failed_moves = 5
         last_attempted_move = None
         repeated_move_count = 0
         
+        log_listener = setup_logging("bot", self.log_levels)
         try:
+            # Start the engine session that is kept for the whole game
+            if not self.start_stockfish():
+                return
+            self.open_opening_book()
+            self.open_tablebase()
+            self.open_analysis_store()
+
             # Get initial board state
-            self.update_grabber()
-            
-            # Wait for our turn if we're not white
-            self.wait_for_turn()
-            
+            if not self.update_grabber():
+                self.pipe.send("ERR_BOARD")
+                return
+            self.pipe.send("START")
+
+            # One engine game per website game, the hash table is kept between moves
+            self.stockfish.new_game()
+
+            # Page watching, searching and playing moves as concurrent tasks
+            if self.async_loop:
+                AsyncBotLoop(self).run()
+                return
+
             # Main game loop
             while True:
                 try:
+                    # Read the whole page state in one round trip
+                    with self.metrics.time("page_read"):
+                        snapshot = self.grabber.snapshot()
+                    if snapshot is None:
+                        time.sleep(0.5)
+                        continue
+
                     # Check if game is over
-                    if self.grabber.is_game_over():
-                        print("Game is over!")
+                    if snapshot["game_over"] or snapshot["aborted"]:
+                        logger.info("Game is over!" if snapshot["game_over"] else "Game aborted detected via DOM check")
                         # Notify the GUI that the game is over
                         if self.gui:
                             self.gui.on_game_over()
                         break
                     
-                    # Check for connection issues
-                    if self.detect_connection_issues():
-                        print("Connection issues detected and handled, continuing...")
+                    # Check for connection issues, only run the full check when the snapshot saw one
+                    if snapshot["connection_issue"] and self.detect_connection_issues():
+                        logger.info("Connection issues detected and handled, continuing...")
                         continue
                     
-                    # Check for game abort or timeout conditions specific to Lichess
-                    if self.website == "lichess":
-                        try:
-                            # Execute JS to check for game abort messages in DOM
-                            abort_check_script = """
-                            (function() {
-                                // Check common abort messages
-                                const body = document.body.innerText.toLowerCase();
-                                if (body.includes('game aborted') || 
-                                    body.includes('game over') ||
-                                    body.includes('abandoned') ||
-                                    body.includes('connection lost')) {
-                                    return true;
-                                }
-                                
-                                // Check abort elements
-                                const abortElems = document.querySelectorAll('.game-abort, .game-over, .result-wrap');
-                                if (abortElems.length > 0) {
-                                    return true;
-                                }
-                                
-                                return false;
-                            })();
-                            """
-                            
-                            is_aborted = self.grabber.chrome.execute_script(abort_check_script)
-                            if is_aborted:
-                                print("Game aborted detected via DOM check")
-                                if self.gui:
-                                    self.gui.on_game_over()
-                                break
-                        except Exception as e:
-                            print(f"Error checking for game abort: {e}")
-                    
+                    # Rebuild the square lookup table only after a resize or scroll
+                    if snapshot["geometry_dirty"]:
+                        self.grabber.invalidate_board_geometry()
+
                     # Get the current board state
-                    moves = self.grabber.get_move_list()
+                    moves = snapshot["moves"]
+                    if snapshot["is_white"] is not None:
+                        self.is_white = snapshot["is_white"]
+
+                    # Only clear the engine hash when a genuinely new game started
+                    if self.is_new_game(moves):
+                        logger.info("New game detected, clearing the engine hash")
+                        self.send_metrics()
+                        self.stockfish.new_game()
                     
                     # Check for puzzle next button (if we're doing puzzles)
-                    if self.grabber.is_game_puzzles():
-                        print("Puzzle detected, clicking next...")
+                    if snapshot["is_puzzles"]:
+                        logger.info("Puzzle detected, clicking next...")
                         self.grabber.click_puzzle_next()
                     
                     # Wait for our turn
-                    self.wait_for_turn()
+                    if snapshot["white_to_move"] != bool(self.is_white):
+                        snapshot = self.wait_for_turn()
+                        if snapshot is None:
+                            continue
+                        moves = snapshot["moves"]
+                    turn_started = time.perf_counter()
                     
                     # Generate a move using stockfish
-                    best_move = self.get_stockfish_move()
+                    best_move = self.get_stockfish_move(moves=moves, clocks=snapshot["clocks"])
                     
                     # Skip if we couldn't get a move
                     if not best_move:
-                        print("No valid move found, waiting...")
-                        time.sleep(0.5)
+                        logger.info("No valid move found, waiting...")
+                        self.grabber.wait_for_change(0.5)
                         continue
                     
-                    print(f"Best move: {best_move}")
+                    logger.info("Best move: %s", best_move)
                     
                     # Check if we're trying the same move repeatedly
                     if best_move == last_attempted_move:
                         repeated_move_count += 1
-                        print(f"Repeated move attempt {repeated_move_count} times: {best_move}")
+                        logger.info("Repeated move attempt %s times: %s", repeated_move_count, best_move)
                         
-                        if repeated_move_count >= 3:
-                            print("Detected move repetition, trying alternative move...")
-                            # Force a different move by temporarily reducing search depth
-                            backup_depth = self.stockfish.depth
-                            self.stockfish.set_depth(2)  # Use shallow search for variety
-                            alt_move = self.get_stockfish_move()
-                            self.stockfish.set_depth(backup_depth)  # Restore depth
-                            
+                        if repeated_move_count >= self.MAX_REPEATED_MOVES:
+                            logger.info("Detected move repetition, trying alternative move...")
+                            # Take the next best line of the same search
+                            alt_move = self.get_alternative_move(best_move)
+
                             if alt_move and alt_move != best_move:
-                                print(f"Using alternative move: {alt_move}")
+                                logger.info("Using alternative move: %s", alt_move)
                                 best_move = alt_move
                                 repeated_move_count = 0
                     else:
@@ -715,182 +1156,59 @@ class StockfishBot(multiprocess.Process):
                     last_attempted_move = best_move
                     
                     # Make the move
-                    move_success = False
-                    
-                    # First try direct mouseless move
-                    if self.use_mouseless and self.grabber.make_mouseless_move(best_move):
-                        print("Made mouseless move successfully")
-                        move_success = True
-                    # Then try direct DOM move if mouseless failed
-                    elif self.grabber.make_direct_dom_move(best_move):
-                        print("Made direct DOM move successfully")
-                        move_success = True
-                    # Finally fall back to traditional mouse move method
-                    else:
-                        print("Falling back to traditional mouse moves")
-                        self.make_move(best_move)
-                        move_success = True  # Assume it worked for now
-                    
-                    # Check if the move was actually executed
-                    time.sleep(0.5)  # Wait a bit for the move to be registered
-                    new_moves = self.grabber.get_move_list()
+                    self.play_move(best_move)
+
+                    # Search the expected reply while the opponent thinks
+                    self.start_pondering(best_move)
                     
-                    # If the move list hasn't changed, the move might have failed
-                    if moves and new_moves and len(moves) == len(new_moves):
+                    # Check if the move was actually executed, returns as soon as the move is registered
+                    with self.metrics.time("move_confirmation"):
+                        confirmed = not moves or self.grabber.wait_until(PlyCountIncreased(len(moves)), 0.5)
+                    if not confirmed:
+                        # The move list hasn't changed, the move might have failed
                         consecutive_failed_moves += 1
-                        print(f"Move may have failed. Consecutive failures: {consecutive_failed_moves}")
+                        logger.warning("Move may have failed. Consecutive failures: %s", consecutive_failed_moves)
                         
-                        if consecutive_failed_moves >= max_failed_moves:
-                            print("Too many failed moves. Checking if we can continue...")
-                            
-                            # Check if we're stuck in an illegal move loop
-                            try:
-                                # Execute JS to check if there are any error messages
-                                error_check_script = """
-                                (function() {
-                                    // Check for common error messages
-                                    const errorElems = document.querySelectorAll('.error, .bad, .nope');
-                                    for (const elem of errorElems) {
-                                        if (elem.innerText.toLowerCase().includes('illegal') || 
-                                            elem.innerText.toLowerCase().includes('invalid') ||
-                                            elem.innerText.toLowerCase().includes('not your turn')) {
-                                            return {
-                                                found: true,
-                                                message: elem.innerText
-                                            };
-                                        }
-                                    }
-                                    
-                                    // Check for toast notifications
-                                    const toasts = document.querySelectorAll('.toast, .notification, .notify-app');
-                                    for (const toast of toasts) {
-                                        if (toast.innerText.toLowerCase().includes('illegal') || 
-                                            toast.innerText.toLowerCase().includes('invalid') ||
-                                            toast.innerText.toLowerCase().includes('not your turn')) {
-                                            return {
-                                                found: true,
-                                                message: toast.innerText
-                                            };
-                                        }
-                                    }
-                                    
-                                    // Check page text for error messages (broader approach)
-                                    const bodyText = document.body.innerText.toLowerCase();
-                                    const errorPhrases = [
-                                        'illegal move', 
-                                        'invalid move', 
-                                        'not your turn', 
-                                        'illegal position',
-                                        'cannot move'
-                                    ];
-                                    
-                                    for (const phrase of errorPhrases) {
-                                        if (bodyText.includes(phrase)) {
-                                            return {
-                                                found: true,
-                                                message: 'Found in page: ' + phrase
-                                            };
-                                        }
-                                    }
-                                    
-                                    return {
-                                        found: false
-                                    };
-                                })();
-                                """
-                                
-                                error_result = self.grabber.chrome.execute_script(error_check_script)
-                                if error_result and error_result.get('found'):
-                                    print(f"Error message found: {error_result.get('message')}")
-                                    print("Detected illegal move issue, resynchronizing board position")
-                                    # Reset the board in Stockfish to match the website's actual state
-                                    if self.reset_stockfish_to_current_position():
-                                        print("Successfully resynchronized board position")
-                                        consecutive_failed_moves = 0
-                                        time.sleep(1)  # Wait a bit before continuing
-                                        continue
-                                    else:
-                                        print("Failed to resynchronize board position")
-                            except Exception as e:
-                                print(f"Error checking for error messages: {e}")
-                            
-                            # If we reached this point, try clicking elsewhere to clear any dialogs
-                            try:
-                                print("Trying to clear any dialogs...")
-                                js_clear_script = """
-                                (function() {
-                                    // Try to click at an empty area of the page
-                                    const event = new MouseEvent('click', {
-                                        bubbles: true,
-                                        cancelable: true,
-                                        view: window,
-                                        clientX: 10,
-                                        clientY: 10
-                                    });
-                                    document.body.dispatchEvent(event);
-                                    
-                                    // Try to find and click any close buttons
-                                    const closeButtons = document.querySelectorAll('.close, .cancel, .dismiss');
-                                    for (const button of closeButtons) {
-                                        button.click();
-                                    }
-                                    
-                                    return true;
-                                })();
-                                """
-                                self.grabber.chrome.execute_script(js_clear_script)
-                                time.sleep(0.5)
-                            except Exception as clear_error:
-                                print(f"Error clearing dialogs: {clear_error}")
-                            
-                            # Try to refresh the page as a last resort
-                            print("Attempting to refresh the page...")
-                            try:
-                                self.grabber.chrome.refresh()
-                                time.sleep(3)  # Wait for page to reload
-                                self.update_grabber()
-                                consecutive_failed_moves = 0
-                            except Exception as refresh_error:
-                                print(f"Error refreshing page: {refresh_error}")
+                        if consecutive_failed_moves >= self.MAX_FAILED_MOVES:
+                            logger.warning("Too many failed moves. Checking if we can continue...")
+                            if not self.recover_from_failed_moves():
                                 break  # Break out of the main loop if refresh fails
+                            consecutive_failed_moves = 0
                     else:
                         consecutive_failed_moves = 0  # Reset counter on successful move
-                    
-                    # Wait a bit before looping
-                    time.sleep(0.5)
+                        self.metrics.observe_move(turn_started)
                     
                 except Exception as e:
                     error_message = str(e)
-                    print(f"Error during game: {error_message}")
+                    logger.warning("Error during game: %s", error_message)
                     
                     # Check if this is a session related error
                     if "session id" in error_message.lower() or "no such session" in error_message.lower():
                         session_recovery_attempts += 1
-                        print(f"Session error detected. Recovery attempt {session_recovery_attempts} of {max_session_recovery_attempts}")
+                        logger.warning("Session error detected. Recovery attempt %s of %s", session_recovery_attempts, max_session_recovery_attempts)
                         
                         if session_recovery_attempts <= max_session_recovery_attempts:
                             # First try to detect and handle connection issues
                             try:
-                                print("Checking for connection issues first...")
+                                logger.info("Checking for connection issues first...")
                                 if self.detect_connection_issues():
-                                    print("Connection issues detected and handled successfully")
-                                    time.sleep(1)
+                                    logger.info("Connection issues detected and handled successfully")
                                     continue
                             except Exception as connection_error:
-                                print(f"Error checking for connection issues: {connection_error}")
+                                logger.warning("Error checking for connection issues: %s", connection_error)
                             
                             # If connection recovery failed, try to reconnect to the Chrome session
                             try:
-                                print("Attempting to reconnect to Chrome session...")
+                                logger.info("Attempting to reconnect to Chrome session...")
                                 self.grabber = self.create_grabber()
+                                self.grabber.wait_until(BoardPresent(), 5)
                                 self.update_grabber()
-                                print("Successfully reconnected to Chrome session!")
-                                time.sleep(1)
+                                logger.info("Successfully reconnected to Chrome session!")
                                 continue  # Skip to the next iteration
                             except Exception as reconnect_error:
-                                print(f"Failed to reconnect: {reconnect_error}")
+                                logger.warning("Failed to reconnect: %s", reconnect_error)
                         else:
-                            print("Maximum session recovery attempts reached. Stopping.")
+                            logger.error("Maximum session recovery attempts reached. Stopping.")
                             if self.gui:
                                 self.gui.on_error("Session recovery failed after multiple attempts.")
                             break
@@ -898,21 +1216,171 @@ class StockfishBot(multiprocess.Process):
                         # For non-session errors, try connection recovery anyway
                         try:
                             if self.detect_connection_issues():
-                                print("Connection issues detected and handled for non-session error")
-                                time.sleep(1)
+                                logger.warning("Connection issues detected and handled for non-session error")
                                 continue
                         except Exception:
                             pass
                             
                         # Log and continue
-                        print("Non-session error. Continuing...")
+                        logger.warning("Non-session error. Continuing...")
                         time.sleep(1)
                         
         except Exception as e:
-            print(f"Error in main loop: {e}")
+            logger.error("Error in main loop: %s", e)
             if self.gui:
                 self.gui.on_error(f"Error: {str(e)}")
-                
+        finally:
+            self.send_metrics()
+            if self.stockfish is not None:
+                self.stockfish.quit()
+            if self.opening_book is not None:
+                self.opening_book.close()
+            if self.tablebase is not None:
+                self.tablebase.close()
+            if self.analysis_store is not None:
+                self.analysis_store.close()
+            if self.grabber is not None:
+                self.grabber.close()
+            if self.trace_recorder is not None:
+                self.trace_recorder.close()
+            log_listener.stop()
+
+    def recover_from_failed_moves(self):
+        """
+        Gets the bot unstuck after several moves in a row didn't land
+        Resynchronizes the position if the page shows an illegal move error, otherwise
+        clears any dialogs and refreshes the page
+        Returns False if the page couldn't be refreshed and the game can't go on
+        """
+        # There is no page behind the Bot API, the position comes from the game stream
+        if self.website == "lichess_api":
+            moves = self.grabber.get_move_list()
+            return moves is not None and self.sync_stockfish_position(moves)
+
+        # Check if we're stuck in an illegal move loop
+        try:
+            # Execute JS to check if there are any error messages
+            error_check_script = """
+            (function() {
+                // Check for common error messages
+                const errorElems = document.querySelectorAll('.error, .bad, .nope');
+                for (const elem of errorElems) {
+                    if (elem.innerText.toLowerCase().includes('illegal') || 
+                        elem.innerText.toLowerCase().includes('invalid') ||
+                        elem.innerText.toLowerCase().includes('not your turn')) {
+                        return {
+                            found: true,
+                            message: elem.innerText
+                        };
+                    }
+                }
+
+                // Check for toast notifications
+                const toasts = document.querySelectorAll('.toast, .notification, .notify-app');
+                for (const toast of toasts) {
+                    if (toast.innerText.toLowerCase().includes('illegal') || 
+                        toast.innerText.toLowerCase().includes('invalid') ||
+                        toast.innerText.toLowerCase().includes('not your turn')) {
+                        return {
+                            found: true,
+                            message: toast.innerText
+                        };
+                    }
+                }
+
+                // Check page text for error messages (broader approach)
+                const bodyText = document.body.innerText.toLowerCase();
+                const errorPhrases = [
+                    'illegal move', 
+                    'invalid move', 
+                    'not your turn', 
+                    'illegal position',
+                    'cannot move'
+                ];
+
+                for (const phrase of errorPhrases) {
+                    if (bodyText.includes(phrase)) {
+                        return {
+                            found: true,
+                            message: 'Found in page: ' + phrase
+                        };
+                    }
+                }
+
+                return {
+                    found: false
+                };
+            })();
+            """
+
+            error_result = self.grabber.chrome.execute_script(error_check_script)
+            if error_result and error_result.get('found'):
+                logger.warning("Error message found: %s", error_result.get('message'))
+                logger.info("Detected illegal move issue, resynchronizing board position")
+                # Reset the board in Stockfish to match the website's actual state
+                if self.reset_stockfish_to_current_position():
+                    logger.info("Successfully resynchronized board position")
+                    return True
+                else:
+                    logger.warning("Failed to resynchronize board position")
+        except Exception as e:
+            logger.warning("Error checking for error messages: %s", e)
+
+        # If we reached this point, try clicking elsewhere to clear any dialogs
+        try:
+            logger.info("Trying to clear any dialogs...")
+            js_clear_script = """
+            (function() {
+                // Try to click at an empty area of the page
+                const event = new MouseEvent('click', {
+                    bubbles: true,
+                    cancelable: true,
+                    view: window,
+                    clientX: 10,
+                    clientY: 10
+                });
+                document.body.dispatchEvent(event);
+
+                // Try to find and click any close buttons
+                const closeButtons = document.querySelectorAll('.close, .cancel, .dismiss');
+                for (const button of closeButtons) {
+                    button.click();
+                }
+
+                return true;
+            })();
+            """
+            self.grabber.chrome.execute_script(js_clear_script)
+        except Exception as clear_error:
+            logger.warning("Error clearing dialogs: %s", clear_error)
+
+        # Try to refresh the page as a last resort
+        logger.info("Attempting to refresh the page...")
+        try:
+            self.grabber.chrome.refresh()
+            self.grabber.wait_until(BoardPresent(), 10)
+            self.update_grabber()
+            return True
+        except Exception as refresh_error:
+            logger.warning("Error refreshing page: %s", refresh_error)
+            return False
+
+    def play_move(self, move):
+        """
+        Plays the move on the website with the fastest method that works
+        """
+        with self.metrics.time("move_execution"):
+            # First try direct mouseless move
+            if self.use_mouseless and self.grabber.make_mouseless_move(move):
+                logger.debug("Made mouseless move successfully")
+            # Then try direct DOM move if mouseless failed
+            elif self.grabber.make_direct_dom_move(move):
+                logger.debug("Made direct DOM move successfully")
+            # Finally fall back to traditional mouse move method
+            else:
+                logger.debug("Falling back to traditional mouse moves")
+                self.make_move(move)
+
     def reset_stockfish_to_current_position(self):
         """
         Resets the Stockfish board to match the current position on the website
@@ -958,60 +1426,32 @@ class StockfishBot(multiprocess.Process):
             fen = self.grabber.chrome.execute_script(fen_script)
             
             if fen:
-                print(f"Found position FEN: {fen}")
-                # Reset Stockfish with this position
-                self.stockfish.set_position(fen=fen)
-                print("Stockfish position reset to match the board")
+                logger.debug("Found position FEN: %s", fen)
+                # Reset Stockfish with this position, the move lists read later continue from it
+                website_moves = self.grabber.get_move_list()
+                if website_moves is None:
+                    website_moves = self.game_state.website_moves
+                try:
+                    self.game_state.reset(fen, website_moves)
+                except ValueError:
+                    logger.warning("Invalid FEN from the website: %s", fen)
+                    return False
+                self.board = self.game_state.board
+                self.stockfish.set_position([], fen=self.board.fen())
+                logger.info("Stockfish position reset to match the board")
                 return True
             else:
-                print("Couldn't find FEN position from the website")
+                logger.warning("Couldn't find FEN position from the website")
                 
-                # Fallback to using the move list
+                # Fallback to using the move list, sent to the engine as a single position command
                 moves = self.grabber.get_move_list()
                 if moves:
-                    print(f"Using move list to reset position: {moves}")
-                    # Reset Stockfish to starting position
-                    self.stockfish.reset_board()
-                    # Apply each move
-                    for move in moves:
-                        try:
-                            # Check if move is in the right format for Stockfish
-                            if re.match(r'^[a-h][1-8][a-h][1-8][qrbnQRBN]?$', move):
-                                self.stockfish.make_moves_from_current_position([move])
-                            else:
-                                # Try to convert algebraic notation (e.g. "e4") to UCI format
-                                # This is a simplified conversion - only works for basic moves
-                                print(f"Converting algebraic move: {move}")
-                                # Get current position as a chess.Board
-                                board = chess.Board(self.stockfish.get_fen_position())
-                                
-                                # Try to parse the move
-                                try:
-                                    uci_move = None
-                                    # Try parsing as SAN
-                                    try:
-                                        chess_move = board.parse_san(move)
-                                        uci_move = chess_move.uci()
-                                    except ValueError:
-                                        # If not SAN, try as UCI
-                                        try:
-                                            chess_move = board.parse_uci(move)
-                                            uci_move = move
-                                        except ValueError:
-                                            print(f"Could not parse move: {move}")
-                                            continue
-                                    
-                                    print(f"Converted to UCI: {uci_move}")
-                                    self.stockfish.make_moves_from_current_position([uci_move])
-                                except Exception as parse_error:
-                                    print(f"Error parsing move {move}: {parse_error}")
-                        except Exception as move_error:
-                            print(f"Error applying move {move}: {move_error}")
-                    return True
+                    logger.debug("Using move list to reset position: %s", moves)
+                    return self.sync_stockfish_position(moves)
                 
                 return False
         except Exception as e:
-            print(f"Error resetting Stockfish position: {e}")
+            logger.warning("Error resetting Stockfish position: %s", e)
             return False
 
     def make_mouseless_move(self, move_str, pre_move=False):
@@ -1022,7 +1462,7 @@ class StockfishBot(multiprocess.Process):
             # For Chess.com
             if self.website == "chesscom":
                 # Try a more direct approach via JavaScript
-                print("Attempting mouseless move on Chess.com...")
+                logger.debug("Attempting mouseless move on Chess.com...")
                 
                 # Parse the move and convert to Chess.com format
                 from_square = move_str[0:2]
@@ -1092,10 +1532,10 @@ class StockfishBot(multiprocess.Process):
                 # Execute the JS directly
                 try:
                     js_result = self.grabber.chrome.execute_script(js_code)
-                    print(f"Chess.com mouseless move result: {js_result}")
+                    logger.debug("Chess.com mouseless move result: %s", js_result)
                     return js_result
                 except Exception as e:
-                    print(f"Error executing Chess.com mouseless move: {e}")
+                    logger.warning("Error executing Chess.com mouseless move: %s", e)
                     return False
             else:  # lichess
                 # First try the regular Lichess socket method
@@ -1105,10 +1545,10 @@ class StockfishBot(multiprocess.Process):
                     if result:
                         return True
                 except Exception as e:
-                    print(f"Error in Lichess socket move: {e}")
+                    logger.warning("Error in Lichess socket move: %s", e)
                 
                 # If socket method fails, try with direct move approach
-                print("Socket move failed, trying direct move via JavaScript")
+                logger.warning("Socket move failed, trying direct move via JavaScript")
                 try:
                     # Parse the move
                     from_square = move_str[0:2]
@@ -1165,14 +1605,14 @@ class StockfishBot(multiprocess.Process):
                     """
                     
                     js_result = self.grabber.chrome.execute_script(js_code)
-                    print(f"Direct Lichess move result: {js_result}")
+                    logger.debug("Direct Lichess move result: %s", js_result)
                     return js_result
                 except Exception as e:
-                    print(f"Error in direct Lichess move: {e}")
+                    logger.warning("Error in direct Lichess move: %s", e)
                 
                 return False
         except Exception as e:
-            print(f"Error in make_mouseless_move: {e}")
+            logger.warning("Error in make_mouseless_move: %s", e)
             return False
 
     def detect_connection_issues(self):
@@ -1180,6 +1620,12 @@ class StockfishBot(multiprocess.Process):
         Detects and handles connection issues with Lichess
         Returns True if connection issues were detected and handled
         """
+        # The API grabber reconnects its game stream by itself, there is no browser to recover.
+        # The position is read again once the stream is back
+        if self.website == "lichess_api":
+            self.grabber.wait_until(ConnectionRestored(), 10)
+            return True
+
         try:
             # Check for common browser error pages first (these happen regardless of website)
             browser_error_check = """
@@ -1217,10 +1663,10 @@ class StockfishBot(multiprocess.Process):
             
             browser_result = self.grabber.chrome.execute_script(browser_error_check)
             if browser_result and browser_result.get('found'):
-                print(f"Browser error detected: {browser_result.get('message')}")
-                print("Attempting to refresh the page...")
+                logger.warning("Browser error detected: %s", browser_result.get('message'))
+                logger.info("Attempting to refresh the page...")
                 self.grabber.chrome.refresh()
-                time.sleep(3)  # Wait for page to reload
+                self.grabber.wait_until(BoardPresent(), 10)
                 self.update_grabber()
                 return True
                 
@@ -1309,22 +1755,22 @@ class StockfishBot(multiprocess.Process):
             result = self.grabber.chrome.execute_script(connection_check)
             
             if result and result.get('found'):
-                print(f"Connection issue detected: {result.get('message')}")
+                logger.info("Connection issue detected: %s", result.get('message'))
                 action = result.get('action')
                 
                 # Handle different types of connection issues
                 if action in ["clicked_reconnect", "clicked_connection_lost_button", "clicked_reload"]:
-                    print("Clicked button to address connection issue, waiting for reconnection...")
-                    time.sleep(3)  # Wait for reconnection
+                    logger.info("Clicked button to address connection issue, waiting for reconnection...")
+                    self.grabber.wait_until(ConnectionRestored(), 10)
                     return True
                 elif action in ["found_connection_lost", "socket_disconnected", "severe_lag"]:
-                    print("Detected connection issue requiring page refresh...")
+                    logger.info("Detected connection issue requiring page refresh...")
                     self.grabber.chrome.refresh()
-                    time.sleep(3)  # Wait for page to reload
+                    self.grabber.wait_until(BoardPresent(), 10)
                     self.update_grabber()
                     return True
                     
             return False
         except Exception as e:
-            print(f"Error in detect_connection_issues: {e}")
+            logger.warning("Error in detect_connection_issues: %s", e)
             return False
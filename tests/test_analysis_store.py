@@ -0,0 +1,121 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from engine.analysis_store import STALE_LOCK_SECONDS, AnalysisStore, decode_move, encode_move, generation_number
+
+
+class AnalysisStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.directory)
+
+    def open_store(self):
+        store = AnalysisStore(self.directory, merge_interval=0)
+        self.stores.append(store)
+        return store
+
+    def generations(self):
+        return sorted(name for name in os.listdir(self.directory) if generation_number(name) is not None)
+
+    def test_moves_are_packed_and_unpacked(self):
+        for uci in ("e2e4", "a7a8q", "h2h1n", "e1g1"):
+            self.assertEqual(decode_move(encode_move(uci)), uci)
+
+    def test_put_and_get(self):
+        store = self.open_store()
+        store.put(1, 14, "e2e4", {"cp": 25, "nodes": 1000})
+        store.put(2, 20, "d1h5", {"mate": 3, "nodes": 50})
+        self.assertEqual(store.get(1, 14), {"depth": 14, "move": "e2e4", "nodes": 1000, "cp": 25})
+        self.assertEqual(store.get(2, 10), {"depth": 20, "move": "d1h5", "nodes": 50, "mate": 3})
+        self.assertIsNone(store.get(1, 16))
+        self.assertIsNone(store.get(3, 1))
+        # A shallower result doesn't replace the deeper one
+        store.put(1, 10, "d2d4", {"cp": 5})
+        self.assertEqual(store.get(1, 1)["move"], "e2e4")
+
+    def test_merge_shares_the_records_and_trims_the_recent_ones(self):
+        store = self.open_store()
+        store.put(1, 14, "e2e4", {"cp": 25})
+        store.put(2, 12, "g1f3", {"cp": 10})
+        self.assertEqual(store.merge(), 2)
+        self.assertEqual(store.recent, {})
+        self.assertEqual(store.get(2, 12)["move"], "g1f3")
+
+        # Another process finds the merged records in the index
+        other = self.open_store()
+        self.assertEqual(other.get(1, 14)["cp"], 25)
+        other.put(1, 18, "d2d4", {"cp": 30})
+        self.assertEqual(other.get(1, 18)["move"], "d2d4")
+        self.assertEqual(other.merge(), 2)
+        store._load_index()
+        self.assertEqual(store.get(1, 18)["move"], "d2d4")
+
+    def test_partial_record_at_the_end_of_the_log_is_left_for_the_next_merge(self):
+        store = self.open_store()
+        store.put(1, 14, "e2e4", {"cp": 25})
+        with open(store.log_path, "ab") as log_file:
+            log_file.write(b"\x01\x02\x03")
+        self.assertEqual(store.merge(), 1)
+
+    def test_merge_removes_only_older_generations(self):
+        store = self.open_store()
+        store.put(1, 14, "e2e4", {"cp": 25})
+        store.merge()
+        first = self.generations()
+        # A generation another process wrote but hasn't published yet
+        newer = f"index-{time.time_ns() + 10 ** 12}.bin"
+        open(os.path.join(self.directory, newer), "wb").close()
+
+        store.put(2, 14, "d2d4", {"cp": 20})
+        store.merge()
+        generations = self.generations()
+        self.assertEqual(len(generations), 2)
+        self.assertNotIn(first[0], generations)
+        self.assertIn(newer, generations)
+        self.assertIn(store.index_name, generations)
+
+    def test_merge_waits_for_a_running_merge(self):
+        store = self.open_store()
+        store.put(1, 14, "e2e4", {"cp": 25})
+        open(store.lock_path, "w").close()
+        self.assertIsNone(store.merge())
+        self.assertTrue(os.path.exists(store.lock_path))
+        self.assertEqual(self.generations(), [])
+
+    def test_stale_lock_is_removed(self):
+        store = self.open_store()
+        store.put(1, 14, "e2e4", {"cp": 25})
+        open(store.lock_path, "w").close()
+        stale = time.time() - STALE_LOCK_SECONDS - 10
+        os.utime(store.lock_path, (stale, stale))
+        # The merge that finds the stale lock only removes it, the next one merges
+        self.assertIsNone(store.merge())
+        self.assertFalse(os.path.exists(store.lock_path))
+        self.assertEqual(store.merge(), 1)
+        self.assertFalse(os.path.exists(store.lock_path))
+
+    def test_compact_empties_the_log(self):
+        store = self.open_store()
+        store.put(1, 14, "e2e4", {"cp": 25})
+        store.put(2, 12, "g1f3", {"cp": 10})
+        self.assertEqual(store.merge(compact=True), 2)
+        self.assertEqual(os.path.getsize(store.log_path), 0)
+        store.put(3, 10, "c2c4", {"cp": 15})
+        self.assertEqual(store.merge(), 3)
+        self.assertEqual(store.get(1, 14)["move"], "e2e4")
+
+
+if __name__ == "__main__":
+    unittest.main()
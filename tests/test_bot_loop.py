@@ -0,0 +1,269 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+import unittest
+
+import chess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bot_loop import AsyncBotLoop
+
+
+class MemoryGrabber:
+    """
+    The parts of a grabber the async loop uses, backed by a chess.Board
+    The opponent answers every move of ours right away with the next move of its script,
+    the game is over once max_plies were played
+    """
+
+    def __init__(self, opponent_moves, max_plies):
+        self.opponent_moves = list(opponent_moves)
+        self.max_plies = max_plies
+        self.rejected_moves = set()  # Moves the "website" doesn't accept
+        self.changed = threading.Condition()
+        self.version = 0
+        self.version_seen = 0
+        self.board = chess.Board()
+        self.san_moves = []
+
+    def _push(self, move):
+        # Call with the condition held
+        self.san_moves.append(self.board.san(move))
+        self.board.push(move)
+        self.version += 1
+        self.changed.notify_all()
+
+    def takeback(self, plies):
+        with self.changed:
+            for _ in range(plies):
+                self.board.pop()
+                self.san_moves.pop()
+            self.version += 1
+            self.changed.notify_all()
+
+    def make_move(self, uci):
+        with self.changed:
+            move = chess.Move.from_uci(uci)
+            if uci in self.rejected_moves or not self.board.is_legal(move):
+                return False
+            self._push(move)
+            if len(self.san_moves) < self.max_plies:
+                self._push(chess.Move.from_uci(self.opponent_moves[len(self.san_moves) // 2]))
+            return True
+
+    def snapshot(self):
+        with self.changed:
+            return {
+                "moves": list(self.san_moves),
+                "white_to_move": self.board.turn == chess.WHITE,
+                "is_white": True,
+                "game_over": len(self.san_moves) >= self.max_plies,
+                "aborted": False,
+                "is_puzzles": False,
+                "connection_issue": False,
+                "clocks": {"white": None, "black": None, "increment": None},
+                "geometry_dirty": False
+            }
+
+    def wait_for_change(self, timeout):
+        with self.changed:
+            changed = self.changed.wait_for(lambda: self.version != self.version_seen, timeout=timeout)
+            self.version_seen = self.version
+        return changed
+
+
+class FakeEngine:
+    """
+    Records the commands the loop sends to the engine
+    A "stop" only ends a search that is running, like on a real engine
+    """
+
+    def __init__(self):
+        self.running = False
+        self.stopped = threading.Event()
+        self.stops = 0
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.stops += 1
+        if self.running:
+            self.running = False
+            self.stopped.set()
+
+    def new_game(self):
+        pass
+
+
+class FakeMetrics:
+
+    def time(self, stage):
+        return contextlib.nullcontext()
+
+    def observe_move(self, started):
+        pass
+
+
+class FakeBot:
+    """
+    The parts of StockfishBot the async loop uses
+    moves maps a move list to the (best move, next best move) of its search. The first
+    search of slow_position blocks, see search_slowly()
+    """
+
+    MAX_REPEATED_MOVES = 3
+    MAX_FAILED_MOVES = 5
+
+    def __init__(self, grabber, moves, slow_position=None, stale_move=None):
+        self.grabber = grabber
+        self.stockfish = FakeEngine()
+        self.metrics = FakeMetrics()
+        self.is_white = True
+        self.moves = moves
+        self.slow_position = slow_position
+        self.stale_move = stale_move
+        self.played_moves = []
+        self.last_lines = []
+        self.recoveries = 0
+
+        # Set once the slow search is about to send "go", it is sent once go is set
+        self.search_started = threading.Event()
+        self.go = threading.Event()
+        self.go.set()
+
+    def get_stockfish_move(self, depth=None, moves=None, clocks=None, draw_lines=True, on_info=None):
+        if moves == self.slow_position and not self.search_started.is_set():
+            return self.search_slowly(on_info)
+        best_move, next_move = self.moves[tuple(moves)]
+        self.last_lines = [{"move": best_move}, {"move": next_move}]
+        return best_move
+
+    def search_slowly(self, on_info):
+        # The search only ends once the loop sends "stop", its move must not be played
+        self.search_started.set()
+        self.go.wait(5)
+        self.stockfish.start()
+        if on_info is not None:
+            on_info({"depth": 1})
+        self.stockfish.stopped.wait(5)
+        return self.stale_move
+
+    def get_alternative_move(self, move):
+        for line in self.last_lines:
+            if line["move"] != move:
+                return line["move"]
+        return None
+
+    def recover_from_failed_moves(self):
+        self.recoveries += 1
+        return True
+
+    def play_move(self, move):
+        self.played_moves.append(move)
+        self.grabber.make_move(move)
+
+    def is_new_game(self, moves):
+        return False
+
+    def send_metrics(self):
+        pass
+
+    def show_lines(self):
+        pass
+
+    def start_pondering(self, move):
+        pass
+
+    def detect_connection_issues(self):
+        return False
+
+
+# 1. e4 e5 2. d4, black answers from the script
+OPPONENT_MOVES = ["e7e5", "d7d5"]
+MOVES = {
+    (): ("e2e4", "d2d4"),
+    ("e4", "e5"): ("d2d4", "g1f3")
+}
+
+
+class AsyncBotLoopTest(unittest.TestCase):
+
+    def start_loop(self, bot):
+        loop = AsyncBotLoop(bot)
+        thread = threading.Thread(target=loop.run, daemon=True)
+        thread.start()
+        return loop, thread
+
+    def test_takeback_during_search_stops_it_and_drops_the_move(self):
+        grabber = MemoryGrabber(OPPONENT_MOVES, max_plies=3)
+        bot = FakeBot(grabber, MOVES, slow_position=["e4", "e5"], stale_move="g1f3")
+        loop, thread = self.start_loop(bot)
+        self.assertTrue(bot.search_started.wait(5))
+        grabber.takeback(2)
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+
+        self.assertTrue(bot.stockfish.stopped.is_set())
+        self.assertNotIn("g1f3", bot.played_moves)
+        self.assertEqual(bot.played_moves, ["e2e4", "e2e4", "d2d4"])
+        self.assertEqual([move.uci() for move in grabber.board.move_stack], ["e2e4", "e7e5", "d2d4"])
+
+    def test_takeback_before_go_still_stops_the_search(self):
+        # The watcher's "stop" reaches the engine before "go", the search must be stopped anyway
+        grabber = MemoryGrabber(OPPONENT_MOVES, max_plies=3)
+        bot = FakeBot(grabber, MOVES, slow_position=["e4", "e5"], stale_move="g1f3")
+        bot.go.clear()
+        loop, thread = self.start_loop(bot)
+        self.assertTrue(bot.search_started.wait(5))
+        grabber.takeback(2)
+        deadline = time.monotonic() + 5
+        while loop.current_moves != [] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(loop.current_moves, [])
+        bot.go.set()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+
+        self.assertTrue(bot.stockfish.stopped.is_set())
+        self.assertEqual(bot.played_moves, ["e2e4", "e2e4", "d2d4"])
+
+    def test_move_that_does_not_land_is_replaced_by_the_next_line(self):
+        # d4 is never accepted, so the loop has to switch to the next best line
+        grabber = MemoryGrabber(OPPONENT_MOVES, max_plies=3)
+        grabber.rejected_moves.add("d2d4")
+        bot = FakeBot(grabber, MOVES)
+        loop = AsyncBotLoop(bot)
+        loop.MOVE_CONFIRM_TIMEOUT = 0.05
+        thread = threading.Thread(target=loop.run, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+
+        self.assertEqual(bot.played_moves, ["e2e4", "d2d4", "d2d4", "d2d4", "g1f3"])
+        self.assertEqual([move.uci() for move in grabber.board.move_stack], ["e2e4", "e7e5", "g1f3"])
+
+    def test_failed_moves_run_the_recovery(self):
+        grabber = MemoryGrabber(OPPONENT_MOVES, max_plies=3)
+        grabber.rejected_moves.update(("d2d4", "g1f3"))
+        bot = FakeBot(grabber, MOVES)
+        loop = AsyncBotLoop(bot)
+        loop.MOVE_CONFIRM_TIMEOUT = 0.05
+        thread = threading.Thread(target=loop.run, daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 10
+        while bot.recoveries == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        grabber.rejected_moves.clear()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+
+        self.assertGreaterEqual(bot.recoveries, 1)
+        self.assertEqual(len(grabber.board.move_stack), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
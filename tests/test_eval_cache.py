@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from engine.eval_cache import EvalCache
+
+
+INFO = {"depth": 12, "cp": 30, "pv": ["e2e4", "e7e5"]}
+
+
+class EvalCacheTest(unittest.TestCase):
+
+    def test_deeper_entry_serves_shallower_lookups(self):
+        cache = EvalCache()
+        cache.put(1, 12, 20, 2, "e2e4", INFO)
+        self.assertEqual(cache.get(1, 10, 20, 2)["move"], "e2e4")
+        self.assertEqual(cache.get(1, 12, 20, 2)["cp"], 30)
+        self.assertIsNone(cache.get(1, 14, 20, 2))
+        self.assertEqual(cache.get_stats(), {"cache_hits": 2, "cache_misses": 1, "cache_evictions": 0})
+
+    def test_skill_level_and_multipv_are_part_of_the_key(self):
+        cache = EvalCache()
+        cache.put(1, 12, 20, 2, "e2e4", INFO)
+        self.assertIsNone(cache.get(1, 12, 10, 2))
+        self.assertIsNone(cache.get(1, 12, 20, 1))
+        self.assertIsNone(cache.get(2, 12, 20, 2))
+
+    def test_shallower_result_never_replaces_a_deeper_one(self):
+        cache = EvalCache()
+        cache.put(1, 12, 20, 2, "e2e4", INFO)
+        cache.put(1, 8, 20, 2, "d2d4", {"depth": 8, "cp": 10, "pv": ["d2d4"]})
+        entry = cache.get(1, 1, 20, 2)
+        self.assertEqual((entry["depth"], entry["move"]), (12, "e2e4"))
+        # An equal or deeper search replaces it
+        cache.put(1, 16, 20, 2, "g1f3", {"depth": 16, "mate": 5, "pv": ["g1f3"]})
+        entry = cache.get(1, 16, 20, 2)
+        self.assertEqual((entry["move"], entry["mate"]), ("g1f3", 5))
+        self.assertNotIn("cp", entry)
+
+    def test_lines_at_any_depth(self):
+        cache = EvalCache()
+        lines = [{"move": "e2e4", "pv": ["e2e4"], "depth": 12, "cp": 30},
+                 {"move": "d2d4", "pv": ["d2d4"], "depth": 12, "cp": 20}]
+        cache.put(1, 12, 20, 2, "e2e4", INFO, lines)
+        self.assertEqual(cache.get_lines(1, 20, 2), lines)
+        self.assertEqual(cache.get_lines(2, 20, 2), [])
+        self.assertEqual(cache.get_stats()["cache_hits"], 0)
+        self.assertEqual(cache.get_stats()["cache_misses"], 0)
+
+    def test_memory_cap_evicts_the_least_recently_used(self):
+        cache = EvalCache(max_memory_mb=3 * EvalCache.ENTRY_SIZE / (1024 * 1024))
+        self.assertEqual(cache.max_entries, 3)
+        for key in (1, 2, 3):
+            cache.put(key, 12, 20, 2, "e2e4", INFO)
+        # A hit makes 1 the most recently used, so 2 is evicted first
+        cache.get(1, 12, 20, 2)
+        cache.put(4, 12, 20, 2, "e2e4", INFO)
+        self.assertIsNone(cache.get(2, 12, 20, 2))
+        self.assertEqual(sorted(key for key, _, _ in cache.entries), [1, 3, 4])
+        self.assertEqual(cache.get_stats()["cache_evictions"], 1)
+
+    def test_tiny_cap_keeps_one_entry(self):
+        cache = EvalCache(max_memory_mb=0)
+        cache.put(1, 12, 20, 2, "e2e4", INFO)
+        cache.put(2, 12, 20, 2, "d2d4", INFO)
+        self.assertEqual(len(cache.entries), 1)
+        self.assertIsNotNone(cache.get(2, 12, 20, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import unittest
+
+import chess
+import chess.polyglot
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from game_state import GameState
+
+
+def replay(moves, fen=None):
+    board = chess.Board(fen) if fen else chess.Board()
+    for move in moves:
+        board.push_san(move)
+    return board
+
+
+class GameStateTest(unittest.TestCase):
+
+    def assertMatchesBoard(self, state, board):
+        self.assertEqual(state.board.fen(), board.fen())
+        self.assertEqual(state.get_zobrist_key(), chess.polyglot.zobrist_hash(board))
+        self.assertEqual(state.uci_moves, [move.uci() for move in board.move_stack])
+
+    def test_new_moves_are_pushed(self):
+        state = GameState()
+        self.assertEqual(state.update(["e4", "c5"]), (0, 2))
+        self.assertEqual(state.update(["e4", "c5", "Nf3"]), (0, 1))
+        self.assertEqual(state.update(["e4", "c5", "Nf3"]), (0, 0))
+        self.assertEqual(state.get_ply(), 3)
+        self.assertMatchesBoard(state, replay(["e4", "c5", "Nf3"]))
+
+    def test_uci_moves_are_accepted(self):
+        state = GameState()
+        self.assertEqual(state.update(["e2e4", "e7e5", "g1f3"]), (0, 3))
+        self.assertMatchesBoard(state, replay(["e4", "e5", "Nf3"]))
+
+    def test_takeback_pops_only_the_changed_plies(self):
+        state = GameState()
+        state.update(["e4", "e5", "Nf3", "Nc6"])
+        keys = list(state.zobrist_keys)
+        self.assertEqual(state.update(["e4", "e5"]), (2, 0))
+        self.assertEqual(state.zobrist_keys, keys[:3])
+        # A takeback followed by other moves in the same read
+        self.assertEqual(state.update(["e4", "e5", "Bc4", "Nf6"]), (0, 2))
+        self.assertEqual(state.update(["e4", "c5", "Nf3"]), (3, 2))
+        self.assertMatchesBoard(state, replay(["e4", "c5", "Nf3"]))
+
+    def test_new_game_starts_over(self):
+        state = GameState()
+        state.update(["e4", "e5", "Nf3"])
+        self.assertEqual(state.update([]), (3, 0))
+        self.assertEqual(state.update(["d4"]), (0, 1))
+        self.assertMatchesBoard(state, replay(["d4"]))
+
+    def test_unparsable_move_keeps_the_parsed_plies(self):
+        state = GameState()
+        self.assertIsNone(state.update(["e4", "e5", "Ke3"]))
+        self.assertEqual(state.website_moves, ["e4", "e5"])
+        self.assertMatchesBoard(state, replay(["e4", "e5"]))
+        # The next read continues from there
+        self.assertEqual(state.update(["e4", "e5", "Nf3"]), (0, 1))
+
+    def test_fen_root_continues_the_website_moves(self):
+        root_moves = ["e4", "e5"]
+        fen = replay(root_moves).fen()
+        state = GameState()
+        state.reset(fen, root_moves)
+        self.assertEqual(state.get_ply(), 2)
+        self.assertEqual(state.update(["e4", "e5", "Nf3", "Nc6"]), (0, 2))
+        self.assertEqual(state.uci_moves, ["g1f3", "b8c6"])
+        self.assertEqual(state.board.fen(), replay(["e4", "e5", "Nf3", "Nc6"]).fen())
+        # A takeback that stays after the root keeps it
+        self.assertEqual(state.update(["e4", "e5", "Nf3"]), (1, 0))
+        self.assertEqual(state.starting_fen, fen)
+
+    def test_takeback_past_the_fen_root_replays_from_the_start(self):
+        root_moves = ["e4", "e5"]
+        state = GameState()
+        state.reset(replay(root_moves).fen(), root_moves)
+        state.update(["e4", "e5", "Nf3"])
+        self.assertEqual(state.update(["e4"]), (3, 1))
+        self.assertIsNone(state.starting_fen)
+        self.assertMatchesBoard(state, replay(["e4"]))
+
+    def test_invalid_fen_leaves_the_state_as_it_was(self):
+        state = GameState()
+        state.update(["e4"])
+        with self.assertRaises(ValueError):
+            state.reset("not a fen")
+        self.assertMatchesBoard(state, replay(["e4"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from engine.time_manager import TimeManager
+
+
+CLOCKS = {"white": 60, "black": 50.5, "increment": 2}
+
+
+class TimeManagerTest(unittest.TestCase):
+
+    def test_no_clock_gives_no_limits(self):
+        for clocks in (None, {}, {"white": None, "black": None, "increment": None}, {"white": 60, "black": None}):
+            self.assertIsNone(TimeManager().get_limits(clocks, True, 0))
+            self.assertIsNone(TimeManager(engine_uses_clock=False).get_limits(clocks, True, 0))
+            self.assertIsNone(TimeManager().get_movetime(clocks, True, 0))
+
+    def test_clocks_are_passed_to_the_engine_in_ms(self):
+        self.assertEqual(TimeManager().get_limits(CLOCKS, True, 0),
+                         {"wtime": 60000, "btime": 50500, "winc": 2000, "binc": 2000})
+        self.assertEqual(TimeManager().get_limits({"white": 1.5, "black": 3, "increment": None}, False, 7),
+                         {"wtime": 1500, "btime": 3000, "winc": 0, "binc": 0})
+
+    def test_movetime_without_clock_support(self):
+        time_manager = TimeManager(engine_uses_clock=False)
+        # (60000 - 300) / 40 moves to go + 0.75 of the increment
+        self.assertEqual(time_manager.get_limits(CLOCKS, True, 0), {"movetime": 2992})
+        # Black's clock, still 40 moves to go on ply 1
+        self.assertEqual(time_manager.get_limits(CLOCKS, False, 1), {"movetime": 2755})
+
+    def test_fewer_moves_to_go_later_in_the_game(self):
+        time_manager = TimeManager()
+        self.assertEqual(time_manager.get_movetime(CLOCKS, True, 40), 4485)
+        # Never fewer than 10 moves to go
+        self.assertEqual(time_manager.get_movetime(CLOCKS, True, 80), 7470)
+        self.assertEqual(time_manager.get_movetime(CLOCKS, True, 200), 7470)
+
+    def test_slow_mover_scales_the_movetime(self):
+        self.assertEqual(TimeManager(slow_mover=50).get_movetime(CLOCKS, True, 0), 1496)
+        self.assertEqual(TimeManager(slow_mover=200).get_movetime(CLOCKS, True, 0), 5985)
+
+    def test_movetime_is_capped_and_has_a_minimum(self):
+        # A big increment never buys more than a quarter of the time left
+        self.assertEqual(TimeManager().get_movetime({"white": 2, "black": 2, "increment": 10}, True, 0), 425)
+        # Less time left than the move overhead
+        self.assertEqual(TimeManager().get_movetime({"white": 0.2, "black": 60, "increment": 0}, True, 0),
+                         TimeManager.MIN_MOVETIME)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from engine.uci_engine import UciEngine, parse_info, score_value
+
+
+# A scripted engine: it logs every command it gets and answers "go" with SEARCH_OUTPUT
+ENGINE_SCRIPT = """#!{python}
+import sys
+
+SEARCH_OUTPUT = {search_output!r}
+
+with open({log_path!r}, "a") as log:
+    for command in sys.stdin:
+        command = command.strip()
+        log.write(command + "\\n")
+        log.flush()
+        if command == "uci":
+            print("id name Scripted")
+            print("option name Hash type spin default 16 min 1 max 1024")
+            print("option name MultiPV type spin default 1 min 1 max 500")
+            print("uciok")
+        elif command == "isready":
+            print("readyok")
+        elif command.startswith("go"):
+            print(SEARCH_OUTPUT)
+        elif command == "quit":
+            break
+        sys.stdout.flush()
+"""
+
+SEARCH_OUTPUT = "\n".join((
+    "info string NNUE evaluation enabled",
+    "info depth 1 seldepth 1 multipv 1 score cp 20 nodes 20 nps 20000 time 1 pv e2e4",
+    "info depth 1 seldepth 1 multipv 2 score cp 10 nodes 20 nps 20000 time 1 pv d2d4",
+    "info depth 2 currmove e2e4 currmovenumber 1",
+    "info depth 2 seldepth 3 multipv 1 score cp 40 lowerbound nodes 80 time 2 pv e2e4",
+    "info depth 2 seldepth 3 multipv 1 score cp 35 nodes 90 nps 45000 hashfull 3 time 2 pv e2e4 e7e5",
+    "info depth 2 seldepth 3 multipv 2 score cp 15 nodes 90 nps 45000 hashfull 3 time 2 pv d2d4 d7d5",
+    "bestmove e2e4 ponder e7e5"
+))
+
+
+class ParseInfoTest(unittest.TestCase):
+
+    def test_fields_score_and_pv(self):
+        info = parse_info("info depth 12 seldepth 18 multipv 2 score cp -34 nodes 1000 nps 500000 "
+                          "hashfull 12 tbhits 0 time 2 pv e2e4 e7e5 g1f3")
+        self.assertEqual(info, {"depth": 12, "seldepth": 18, "multipv": 2, "cp": -34, "nodes": 1000, "nps": 500000,
+                                "hashfull": 12, "tbhits": 0, "time": 2, "pv": ["e2e4", "e7e5", "g1f3"]})
+
+    def test_mate_and_bound(self):
+        info = parse_info("info depth 20 score mate -3 upperbound nodes 5 pv e1e2")
+        self.assertEqual(info["mate"], -3)
+        self.assertEqual(info["bound"], "upperbound")
+        self.assertNotIn("cp", info)
+        self.assertEqual(info["nodes"], 5)
+
+    def test_currmove_string_and_unknown_tokens(self):
+        self.assertEqual(parse_info("info depth 5 currmove g1f3 currmovenumber 3"),
+                         {"depth": 5, "currmove": "g1f3", "currmovenumber": 3})
+        self.assertEqual(parse_info("info string NNUE evaluation using nn.nnue enabled"),
+                         {"string": "NNUE evaluation using nn.nnue enabled"})
+        self.assertEqual(parse_info("info depth 3 wdl 500 400 100 score cp 5"), {"depth": 3, "cp": 5})
+
+    def test_score_value(self):
+        self.assertEqual(score_value({"cp": -50}), -50)
+        self.assertEqual(score_value({"mate": 3}), 99997)
+        self.assertEqual(score_value({"mate": -2}), -99998)
+        self.assertEqual(score_value({}), 0)
+
+
+class UciEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.directory, "commands.log")
+        path = os.path.join(self.directory, "engine.py")
+        with open(path, "w") as f:
+            f.write(ENGINE_SCRIPT.format(python=sys.executable, search_output=SEARCH_OUTPUT, log_path=self.log_path))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        self.engine = UciEngine(path, {"Hash": 32, "Threads": 2})
+
+    def tearDown(self):
+        self.engine.quit()
+        shutil.rmtree(self.directory)
+
+    def read_commands(self):
+        self.engine.is_ready()
+        with open(self.log_path) as f:
+            return [line.strip() for line in f]
+
+    def test_handshake_and_options(self):
+        self.assertEqual(self.engine.name, "Scripted")
+        self.assertTrue(self.engine.has_option("multipv"))
+        # Threads is unknown to the engine and an unchanged value is not sent again
+        self.assertFalse(self.engine.set_option("Hash", 32))
+        self.assertTrue(self.engine.set_option("Hash", 64))
+        commands = self.read_commands()
+        self.assertEqual([command for command in commands if command.startswith("setoption")],
+                         ["setoption name Hash value 32", "setoption name Hash value 64"])
+
+    def test_go_sends_the_position_and_the_limits(self):
+        self.engine.set_position(["e2e4", "e7e5"], fen=None)
+        self.engine.go(depth=2, wtime=60000, btime=50000, winc=1000, binc=1000, multipv=2)
+        commands = self.read_commands()
+        self.assertIn("setoption name MultiPV value 2", commands)
+        self.assertIn("position startpos moves e2e4 e7e5", commands)
+        self.assertIn("go depth 2 wtime 60000 btime 50000 winc 1000 binc 1000", commands)
+
+    def test_go_returns_the_ranked_lines(self):
+        infos = []
+        result = self.engine.go(depth=2, on_info=infos.append)
+
+        self.assertEqual(result["move"], "e2e4")
+        self.assertEqual(result["ponder"], "e7e5")
+        self.assertEqual(result["stop_reason"], "depth")
+        # The info of the last exact main line, not the bound or the second rank
+        self.assertEqual(result["info"]["cp"], 35)
+        self.assertEqual(result["info"]["pv"], ["e2e4", "e7e5"])
+        self.assertEqual(result["lines"], [
+            {"move": "e2e4", "pv": ["e2e4", "e7e5"], "depth": 2, "cp": 35},
+            {"move": "d2d4", "pv": ["d2d4", "d7d5"], "depth": 2, "cp": 15}
+        ])
+        # "info string" and currmove lines carry no result and are not passed on
+        self.assertEqual(len(infos), 5)
+        self.assertEqual(self.engine.get_game_stats()["searches"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()